@@ -0,0 +1,117 @@
+# coding: utf8
+from __future__ import print_function
+
+import logging
+import socket
+import time
+from argparse import ArgumentParser
+
+from net_protocol.datagram_io import DATAGRAM_IO_BACKENDS, MmsgDatagramIO
+
+try:
+    from typing import Tuple
+except ImportError:
+    pass
+
+
+class LegacyIO(object):
+    """ прежняя схема NetClient: recvfrom с таймаутом и sendto на каждый пакет """
+
+    def __init__(self, sock, buffer_size, batch_size):
+        # type: (socket.socket, int, int) -> None
+        self.socket = sock
+        self.socket.settimeout(0.05)
+        self.buffer_size = buffer_size
+
+    def recv_batch(self, timeout):
+        try:
+            return [self.socket.recvfrom(self.buffer_size)]
+        except socket.timeout:
+            return []
+
+    def send_batch(self, datagrams):
+        for data, addr in datagrams:
+            self.socket.sendto(data, addr)
+        return len(datagrams)
+
+
+def create_socket(rcvbuf):
+    # type: (int) -> socket.socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    return sock
+
+
+def bench(io_class, count, size, rcvbuf, batch_size, round_size):
+    # type: (type, int, int, int, int, int) -> Tuple[float, float, int]
+    """ отправка и прием замеряются раздельно порциями по round_size пакетов,
+        чтобы порция помещалась в буфер сокета получателя """
+    receiver = create_socket(rcvbuf)
+    sender = create_socket(rcvbuf)
+    receiver_io = io_class(receiver, 65535, batch_size)
+    sender_io = io_class(sender, 65535, batch_size)
+    batch = [(b"x" * size, receiver.getsockname())] * batch_size
+
+    send_sec = recv_sec = 0.0
+    received = 0
+    for _ in range(count // round_size):
+        start_tm = time.time()
+        for _ in range(round_size // batch_size):
+            sender_io.send_batch(batch)
+        send_sec += time.time() - start_tm
+
+        round_received = 0
+        start_tm = time.time()
+        while round_received < round_size:
+            datagrams = receiver_io.recv_batch(0.05)
+            if not datagrams:
+                # часть пакетов потеряна
+                break
+            round_received += len(datagrams)
+        recv_sec += time.time() - start_tm
+        received += round_received
+    receiver.close()
+    sender.close()
+    return send_sec, recv_sec, received
+
+
+def main(count, size, rcvbuf, batch_size, round_size):
+    # type: (int, int, int, int, int) -> None
+    round_size -= round_size % batch_size
+    count -= count % round_size
+    print(
+        "пакетов: {}, размер: {} байт, пачка: {}, SO_RCVBUF: {}".format(
+            count, size, batch_size, rcvbuf
+        )
+    )
+    print("{:<8} {:>14} {:>14} {:>10}".format("способ", "отправка п/с", "прием п/с", "принято"))
+    backends = [("legacy", LegacyIO)]
+    for name in sorted(DATAGRAM_IO_BACKENDS):
+        if name == "mmsg" and not MmsgDatagramIO.is_available():
+            continue
+        backends.append((name, DATAGRAM_IO_BACKENDS[name]))
+    for name, io_class in backends:
+        send_sec, recv_sec, received = bench(
+            io_class, count, size, rcvbuf, batch_size, round_size
+        )
+        print(
+            "{:<8} {:>14.0f} {:>14.0f} {:>10}".format(
+                name, count / send_sec, received / recv_sec, received
+            )
+        )
+
+
+if __name__ == "__main__":
+    # замер пропускной способности пакетного ввода-вывода датаграмм
+    logging.basicConfig(format="%(asctime)s | %(name)s | %(levelname)s | %(message)s")
+
+    parser = ArgumentParser()
+    parser.add_argument("--count", "-c", type=int, default=200000)
+    parser.add_argument("--size", "-s", type=int, default=100)
+    parser.add_argument("--rcvbuf", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--batch", "-b", type=int, default=32)
+    parser.add_argument("--round", "-r", type=int, default=2048)
+    args, unknown = parser.parse_known_args()
+    main(args.count, args.size, args.rcvbuf, args.batch, args.round)
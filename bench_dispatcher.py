@@ -0,0 +1,116 @@
+# coding: utf8
+from __future__ import print_function
+
+import logging
+import time
+from argparse import ArgumentParser
+
+from dispatcher import Dispatcher
+from dispatcher.placement import PLACEMENT_POLICIES
+from entities import CalculatorStatus
+from net_protocol import TransmissionStatus
+from tests.fakes import FakeNetClient
+
+try:
+    from typing import Any, Callable, Dict, List, Tuple
+except ImportError:
+    pass
+
+
+def bench(policy, calculators, capacity, tasks, batch_size):
+    # type: (str, int, int, int, int) -> Tuple[float, int]
+    """ клиент отправляет задачи пачками add_tasks, вычислители подтверждают
+        perform_task(s) и сразу отвечают completed_tasks. Возвращает время и число сообщений """
+    dispatcher = Dispatcher(
+        FakeNetClient,
+        ("127.0.0.1", 0),
+        placement_policy=policy,
+        max_batch_size=batch_size,
+    )
+    net_client = dispatcher.net_client  # type: FakeNetClient
+    handle = net_client.handler
+    client_addr = ("127.0.0.2", 40000)
+    calc_addrs = [("127.0.0.3", 41000 + index) for index in range(calculators)]
+    for calc_addr in calc_addrs:
+        handle(
+            calc_addr,
+            {
+                "method": "heartbeat",
+                "params": {
+                    "status": CalculatorStatus.ready,
+                    "capacity": capacity,
+                    "free_slots": capacity,
+                    "max_batch": batch_size,
+                },
+            },
+        )
+
+    messages = 0
+    task_id = 0
+    start_tm = time.time()
+    while task_id < tasks:
+        count = min(batch_size, tasks - task_id)
+        batch = [{"task_id": task_id + index} for index in range(count)]
+        task_id += count
+        handle(client_addr, {"method": "add_tasks", "params": {"tasks": batch}})
+        messages += 1
+
+        completed = {}  # type: Dict[Tuple[str, int], List[dict]]
+        while net_client.commands:
+            address, data, callback = net_client.commands.popleft()
+            callback(address, 0, TransmissionStatus.success)
+            messages += 1
+            if data["method"] == "perform_task":
+                completed.setdefault(address, []).append(data["params"])
+            elif data["method"] == "perform_tasks":
+                completed.setdefault(address, []).extend(data["params"]["tasks"])
+            if not net_client.commands and completed:
+                for calc_addr, params in completed.iteritems():
+                    params = [{"task_uuid": item["task_uuid"]} for item in params]
+                    handle(
+                        calc_addr,
+                        {"method": "completed_tasks", "params": {"tasks": params}},
+                    )
+                    messages += 1
+                completed = {}
+    return time.time() - start_tm, messages
+
+
+def main(tasks, calculators, capacity, batch_size, repeat):
+    # type: (int, int, int, int, int) -> None
+    print(
+        "задач: {}, вычислителей: {}, слотов: {}, пачка: {}, лучший из {} замеров".format(
+            tasks, calculators, capacity, batch_size, repeat
+        )
+    )
+    print("{:<12} {:>14} {:>14}".format("политика", "сообщений/с", "задач/с"))
+    for policy in sorted(PLACEMENT_POLICIES):
+        elapsed, messages = min(
+            bench(policy, calculators, capacity, tasks, batch_size)
+            for _ in range(repeat)
+        )
+        print(
+            "{:<12} {:>14.0f} {:>14.0f}".format(
+                policy, messages / elapsed, tasks / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    # замер пропускной способности обработчиков диспетчера без сетевого ввода-вывода
+    # basicConfig не подходит: пакет tests добавляет корневому логгеру NullHandler
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s | %(name)s | %(levelname)s | %(message)s")
+    )
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser = ArgumentParser()
+    parser.add_argument("--tasks", "-t", type=int, default=200000)
+    parser.add_argument("--calculators", "-n", type=int, default=64)
+    parser.add_argument("--capacity", "-c", type=int, default=4)
+    parser.add_argument("--batch", "-b", type=int, default=16)
+    parser.add_argument("--repeat", "-r", type=int, default=3)
+    args, unknown = parser.parse_known_args()
+    main(args.tasks, args.calculators, args.capacity, args.batch, args.repeat)
@@ -0,0 +1,270 @@
+# coding: utf8
+from __future__ import print_function
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from functools import partial
+
+try:
+    from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+    from multiprocessing.pool import AsyncResult
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# интервал проверки заданий без результата в секундах
+WATCH_INTERVAL = 1.0
+
+
+class ITaskBackend(object):
+    """ исполнитель заданий вычислителя.
+        callback(task_id, result, error) вызывается из потока исполнителя """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def start(self, inherited_fds=()):
+        # type: (Sequence[int]) -> None
+        """ inherited_fds - дескрипторы родителя, которые не нужны процессам исполнителя """
+        pass
+
+    @abstractmethod
+    def submit(self, task_id, func, args, callback):
+        # type: (Hashable, Callable, tuple, Callable) -> None
+        pass
+
+    @abstractmethod
+    def shutdown(self, immediate=False):
+        # type: (bool) -> None
+        """ остановка исполнителя.
+            Если immediate = True, то задания прерываются, callback не вызываются """
+        pass
+
+
+class ThreadBackend(ITaskBackend):
+    """ пул потоков фиксированного размера """
+
+    def __init__(self, workers):
+        # type: (int) -> None
+        self.workers = workers
+        self.queue = deque()  # type: deque
+        self.condition = threading.Condition(threading.Lock())
+        self.threads = []  # type: list
+        self.is_alive = True
+        self.cancelled = False
+
+    def start(self, inherited_fds=()):
+        # type: (Sequence[int]) -> None
+        # потоки разделяют дескрипторы процесса, закрывать нечего
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.__run, name="task-{}".format(index))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, task_id, func, args, callback):
+        # type: (Hashable, Callable, tuple, Callable) -> None
+        with self.condition:
+            if not self.is_alive:
+                raise RuntimeError("Исполнитель остановлен")
+            self.queue.append((task_id, func, args, callback))
+            self.condition.notify()
+
+    def shutdown(self, immediate=False):
+        # type: (bool) -> None
+        with self.condition:
+            self.is_alive = False
+            if immediate:
+                self.cancelled = True
+                self.queue.clear()
+            self.condition.notify_all()
+
+    def __next_item(self):
+        # type: () -> Optional[Tuple[Hashable, Callable, tuple, Callable]]
+        with self.condition:
+            while self.is_alive and not self.queue:
+                self.condition.wait()
+            if not self.queue:
+                return None
+            return self.queue.popleft()
+
+    def __run(self):
+        # type: () -> None
+        while True:
+            item = self.__next_item()
+            if item is None:
+                return
+            task_id, func, args, callback = item
+            result = error = None  # type: Any
+            # noinspection PyBroadException
+            try:
+                result = func(*args)
+            except Exception as e:
+                logger.exception("Ошибка при выполнении задания %s", task_id)
+                error = str(e)
+            with self.condition:
+                if self.cancelled:
+                    continue
+            # noinspection PyBroadException
+            try:
+                callback(task_id, result, error)
+            except:
+                logger.exception("Ошибка при вызове callback задания %s", task_id)
+
+
+def _close_inherited_fds(fds):
+    # type: (Sequence[int]) -> None
+    """ выполняется в процессе пула при запуске. Процесс создается fork и наследует сокет
+        сетевого клиента: пока процесс жив, порт вычислителя остается занятым """
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def _call(func, args):
+    # type: (Callable, tuple) -> Tuple[Any, Optional[str]]
+    """ выполняется в дочернем процессе. Ошибка возвращается строкой,
+        потому что не всякое исключение можно передать между процессами """
+    try:
+        return func(*args), None
+    except Exception as e:
+        logger.exception("Ошибка при выполнении задания")
+        return None, str(e)
+
+
+class ProcessBackend(ITaskBackend):
+    """ пул заранее запущенных процессов для заданий, нагружающих процессор.
+        func и args должны сериализоваться pickle: func - функция уровня модуля.
+        Процесс перезапускается после max_tasks_per_child заданий.
+        Если процесс пула завершился аварийно или результат не сериализуется, пул не вызывает
+        callback. Такие задания завершаются ошибкой, как и не выполненные за task_timeout """
+
+    def __init__(self, workers, max_tasks_per_child=None, task_timeout=600.0):
+        # type: (int, Optional[int], float) -> None
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        # время от постановки задания до результата, включая ожидание свободного процесса
+        self.task_timeout = task_timeout
+        self.pool = None  # type: Optional[multiprocessing.pool.Pool]
+        # задания без результата: task_id -> (результат пула, срок, callback)
+        self.pending = {}  # type: Dict[Hashable, Tuple[AsyncResult, float, Callable]]
+        self.condition = threading.Condition(threading.Lock())
+        self.watcher = None  # type: Optional[threading.Thread]
+        self.is_alive = True
+        self.cancelled = False
+
+    def start(self, inherited_fds=()):
+        # type: (Sequence[int]) -> None
+        # процессы, перезапущенные после max_tasks_per_child, тоже закрывают дескрипторы
+        self.pool = multiprocessing.Pool(
+            self.workers,
+            initializer=_close_inherited_fds,
+            initargs=(list(inherited_fds),),
+            maxtasksperchild=self.max_tasks_per_child,
+        )
+        self.watcher = threading.Thread(target=self.__watch, name="task-watcher")
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def submit(self, task_id, func, args, callback):
+        # type: (Hashable, Callable, tuple, Callable) -> None
+        with self.condition:
+            if not self.is_alive:
+                raise RuntimeError("Исполнитель остановлен")
+            async_result = self.pool.apply_async(
+                _call, (func, args), callback=partial(self.__on_result, task_id)
+            )
+            self.pending[task_id] = (
+                async_result,
+                time.time() + self.task_timeout,
+                callback,
+            )
+
+    def shutdown(self, immediate=False):
+        # type: (bool) -> None
+        with self.condition:
+            self.is_alive = False
+            self.cancelled = immediate
+            if immediate:
+                self.pending.clear()
+            self.condition.notify_all()
+        if self.pool is None:
+            return
+        # вне блокировки: terminate ждет служебный поток пула, который вызывает __on_result
+        if immediate:
+            # процессы завершаются вместе с выполняемыми заданиями
+            self.pool.terminate()
+        else:
+            self.pool.close()
+
+    def __on_result(self, task_id, outcome):
+        # type: (Hashable, Tuple[Any, Optional[str]]) -> None
+        """ вызывается в служебном потоке пула """
+        with self.condition:
+            item = self.pending.pop(task_id, None)
+        if item is None:
+            # задание снято по сроку или исполнитель остановлен немедленно
+            return
+        result, error = outcome
+        self.__report(task_id, item[2], result, error)
+
+    def __watch(self):
+        # type: () -> None
+        """ завершить ошибкой задания, результата которых пул уже не передаст """
+        while True:
+            with self.condition:
+                if self.cancelled or not (self.is_alive or self.pending):
+                    return
+                self.condition.wait(min(WATCH_INTERVAL, self.task_timeout))
+                current_tm = time.time()
+                lost = []  # type: List[Tuple[Hashable, AsyncResult, Callable]]
+                for task_id, (async_result, deadline, callback) in self.pending.items():
+                    # готовый результат без вызова callback - ошибка передачи результата
+                    if async_result.ready() or deadline <= current_tm:
+                        del self.pending[task_id]
+                        lost.append((task_id, async_result, callback))
+            for task_id, async_result, callback in lost:
+                error = "Результат не получен за {} сек".format(self.task_timeout)
+                if async_result.ready():
+                    try:
+                        async_result.get(0)
+                    except Exception as e:
+                        error = str(e)
+                logger.error("Задание %s не выполнено: %s", task_id, error)
+                self.__report(task_id, callback, None, error)
+
+    def __report(self, task_id, callback, result, error):
+        # type: (Hashable, Callable, Any, Optional[str]) -> None
+        # noinspection PyBroadException
+        try:
+            callback(task_id, result, error)
+        except:
+            logger.exception("Ошибка при вызове callback задания %s", task_id)
+
+
+TASK_BACKENDS = {"thread": ThreadBackend, "process": ProcessBackend}
+
+
+def create_backend(name, workers, **kwargs):
+    # type: (str, int, **Any) -> ITaskBackend
+    if name == "thread":
+        return ThreadBackend(workers)
+    if name == "process":
+        return ProcessBackend(
+            workers,
+            kwargs.get("max_tasks_per_child"),
+            kwargs.get("task_timeout", 600.0),
+        )
+    raise ValueError(
+        "Неизвестный исполнитель {}, допустимые: {}".format(
+            name, ", ".join(sorted(TASK_BACKENDS))
+        )
+    )
@@ -2,51 +2,80 @@
 from __future__ import print_function
 
 import logging
+import multiprocessing
 import random
-import socket
-from collections import namedtuple
-from threading import Event
+from threading import Lock
 
 from entities import CalculatorStatus
-from net_protocol import INetClient, ResponseConfirmation, TransmissionStatus
-from utils import call_repeatedly
-
+from net_protocol import (
+    INetClient,
+    ResponseConfirmation,
+    TransmissionStatus,
+    resolve_address,
+)
+
+from .backends import create_backend
 from .calculator_interface import ICalculator
-from .calculator_task import CalculatorTask
+from .calculator_task import do_job
 
 try:
-    from typing import Optional, Tuple, Any
+    from typing import Optional, Tuple, Any, Dict, List
+    from net_protocol.event_loop import TimerHandle
 except ImportError:
     pass
 
 logger = logging.getLogger(__name__)
 
-TaskContainer = namedtuple("TaskContainer", ["runner", "params"])
+FIELD_TASK_ID = "task_uuid"
 
 
 class Calculator(ICalculator):
     def __init__(self, net_client_class, dispatcher_address, **kwargs):
         # type: (INetClient, Tuple[str, int], **Any) -> None
-        self.dispatcher_address = (
-            socket.gethostbyname(dispatcher_address[0]),
-            dispatcher_address[1],
-        )
+        self.dispatcher_address = resolve_address(dispatcher_address)
         self.listen_port = kwargs.get("listen_port", 0)  # type: int
-        self.net_client = net_client_class(("", self.listen_port))
+        self.net_client = net_client_class(
+            ("", self.listen_port), **kwargs.get("net_client", {})
+        )
         self.net_client.add_handler_request(self.handle_message_dispatcher)
 
-        self.status = CalculatorStatus.ready
         self.task_duration = kwargs["task_duration"]  # type: Tuple[float, float]
-        self.__task = None  # type: Optional[TaskContainer]
+        # количество одновременно выполняемых заданий, по умолчанию по числу процессоров
+        self.capacity = kwargs.get("capacity") or multiprocessing.cpu_count()  # type: int
+        # исполнитель заданий: thread или process
+        self.backend = create_backend(
+            kwargs.get("backend", "thread"),
+            self.capacity,
+            max_tasks_per_child=kwargs.get("max_tasks_per_child", 1000),
+            task_timeout=kwargs.get("task_timeout", 600.0),
+        )
+        # выполняемые задания: task_uuid -> параметры
+        self.tasks = {}  # type: Dict[str, dict]
+        self.lock = Lock()
+        # максимальное количество задач в командах perform_tasks и completed_tasks
+        self.max_batch_size = kwargs.get("max_batch_size", 16)  # type: int
+        # время накопления уведомлений о выполненных задачах в секундах
+        self.completion_linger = kwargs.get("completion_linger", 0.01)  # type: float
+        self.completed = []  # type: List[dict]
+        # снимки свободных слотов нумеруются, диспетчер не применяет устаревшие.
+        # epoch отличает нумерацию после перезапуска вычислителя
+        self.epoch = random.getrandbits(31)
+        self.seq = 0
+        # задачи, завершившиеся ошибкой
+        self.failed_tasks = 0
         self.heartbeat_sec = kwargs.get("heartbeat", 5)  # type: float
-        self.heartbeat_event = None  # type: Optional[Event]
+        self.heartbeat_timer = None  # type: Optional[TimerHandle]
 
     def start(self):
         # type: () -> None
         try:
+            # процессы исполнителя создаются после сокета и не должны его держать
+            self.backend.start(self.net_client.get_fds())
             # регистрация вычислителя в диспетчере
             self.heartbeat()
-            self.heartbeat_event = call_repeatedly(self.heartbeat_sec, self.heartbeat)
+            self.heartbeat_timer = self.net_client.call_repeatedly(
+                self.heartbeat_sec, self.heartbeat
+            )
             self.net_client.serve_forever()
         except KeyboardInterrupt:
             logger.info("Ctrl+C Pressed. Shutting down.")
@@ -55,66 +84,148 @@ class Calculator(ICalculator):
         # type: (bool) -> None
         """ остановка вычислителя.
             Если immediate = True, то все задания прерываются """
-        if self.heartbeat_event:
-            self.heartbeat_event.set()
+        if self.heartbeat_timer:
+            self.heartbeat_timer.cancel()
+        self.backend.shutdown(immediate=immediate)
         self.net_client.shutdown(immediate=immediate)
+        if self.failed_tasks:
+            logger.info("Задач завершилось ошибкой: %s", self.failed_tasks)
+
+    @property
+    def free_slots(self):
+        # type: () -> int
+        return max(self.capacity - len(self.tasks), 0)
+
+    @property
+    def status(self):
+        # type: () -> int
+        if self.free_slots:
+            return CalculatorStatus.ready
+        return CalculatorStatus.busy
 
     def handle_message_dispatcher(self, address, message):
         # type: (Tuple[str, int], dict) -> ResponseConfirmation
-        logger.debug(
-            "Получено сообщение с адреса: {}, данные: {}".format(address, message)
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Получено сообщение с адреса: %s, данные: %s", address, message)
 
         if message["method"] == "perform_task":
             return self.perform_task_handler(message)
 
+        if message["method"] == "perform_tasks":
+            return self.perform_tasks_handler(message)
+
         if message["method"] == "status":
-            return ResponseConfirmation(data={"status": self.status})
+            return ResponseConfirmation(
+                data={"status": self.status, "free_slots": self.free_slots}
+            )
 
     def perform_task_handler(self, message):
         # type: (dict) -> ResponseConfirmation
-        if self.status == CalculatorStatus.ready:
-            self.perform_task(message["params"])
-            return ResponseConfirmation(data=None)
-        else:
-            field_task_id = "task_uuid"
-            if self.__task and message["params"][
-                field_task_id
-            ] == self.__task.params.get(field_task_id):
-                logger.warning(
-                    "Повторно получено задача которая уже находится в обработке {}".format(
-                        self.status
-                    )
-                )
-                return ResponseConfirmation(data=None)
-            else:
-                logger.warning(
-                    "Вычислитель получил задачу, но при этом находится в недоступном статусе {}".format(
-                        self.status
-                    )
-                )
+        return self.accept_tasks([message["params"]])
 
-    def perform_task(self, task_params):
-        # type: (dict) -> None
-        self.status = CalculatorStatus.busy
-        task_runner = CalculatorTask(
-            random.uniform(*self.task_duration), self.__task_completed_callback,
+    def perform_tasks_handler(self, message):
+        # type: (dict) -> ResponseConfirmation
+        return self.accept_tasks(message["params"]["tasks"])
+
+    def accept_tasks(self, tasks):
+        # type: (List[dict]) -> ResponseConfirmation
+        """ задачи принимаются всегда, одиночные и пачкой. Диспетчер отправляет не больше задач,
+            чем свободных слотов в последнем снимке. Если снимок устарел, лишние задачи ждут
+            освобождения слота в очереди исполнителя, а в следующем снимке free_slots = 0 """
+        task_uuids = []
+        with self.lock:
+            for task_params in tasks:
+                task_uuid = task_params.get(FIELD_TASK_ID)
+                if task_uuid in self.tasks:
+                    logger.warning(
+                        "Повторно получено задача которая уже находится в обработке %s",
+                        task_uuid,
+                    )
+                    continue
+                self.tasks[task_uuid] = task_params
+                task_uuids.append(task_uuid)
+            queued = len(self.tasks) - self.capacity
+        if queued > 0:
+            logger.info(
+                "Все %s слотов заняты, задач в очереди исполнителя: %s",
+                self.capacity,
+                queued,
+            )
+        for task_uuid in task_uuids:
+            self.perform_task(task_uuid)
+        return ResponseConfirmation(data=None)
+
+    def perform_task(self, task_uuid):
+        # type: (str) -> None
+        self.backend.submit(
+            task_uuid,
+            do_job,
+            (random.uniform(*self.task_duration),),
+            self.__task_completed_callback,
         )
-        self.__task = TaskContainer(runner=task_runner, params=task_params)
-        task_runner.start()
 
     def heartbeat(self):
         # type: () -> None
-        data = self.__generate_command("heartbeat", {"status": self.status})
+        params = {
+            "status": self.status,
+            "capacity": self.capacity,
+            "max_batch": self.max_batch_size,
+            # период heartbeat, начальная оценка для детектора отказа диспетчера
+            "interval": self.heartbeat_sec,
+        }
+        self.__add_slots_snapshot(params)
+        data = self.__generate_command("heartbeat", params)
         self.net_client.send_command_without_confirmation(self.dispatcher_address, data)
 
-    def __task_completed_callback(self):
+    def __add_slots_snapshot(self, params):
+        # type: (dict) -> None
+        """ добавить в команду свободные слоты и номер снимка """
+        with self.lock:
+            self.seq += 1
+            params["free_slots"] = self.free_slots
+            params["epoch"] = self.epoch
+            params["seq"] = self.seq
+
+    def __task_completed_callback(self, task_uuid, result, error):
+        # type: (str, Any, Optional[str]) -> None
+        with self.lock:
+            params = dict(self.tasks.pop(task_uuid))
+            if error is not None:
+                self.failed_tasks += 1
+        # входные данные задачи диспетчеру обратно не отправляются
+        params.pop("data", None)
+        if error is None:
+            logger.debug("Задача выполнена. %s", params)
+        else:
+            # о неудаче диспетчер узнает из того же уведомления
+            logger.warning("Задача %s завершилась ошибкой: %s", task_uuid, error)
+            params["error"] = error
+        with self.lock:
+            self.completed.append(params)
+            count = len(self.completed)
+        # уведомления отправляются из цикла событий: снимок слотов в них
+        # не должен обогнать подтверждения задач, принятых позже
+        if count >= self.max_batch_size or not self.completion_linger:
+            self.net_client.call_later(0, self.flush_completed)
+        elif count == 1:
+            self.net_client.call_later(self.completion_linger, self.flush_completed)
+
+    def flush_completed(self):
         # type: () -> None
-        logger.debug("Задача выполнена. {}".format(self.__task.params))
-
-        self.status = CalculatorStatus.ready
-        data = self.__generate_command("completed_task", self.__task.params)
-        self.__task = None
+        """ отправить диспетчеру накопленные уведомления о выполненных задачах """
+        with self.lock:
+            completed = self.completed
+            self.completed = []
+        if not completed:
+            return
+        if len(completed) == 1:
+            params = completed[0]
+            method = "completed_task"
+        else:
+            params = {"tasks": completed}
+            method = "completed_tasks"
+        self.__add_slots_snapshot(params)
+        data = self.__generate_command(method, params)
         self.net_client.send_command(
             self.dispatcher_address, data, self.__confirmation_echo
         )
@@ -125,11 +236,10 @@ class Calculator(ICalculator):
             logger.debug("Результат задачи успешно отправлен диспетчеру")
         elif status == TransmissionStatus.failure:
             logger.error(
-                "Ошибка при отправке результат задачи. Адрес: {}, команда: {}, статус: {}".format(
-                    address,
-                    transmission_id,
-                    TransmissionStatus.code2status_name(status),
-                )
+                "Ошибка при отправке результат задачи. Адрес: %s, команда: %s, статус: %s",
+                address,
+                transmission_id,
+                TransmissionStatus.code2status_name(status),
             )
 
     def __generate_command(self, method, params):
@@ -59,7 +59,7 @@ class DisabilityRunner(object):
     def go_disability_mode(self):
         # type: () -> None
         delay = random.uniform(*self.disability_duration)
-        logger.debug("Режим неработоспособности активирован на {} сек".format(delay))
+        logger.debug("Режим неработоспособности активирован на %s сек", delay)
         time.sleep(delay)
         logger.debug("Период неработоспособности закончен")
 
@@ -11,17 +11,27 @@ from functools import partial
 from signal import SIGABRT, SIGINT, SIGTERM, signal
 
 from entities import TaskStatus
+from metrics import LatencyHistogram, RateMeter, format_percentiles, format_rates
 from net_protocol import INetClient, ResponseConfirmation, TransmissionStatus
 
 try:
-    from typing import Tuple, Any, Optional, Dict
+    from typing import Tuple, Any, Optional, Dict, List
+    from net_protocol.event_loop import TimerHandle
 except ImportError:
     pass
 
+try:
+    from signal import SIGUSR1
+except ImportError:
+    # на Windows сигнала нет
+    SIGUSR1 = None
+
 logger = logging.getLogger(__name__)
 
 
 class ClientTaskInfo(object):
+    __slots__ = ("task_id", "status", "created_tm", "done_tm")
+
     def __init__(self, task_id, status=None):
         # type: (int, Optional[int]) -> None
         self.task_id = task_id  # type: int
@@ -35,48 +45,119 @@ class ClientTaskInfo(object):
         self.done_tm = time.time()
 
 
+class TaskStat(object):
+    """ статистика по задачам без хранения самих задач """
+
+    def __init__(self):
+        # type: () -> None
+        self.count_created = 0
+        self.count_expired = 0
+        # задачи, выполнение которых завершилось ошибкой
+        self.count_failed = 0
+        self.latency = LatencyHistogram()
+        self.created_rate = RateMeter()
+        self.solved_rate = RateMeter()
+
+    @property
+    def count_solved(self):
+        # type: () -> int
+        return self.latency.count
+
+    def add_created(self):
+        # type: () -> None
+        self.count_created += 1
+        self.created_rate.mark()
+
+    def add_failed(self):
+        # type: () -> None
+        self.count_failed += 1
+
+    def add_solved(self, execution_sec):
+        # type: (float) -> None
+        self.latency.record(execution_sec)
+        self.solved_rate.mark()
+
+
 class Client(object):
     def __init__(self, net_client_class, dispatcher_address, task_duration, **kwargs):
         # type: (INetClient, Tuple[str, int], Tuple[float, float], **Any) -> None
-        self.net_client = net_client_class(("", kwargs.get("client_port", 0)))
+        self.net_client = net_client_class(
+            ("", kwargs.get("client_port", 0)), **kwargs.get("net_client", {})
+        )
         self.net_client.add_handler_request(self.handle_request)
 
         self.dispatcher_address = dispatcher_address
         self.task_duration = task_duration
+        # размер входных данных задачи в байтах, 0 - задача передается без данных
+        self.payload = "x" * kwargs.get("payload_size", 0)  # type: str
 
         self.is_alive = True
         self.task_id = 0
+        # задачи, ожидающие решения, в порядке создания
         self.tasks = OrderedDict()  # type: Dict[int, ClientTaskInfo]
+        # время ожидания решения задачи, после которого задача считается нерешенной
+        self.task_ttl = kwargs.get("task_ttl", 3600.0)  # type: float
+        self.stat = TaskStat()
+        self.lock = threading.Lock()
+
+        # задачи, ожидающие отправки диспетчеру
+        self.outbox = []  # type: List[dict]
+        self.max_batch_size = kwargs.get("max_batch_size", 16)  # type: int
+        # время накопления задач для отправки одной командой add_tasks в секундах
+        self.submit_linger = kwargs.get("submit_linger", 0.005)  # type: float
+        # максимальное количество задач, отправленных диспетчеру без подтверждения
+        self.max_in_flight = kwargs.get("max_in_flight", 1024)  # type: int
+        self.in_flight = 0
         self.thread_generator_task = threading.Thread(target=self.__generate_task)
+        # интервал вывода статистики в секундах, 0 - только при завершении и по SIGUSR1
+        self.stat_interval = kwargs.get("stat_interval", 0)  # type: float
+        self.stat_timer = None  # type: Optional[TimerHandle]
+        # статистика запрошена сигналом SIGUSR1, выводится из цикла событий
+        self.stat_requested = False
+        # интервал проверки запроса статистики в секундах
+        self.stat_request_poll = kwargs.get("stat_request_poll", 0.5)  # type: float
 
     def start(self):
         # type: () -> None
         self.register_signal_handler()
         self.thread_generator_task.start()
+        if self.stat_interval:
+            self.stat_timer = self.net_client.call_repeatedly(
+                self.stat_interval, self.print_stat
+            )
+        self.net_client.call_repeatedly(
+            self.stat_request_poll, self.__print_requested_stat
+        )
         self.net_client.serve_forever()
+        self.thread_generator_task.join()
 
     def print_stat(self):
-        task_ids = list(self.tasks.keys())
-        execution_times = []
-        for task_id in task_ids:
-            task = self.tasks[task_id]
-            if task.done_tm:
-                execution_times.append(task.done_tm - task.created_tm)
-        count_solved = len(execution_times)
-        count_created = len(task_ids)
-        print("Задач создано:", count_created)
-        print("Задач решено:", count_solved)
-        print("Задач не решено:", count_created - count_solved)
-        if count_solved > 0:
+        stat = self.stat
+        with self.lock:
+            count_waiting = len(self.tasks)
+        print("Задач создано:", stat.count_created)
+        print("Задач решено:", stat.count_solved)
+        print(
+            "Задач не решено: {} (ожидают решения: {}, не решено за task_ttl: {}, "
+            "ошибка выполнения: {})".format(
+                stat.count_created - stat.count_solved,
+                count_waiting,
+                stat.count_expired,
+                stat.count_failed,
+            )
+        )
+        if stat.count_solved > 0:
+            latency = stat.latency
             print(
                 "min/avg/max решения: {:.2f}/{:.2f}/{:.2f} сек".format(
-                    min(execution_times),
-                    sum(execution_times) / count_solved,
-                    max(execution_times),
+                    latency.min, latency.mean(), latency.max
                 )
             )
+            print("Перцентили времени решения, сек:", format_percentiles(latency))
         else:
             print("min/avg/max недоступно потому что не решено ни одной задачи")
+        print("Создано задач в секунду:", format_rates(stat.created_rate))
+        print("Решено задач в секунду:", format_rates(stat.solved_rate))
 
     def handle_request(self, address, message):
         # type: (Tuple[str, int], dict) -> ResponseConfirmation
@@ -84,24 +165,40 @@ class Client(object):
             return self.notify_task_handler(message)
 
         logger.warning(
-            "Получен неизвестный запрос c адреса {}, сообщение: {}".format(
-                address, message
-            )
+            "Получен неизвестный запрос c адреса %s, сообщение: %s", address, message
         )
 
     def notify_task_handler(self, message):
         # type: (dict) -> ResponseConfirmation
-        done_task_id = message["params"]["task_id"]
-        try:
-            self.tasks[done_task_id].done()
-            logger.debug("Задача {}. решена".format(done_task_id))
-            return ResponseConfirmation(data=None)
-        except KeyError:
-            logger.error(
-                "Получен запрос о выполнении неизвестной задачи {}. Запрос: {}".format(
-                    done_task_id, message
+        params = message["params"]
+        done_task_id = params["task_id"]
+        # задача выполнена вычислителем с ошибкой
+        failed = params.get("status") == "error"
+        with self.lock:
+            task = self.tasks.pop(done_task_id, None)
+            if task is not None:
+                task.done()
+                if failed:
+                    self.stat.add_failed()
+                else:
+                    self.stat.add_solved(task.done_tm - task.created_tm)
+        if task is not None:
+            if failed:
+                logger.warning(
+                    "Задача %s завершилась ошибкой: %s", done_task_id, params.get("error")
                 )
-            )
+            else:
+                logger.debug("Задача %s. решена", done_task_id)
+            return ResponseConfirmation(data=None)
+        if 0 <= done_task_id < self.task_id:
+            # повтор уведомления о решенной или просроченной задаче
+            logger.debug("Задача %s уже снята с ожидания", done_task_id)
+            return ResponseConfirmation(data=None)
+        logger.error(
+            "Получен запрос о выполнении неизвестной задачи %s. Запрос: %s",
+            done_task_id,
+            message,
+        )
 
     def __generate_task(self):
         # type: () -> None
@@ -111,29 +208,86 @@ class Client(object):
             if not self.is_alive:
                 break
             try:
-                self.tasks[self.task_id] = ClientTaskInfo(
-                    self.task_id, TaskStatus.sent_to_dispatcher
-                )
-                self.net_client.send_command(
-                    self.dispatcher_address,
-                    self.__generate_command("add_task", {"task_id": self.task_id}),
-                    partial(self.__add_task_callback, task_id=self.task_id),
-                )
+                with self.lock:
+                    self.__expire_tasks()
+                    self.tasks[self.task_id] = ClientTaskInfo(
+                        self.task_id, TaskStatus.sent_to_dispatcher
+                    )
+                    self.stat.add_created()
+                params = {"task_id": self.task_id}
+                if self.payload:
+                    params["data"] = self.payload
+                logger.debug("Новая задача %s", self.task_id)
                 self.task_id += 1
-                logger.debug("Новая задача {}".format(self.task_id))
+                self.submit_task(params)
             except:
                 logger.exception("Ошибка при генерации задания")
 
-    def __add_task_callback(self, address, transmission_id, status, task_id):
-        # type: (Tuple[str, int], int, int, int) -> None
+    def submit_task(self, params):
+        # type: (dict) -> None
+        """ поставить задачу в очередь отправки. Задачи отправляются пачкой,
+            когда пачка заполнена или истекло время submit_linger """
+        with self.lock:
+            self.outbox.append(params)
+            count = len(self.outbox)
+        if count >= self.max_batch_size or not self.submit_linger:
+            self.flush_outbox()
+        elif count == 1:
+            self.net_client.call_later(self.submit_linger, self.flush_outbox)
+
+    def flush_outbox(self):
+        # type: () -> None
+        """ отправить накопленные задачи в пределах окна max_in_flight """
+        while True:
+            with self.lock:
+                count = min(
+                    len(self.outbox),
+                    self.max_batch_size,
+                    self.max_in_flight - self.in_flight,
+                )
+                if count <= 0:
+                    return
+                batch = self.outbox[:count]
+                del self.outbox[:count]
+                self.in_flight += count
+            task_ids = [params["task_id"] for params in batch]
+            if count == 1:
+                data = self.__generate_command("add_task", batch[0])
+            else:
+                data = self.__generate_command("add_tasks", {"tasks": batch})
+            self.net_client.send_command(
+                self.dispatcher_address,
+                data,
+                partial(self.__add_task_callback, task_ids=task_ids),
+            )
+
+    def __expire_tasks(self):
+        # type: () -> None
+        """ перестать ожидать решения задач старше task_ttl """
+        expire_tm = time.time() - self.task_ttl
+        while self.tasks:
+            task_id = next(iter(self.tasks))
+            if self.tasks[task_id].created_tm > expire_tm:
+                break
+            del self.tasks[task_id]
+            self.stat.count_expired += 1
+            logger.warning("Задача %s не решена за %s сек", task_id, self.task_ttl)
+
+    def __add_task_callback(self, address, transmission_id, status, task_ids):
+        # type: (Tuple[str, int], int, int, List[int]) -> None
+        with self.lock:
+            self.in_flight -= len(task_ids)
         if status == TransmissionStatus.success:
-            logger.debug("Задача {} принята диспетчером".format(task_id))
+            logger.debug("Задачи %s приняты диспетчером", task_ids)
         elif status == TransmissionStatus.failure:
             logger.debug(
-                "Не удалось передать задачу {} диспетчеру. transmission_id: {}".format(
-                    task_id, transmission_id
-                )
+                "Не удалось передать задачи %s диспетчеру. transmission_id: %s",
+                task_ids,
+                transmission_id,
             )
+        # окно освободилось, отправляем задачи, накопленные за время ожидания
+        if self.outbox:
+            self.flush_outbox()
 
     def __generate_command(self, method, params):
         # type: (str, dict) -> dict
@@ -144,9 +298,24 @@ class Client(object):
         if sys.platform != "win32":
             for sig in (SIGINT, SIGTERM, SIGABRT):
                 signal(sig, self.signal_handler)
+            # вывод статистики по запросу: kill -USR1 <pid>
+            signal(SIGUSR1, self.stat_signal_handler)
 
     def signal_handler(self, signum, frame):
-        logger.warning("Получен сигнал {}, остановка...".format(signum))
+        logger.warning("Получен сигнал %s, остановка...", signum)
         self.is_alive = False
-        self.thread_generator_task.join()
+        if self.stat_timer:
+            self.stat_timer.cancel()
+        # поток генерации задач завершается после выхода из цикла событий в start
         self.net_client.shutdown()
+
+    def stat_signal_handler(self, signum, frame):
+        # обработчик выполняется в потоке цикла событий между его инструкциями,
+        # поэтому блокировки здесь не берутся: статистику выведет таймер цикла
+        self.stat_requested = True
+
+    def __print_requested_stat(self):
+        # type: () -> None
+        if self.stat_requested:
+            self.stat_requested = False
+            self.print_stat()
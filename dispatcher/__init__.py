@@ -0,0 +1,2 @@
+# coding: utf8
+from .dispatcher import Dispatcher
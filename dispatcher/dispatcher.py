@@ -0,0 +1,922 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from entities import CalculatorStatus, TaskStatus
+from net_protocol import (
+    INetClient,
+    ResponseConfirmation,
+    TransmissionStatus,
+    resolve_address,
+)
+
+from .failure_detector import FailureDetector
+from .federation import Federation
+from .placement import create_ready_pool
+from .registry import EXECUTION_STATUSES, PLACEMENT_STATUSES, TaskInfo, TaskRegistry
+from .sharding import ShardLink
+from .stats import CALCULATOR_STATE_NAMES, DispatcherMetrics, MetricsHttpServer
+
+try:
+    from typing import Optional, Dict, Tuple, Any, List, Callable, Set
+    from net_protocol.event_loop import TimerHandle
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+class CalculatorInfo(object):
+    def __init__(self, state=None):
+        # type: (int) -> None
+        self.state = state
+        # количество слотов для одновременного выполнения задач
+        self.capacity = 1
+        self.free_slots = 0
+        # задачи, отправленные вычислителю, но еще не подтвержденные им
+        self.in_flight = 0
+        # задачи, размещенные на вычислителе, о выполнении которых он еще не сообщил.
+        # Возвращаются в очередь, если вычислитель признан недоступным
+        self.tasks = set()  # type: Set[str]
+        # (epoch, seq) последнего примененного снимка свободных слотов
+        self.snapshot = None  # type: Optional[Tuple[int, int]]
+        # максимальное количество задач в одной команде perform_tasks
+        self.max_batch = 1
+        # детектор отказа подозревает вычислитель, задачи на нем не размещаются
+        self.suspected = False
+        # отправлен запрос status, ответ еще не получен
+        self.polling = False
+        self.last_update_tm = None
+        self.update_tm()
+
+    def update_tm(self):
+        # type: () -> None
+        self.last_update_tm = time.time()
+
+
+class Dispatcher(object):
+    def __init__(self, net_client_class, address, **kwargs):
+        # type: (INetClient, Tuple[str, int], **Any) -> None
+        addr = resolve_address(address)
+        net_client_config = dict(kwargs.get("net_client", {}))
+        if net_client_config.pop("handler_workers", 0):
+            logger.warning(
+                "Состояние диспетчера принадлежит циклу событий, handler_workers не используется"
+            )
+        # номер шарда при запуске нескольких процессов диспетчера на общем порту
+        self.shard_index = kwargs.get("shard_index", 0)  # type: int
+        shards = kwargs.get("shards", 1)  # type: int
+        self.net_client = net_client_class(
+            addr, reuse_port=shards > 1, **net_client_config
+        )
+        self.net_client.add_handler_request(self.handle_message)
+
+        self.calculators = {}  # type: Dict[Tuple[str, int], CalculatorInfo]
+        # свободные вычислители, политика определяет порядок выбора
+        self.ready_calculators = create_ready_pool(
+            kwargs.get("placement_policy", "round_robin")
+        )
+        self.tasks = TaskRegistry(
+            ttl=kwargs.get("task_ttl", 300.0),
+            max_finished=kwargs.get("max_finished_tasks", 100000),
+            max_age=kwargs.get("max_task_age", 3600.0),
+        )  # type: TaskRegistry
+        # неразмещенные задачи в порядке поступления
+        self.pending_tasks = deque()  # type: deque
+        # куча (срок размещения, task_uuid)
+        self.placement_deadlines = []  # type: List[Tuple[float, str]]
+        # поток цикла событий сетевого клиента. Состояние диспетчера (вычислители, задачи,
+        # очереди) изменяется только в нем: обработчики, callback и таймеры выполняются
+        # в цикле событий, поэтому блокировки не нужны
+        self.loop_thread = None  # type: Optional[threading.Thread]
+        # задачи, размещенные на вычислителе и ожидающие отправки одной пачкой
+        self.batches = {}  # type: Dict[Tuple[str, int], List[str]]
+        self.max_batch_size = kwargs.get("max_batch_size", 16)  # type: int
+        # время ожидания пополнения пачки в секундах, 0 - пачка отправляется в конце прохода размещения
+        self.batch_linger = kwargs.get("batch_linger", 0.0)  # type: float
+
+        self.timeout_task_placement = kwargs.get(
+            "timeout_task_placement", 120
+        )  # type: float
+        self.repeater_unsuccessful_tasks_timer = None  # type: Optional[TimerHandle]
+        self.repeater_unsuccessful_tasks_interval = 1  # type: float
+        self.lost_tasks_timer = None  # type: Optional[TimerHandle]
+        self.lost_tasks_interval = 60  # type: float
+
+        self.activity_poll_timer = None  # type: Optional[TimerHandle]
+        self.activity_poll_sec = kwargs.get("activity_poll_sec", 1.0)  # type: float
+        # адаптивный детектор отказа по времени прихода heartbeat вычислителей
+        self.failure_detector = FailureDetector(**kwargs.get("failure_detector", {}))
+        self.status_polls = 0
+
+        self.metrics = DispatcherMetrics()
+        # адрес HTTP-сервера статистики в формате Prometheus, по умолчанию не запускается
+        metrics_address = kwargs.get("metrics_address")  # type: Optional[dict]
+        self.metrics_server = None  # type: Optional[MetricsHttpServer]
+        if metrics_address:
+            self.metrics_server = MetricsHttpServer(
+                (
+                    metrics_address.get("host", "127.0.0.1"),
+                    metrics_address["port"] + self.shard_index,
+                ),
+                partial(self.run_in_loop, self.get_stats),
+            )
+
+        self.shard_link = None  # type: Optional[ShardLink]
+        if shards > 1:
+            self.shard_link = ShardLink(
+                self,
+                net_client_class,
+                self.shard_index,
+                shards,
+                kwargs.get("shard_peer_port", addr[1] + 1000),
+                kwargs.get("steal_interval", 0.2),
+                kwargs.get("shard_transfer_timeout"),
+                **net_client_config
+            )
+
+        # соседние диспетчеры, которым передаются неразмещенные задачи
+        federation_config = kwargs.get("federation")  # type: Optional[dict]
+        self.federation = None  # type: Optional[Federation]
+        if federation_config is not None:
+            if shards > 1:
+                raise ValueError("Федерация диспетчеров не поддерживается вместе с шардами")
+            self.federation = Federation(self, **federation_config)
+
+    def start(self):
+        # type: () -> None
+        self.loop_thread = threading.current_thread()
+        try:
+            if self.metrics_server:
+                self.metrics_server.start()
+            if self.shard_link:
+                self.shard_link.start()
+            if self.federation:
+                self.federation.start()
+            # периодические задачи выполняются в цикле событий сетевого клиента
+            self.activity_poll_timer = self.net_client.call_repeatedly(
+                self.activity_poll_sec, self.activity_poll
+            )
+            self.repeater_unsuccessful_tasks_timer = self.net_client.call_repeatedly(
+                self.repeater_unsuccessful_tasks_interval,
+                self.repeat_unsuccessful_tasks,
+            )
+            self.lost_tasks_timer = self.net_client.call_repeatedly(
+                self.lost_tasks_interval, self.expire_lost_tasks
+            )
+            self.net_client.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Ctrl+C Pressed. Shutting down.")
+        finally:
+            if self.shard_link:
+                self.shard_link.shutdown()
+            if self.federation:
+                self.federation.shutdown()
+
+    def run_in_loop(self, func, timeout=5.0):
+        # type: (Callable[[], Any], float) -> Any
+        """ выполнить func в цикле событий и дождаться результата.
+            Так другие потоки читают состояние диспетчера, не нарушая владение циклом """
+        if self.loop_thread is None or threading.current_thread() is self.loop_thread:
+            return func()
+        done = threading.Event()
+        outcome = []  # type: List[Any]
+
+        def call():
+            try:
+                outcome.append(func())
+            finally:
+                done.set()
+
+        self.net_client.call_later(0, call)
+        if not done.wait(timeout) or not outcome:
+            raise RuntimeError("Цикл событий не выполнил вызов за {} сек".format(timeout))
+        return outcome[0]
+
+    def handle_message(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("адрес: %s data: %s", address, message)
+        start_tm = time.time()
+        try:
+            return self.dispatch_message(address, message)
+        finally:
+            self.metrics.record_handler_time(
+                message.get("method", "unknown"), time.time() - start_tm
+            )
+
+    def dispatch_message(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        if message["method"] == "add_task":
+            return self.add_task_handler(address, message)
+
+        if message["method"] == "add_tasks":
+            return self.add_tasks_handler(address, message)
+
+        if message["method"] == "heartbeat":
+            return self.heartbeat_handler(address, message)
+
+        if message["method"] == "completed_task":
+            return self.completed_task_handler(address, message)
+
+        if message["method"] == "completed_tasks":
+            return self.completed_tasks_handler(address, message)
+
+        if message["method"] == "stats":
+            return self.stats_handler(address, message)
+
+        if message["method"] == "capacity":
+            return self.capacity_handler(address, message)
+
+        if message["method"] == "forward_tasks":
+            return self.forward_tasks_handler(address, message)
+
+        if message["method"] == "forwarded_finished":
+            return self.forwarded_finished_handler(address, message)
+
+    def stats_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        """ статистика диспетчера в ответе на команду """
+        return ResponseConfirmation(data=self.get_stats())
+
+    def get_stats(self):
+        # type: () -> Dict[str, Any]
+        calculators = dict((name, 0) for name in CALCULATOR_STATE_NAMES.itervalues())
+        for calculator_info in self.calculators.itervalues():
+            calculators[CALCULATOR_STATE_NAMES[calculator_info.state]] += 1
+        stats = {
+            "shard": self.shard_index,
+            "pending_tasks": len(self.pending_tasks),
+            "active_tasks": len(self.tasks),
+            "calculators": calculators,
+            "suspected_calculators": sum(
+                1
+                for calculator_info in self.calculators.itervalues()
+                if calculator_info.suspected
+            ),
+            "status_polls": self.status_polls,
+        }
+        stats.update(self.metrics.get_stats())
+        if self.federation:
+            stats["federation"] = self.federation.get_stats()
+        stats["net"] = self.net_client.get_stats()
+        return stats
+
+    def heartbeat_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        params = message["params"]
+        state = int(params["status"])
+        capacity = int(params.get("capacity", 1))
+        self.failure_detector.heartbeat(address, params.get("interval"))
+        calculator_info = self.calculators.get(address)
+        if calculator_info is not None:
+            calculator_info.suspected = False
+        if "free_slots" in params:
+            free_slots = self.__get_snapshot_free_slots(address, params)
+        else:
+            # вычислитель без поддержки нескольких слотов
+            free_slots = capacity if state == CalculatorStatus.ready else 0
+        self.set_calculator_state(address, state, free_slots, capacity)
+        self.calculators[address].max_batch = int(params.get("max_batch", 1))
+        return ResponseConfirmation(data=None)
+
+    def __get_snapshot_free_slots(self, address, params):
+        # type: (Tuple[str, int], dict) -> Optional[int]
+        """ свободные слоты по снимку вычислителя из heartbeat или completed_task(s).
+            Снимок - единственный источник количества слотов: уведомление о выполнении
+            может прийти после heartbeat, уже учевшего освободившийся слот.
+            None, если снимок старше уже примененного """
+        free_slots = int(params["free_slots"])
+        calculator_info = self.calculators.get(address)
+        if calculator_info is None:
+            return free_slots
+        if "seq" in params:
+            snapshot = (params.get("epoch"), int(params["seq"]))
+            previous = calculator_info.snapshot
+            if (
+                previous is not None
+                and previous[0] == snapshot[0]
+                and previous[1] >= snapshot[1]
+            ):
+                return None
+            calculator_info.snapshot = snapshot
+        # задачи в пути вычислитель еще не учел
+        return free_slots - calculator_info.in_flight
+
+    def completed_task_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        params = message["params"]
+        completed = self.complete_task(address, params)
+        self.release_slots(address, params, int(completed))
+        # 0. отправляется подтверждение вычислителю
+        return ResponseConfirmation(data=None)
+
+    def completed_tasks_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        """ пачка уведомлений о выполненных задачах, подтверждается целиком """
+        params = message["params"]
+        completed = 0
+        for task_params in params["tasks"]:
+            completed += self.complete_task(address, task_params)
+        # освободившиеся слоты заполняются одной пачкой
+        self.release_slots(address, params, completed)
+        return ResponseConfirmation(data=None)
+
+    def release_slots(self, address, params, completed):
+        # type: (Tuple[str, int], dict, int) -> None
+        """ обновить слоты вычислителя после уведомления о выполненных задачах.
+            Ответ вычислителя - признак его работоспособности """
+        self.failure_detector.touch(address)
+        calculator_info = self.calculators.get(address)
+        if calculator_info:
+            calculator_info.suspected = False
+        if "free_slots" in params:
+            free_slots = self.__get_snapshot_free_slots(address, params)
+        else:
+            # вычислитель без снимков слотов: каждая задача освобождает слот
+            free_slots = (calculator_info.free_slots if calculator_info else 0) + completed
+        self.set_calculator_state(address, CalculatorStatus.ready, free_slots)
+
+    def complete_task(self, address, params):
+        # type: (Tuple[str, int], dict) -> bool
+        """ отметить задачу выполненной и сообщить об этом тому, от кого она получена.
+            Поле error - ошибка выполнения задачи вычислителем.
+            False для повторного уведомления или неизвестной задачи """
+        task_uuid = params["task_uuid"]
+        task_info = self.tasks.get(task_uuid)
+        if task_info is None:
+            if task_uuid in self.tasks:
+                # повтор уведомления, подтверждение прошлого не дошло до вычислителя
+                logger.debug(
+                    "Задача %s уже завершена. Уведомление от %s", task_uuid, address
+                )
+                return False
+            logger.error(
+                "Не найдено задачи %s. Уведомление от %s, данные: %s",
+                task_uuid,
+                address,
+                params,
+            )
+            return False
+
+        # 0. Обновляем задачу в реестре задач
+        error = params.get("error")
+        calculator_info = self.calculators.get(address)
+        if calculator_info is not None:
+            calculator_info.tasks.discard(task_uuid)
+        task_info.calculator_address = None
+        if error is None:
+            task_info.status = TaskStatus.solved
+            self.metrics.incr("solved")
+        else:
+            logger.warning(
+                "Задача %s принятая от %s завершилась ошибкой на %s: %s",
+                task_uuid,
+                task_info.client_address,
+                address,
+                error,
+            )
+            task_info.status = TaskStatus.error_execution
+            self.metrics.incr("failed")
+        if task_info.placement_tm is not None:
+            execution_time = time.time() - task_info.placement_tm
+            self.ready_calculators.record_latency(address, execution_time)
+            self.metrics.record_latency("execution", execution_time)
+
+        self.deliver_result(task_uuid, task_info, error)
+        return True
+
+    def deliver_result(self, task_uuid, task_info, error=None):
+        # type: (str, TaskInfo, Optional[str]) -> None
+        """ сообщить о выполнении задачи тому, от кого она получена.
+            error - ошибка выполнения задачи, None для успешной """
+        status = TaskStatus.solved if error is None else TaskStatus.error_execution
+        if task_info.home_shard is not None:
+            # клиенту отвечает шард, принявший задачу
+            self.shard_link.report_finished(
+                task_info.home_shard, task_uuid, True, error
+            )
+            self.tasks.finish(task_uuid, status)
+        elif task_info.forwarded_from is not None:
+            self.federation.report_finished(
+                task_info.forwarded_from, task_uuid, True, error
+            )
+            self.tasks.finish(task_uuid, status)
+        else:
+            self.notify_client(task_uuid, task_info, error)
+
+    def notify_client(self, task_uuid, task_info, error=None):
+        # type: (str, TaskInfo, Optional[str]) -> None
+        """ отправить клиенту команду notify_task и перевести задачу в завершенные """
+        if error is None:
+            params = {"status": "success"}
+        else:
+            params = {"status": "error", "error": error}
+        params.update(task_info.task_params)
+        # входные данные задачи клиенту обратно не отправляются
+        params.pop("data", None)
+        data = self.__generate_command("notify_task", params)
+        self.net_client.send_command(
+            task_info.client_address, data, self.echo_callback_calculator
+        )
+        # параметры задачи больше не нужны, в реестре остается только статус
+        self.tasks.finish(task_uuid, TaskStatus.sent_to_client)
+        self.metrics.record_latency("total", time.time() - task_info.created_tm)
+
+    def add_task_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        self.add_task(address, message["params"])
+        self.place_pending_tasks()
+        return ResponseConfirmation(data=None)
+
+    def add_tasks_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        """ пачка задач от клиента, подтверждается целиком """
+        for params in message["params"]["tasks"]:
+            self.add_task(address, params)
+        # задачи пачки размещаются за один проход
+        self.place_pending_tasks()
+        return ResponseConfirmation(data=None)
+
+    def add_task(self, address, params):
+        # type: (Tuple[str, int], dict) -> None
+        """ поставить задачу клиента в очередь размещения """
+        client_task_id = params["task_id"]
+        task_uuid = self.__generate_task_uuid(address, client_task_id)
+        if task_uuid in self.tasks:
+            logger.warning(
+                "Запрос на выполнение задачи от %s c id %s уже поступала",
+                address,
+                client_task_id,
+            )
+            self.metrics.incr("duplicates")
+            return
+
+        task_info = TaskInfo()
+        task_info.client_address = address
+        task_info.task_params = params
+        task_info.status = TaskStatus.accepted_from_client
+        self.tasks.add(task_uuid, task_info)
+        heapq.heappush(
+            self.placement_deadlines,
+            (task_info.created_tm + self.timeout_task_placement, task_uuid),
+        )
+        self.pending_tasks.append(task_uuid)
+        self.metrics.incr("accepted")
+
+    def place_pending_tasks(self):
+        # type: () -> None
+        """ разместить ожидающие задачи, пока есть свободные вычислители """
+        while self.pending_tasks and self.ready_calculators:
+            task_uuid = self.pending_tasks.popleft()
+            task_info = self.tasks.get(task_uuid)
+            # задача могла быть снята по таймауту размещения
+            if task_info and task_info.status in PLACEMENT_STATUSES:
+                self.find_calculator_for_task(task_uuid)
+        if not self.batch_linger:
+            for calc_addr in list(self.batches):
+                self.flush_batch(calc_addr)
+        if self.pending_tasks:
+            logger.debug(
+                "Нет свободных вычислителей, задач в очереди: %s",
+                len(self.pending_tasks),
+            )
+
+    def find_calculator_for_task(self, task_uuid):
+        # type: (str) -> None
+        task_info = self.tasks.get(task_uuid)
+        calc_addr = self.ready_calculators.acquire()
+        if calc_addr is None:
+            task_info.status = TaskStatus.error_accepted_calculator
+            # задача размещается первой, как только освободится вычислитель
+            self.pending_tasks.appendleft(task_uuid)
+            logger.warning("Не найден свободный вычислитель для задачи %s", task_uuid)
+            return
+        calculator_info = self.calculators[calc_addr]
+        calculator_info.free_slots -= 1
+        calculator_info.in_flight += 1
+        calculator_info.tasks.add(task_uuid)
+        if calculator_info.free_slots > 0:
+            # у вычислителя остались свободные слоты
+            self.ready_calculators.add(calc_addr)
+        else:
+            calculator_info.state = CalculatorStatus.busy
+        task_info.calculator_address = calc_addr
+        task_info.placement_tm = time.time()
+        task_info.status = TaskStatus.sent_to_calculator
+        self.metrics.record_latency(
+            "placement", task_info.placement_tm - task_info.created_tm
+        )
+
+        batch = self.batches.get(calc_addr)
+        if batch is None:
+            batch = self.batches[calc_addr] = []
+            if self.batch_linger:
+                self.net_client.call_later(self.batch_linger, self.flush_batch, calc_addr)
+        batch.append(task_uuid)
+        if len(batch) >= min(self.max_batch_size, calculator_info.max_batch):
+            self.flush_batch(calc_addr)
+
+    def flush_batch(self, calc_addr):
+        # type: (Tuple[str, int]) -> None
+        """ отправить вычислителю размещенные на нем задачи """
+        task_uuids = self.batches.pop(calc_addr, None)
+        if not task_uuids:
+            return
+        tasks = []
+        for task_uuid in task_uuids:
+            task_info = self.tasks.get(task_uuid)
+            params = {"task_uuid": task_uuid}
+            if task_info and "data" in task_info.task_params:
+                params["data"] = task_info.task_params["data"]
+            tasks.append(params)
+        if len(tasks) == 1:
+            data = self.__generate_command("perform_task", tasks[0])
+            callback = partial(
+                self.update_task_status_callback, task_uuid=task_uuids[0]
+            )
+        else:
+            data = self.__generate_command("perform_tasks", {"tasks": tasks})
+            callback = partial(self.update_tasks_status_callback, task_uuids=task_uuids)
+        self.net_client.send_command(calc_addr, data, callback)
+
+    def __generate_task_uuid(self, client_address, task_id):
+        # type: (Tuple[str, int], int) -> str
+        return "{}:{}:{}".format(client_address[0], client_address[1], task_id)
+
+    def update_task_status_callback(self, address, transmission_id, status, task_uuid):
+        # type: (Tuple[str, int], int, int, str) -> None
+        calculator_info = self.calculators[address]
+        calculator_info.in_flight = max(calculator_info.in_flight - 1, 0)
+        task_info = self.tasks.get(task_uuid)
+        if task_info is None:
+            # задача уже решена или снята
+            return
+        if task_info.calculator_address != address:
+            # задача уже возвращена в очередь вместе с остальными задачами вычислителя
+            return
+        if status == TransmissionStatus.success:
+            calculator_info.update_tm()
+            task_info.status = TaskStatus.accepted_for_execution_calculator
+        elif status == TransmissionStatus.failure:
+            # задачи недоступного вычислителя, в том числе эта, возвращаются в очередь
+            self.set_calculator_state(address, CalculatorStatus.not_available)
+
+    def update_tasks_status_callback(self, address, transmission_id, status, task_uuids):
+        # type: (Tuple[str, int], int, int, List[str]) -> None
+        for task_uuid in task_uuids:
+            self.update_task_status_callback(address, transmission_id, status, task_uuid)
+
+    def echo_callback_calculator(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Адрес: %s, transmission_id: %s, статус: %s",
+                address,
+                transmission_id,
+                TransmissionStatus.code2status_name(status),
+            )
+
+    def repeat_unsuccessful_tasks(self):
+        # type: () -> None
+        """ снимаем задачи, которые не удалось разместить за timeout_task_placement,
+            и удаляем из реестра давно завершенные задачи """
+        current_tm = time.time()
+        while (
+            self.placement_deadlines
+            and self.placement_deadlines[0][0] <= current_tm
+        ):
+            _, task_uuid = heapq.heappop(self.placement_deadlines)
+            task_info = self.tasks.get(task_uuid)
+            if task_info and task_info.status in PLACEMENT_STATUSES:
+                self.__expire_task(task_uuid, task_info)
+        if self.shard_link:
+            self.shard_link.expire_transferred(current_tm)
+        self.tasks.expire(current_tm)
+
+    def __expire_task(self, task_uuid, task_info):
+        # type: (str, TaskInfo) -> None
+        logger.error(
+            "Не удалось разместить задачу %s принятую от %s. Информация о задаче: %s",
+            task_uuid,
+            task_info.client_address,
+            task_info.task_params,
+        )
+        # из очереди ожидания задача удаляется при извлечении
+        self.tasks.finish(task_uuid, TaskStatus.error_placement_timeout)
+        self.metrics.incr("expired")
+        self.__report_not_done(task_uuid, task_info)
+
+    def __report_not_done(self, task_uuid, task_info):
+        # type: (str, TaskInfo) -> None
+        """ сообщить шарду или диспетчеру, передавшему задачу, что она снята """
+        if task_info.home_shard is not None:
+            self.shard_link.report_finished(task_info.home_shard, task_uuid, False)
+        elif task_info.forwarded_from is not None:
+            self.federation.report_finished(task_info.forwarded_from, task_uuid, False)
+
+    def expire_lost_tasks(self):
+        # type: () -> None
+        """ снять незавершенные задачи старше max_task_age. О них не сообщили ни вычислитель,
+            ни шард, ни сосед, а их сроки уже не проверяются или запись о сроке потеряна """
+        for task_uuid, task_info in self.tasks.expire_active():
+            logger.error(
+                "Задача %s принятая от %s не завершилась за %s сек, снята. Последний адрес: %s",
+                task_uuid,
+                task_info.client_address,
+                self.tasks.max_age,
+                task_info.calculator_address,
+            )
+            self.metrics.incr("lost")
+            calculator_info = self.calculators.get(task_info.calculator_address)
+            if calculator_info is not None:
+                calculator_info.tasks.discard(task_uuid)
+            elif self.federation and task_info.calculator_address is not None:
+                self.federation.forget_forwarded(
+                    task_info.calculator_address, task_uuid
+                )
+            self.__report_not_done(task_uuid, task_info)
+
+    def get_free_slots(self):
+        # type: () -> int
+        """ количество свободных слотов доступных вычислителей шарда """
+        return sum(
+            calculator_info.free_slots
+            for calculator_info in self.calculators.itervalues()
+            if calculator_info.state == CalculatorStatus.ready
+        )
+
+    def take_pending_tasks(self, count):
+        # type: (int) -> List[dict]
+        """ извлечь до count неразмещенных задач из конца очереди для передачи другому шарду.
+            Задачи, полученные от других шардов, повторно не передаются """
+        tasks = []  # type: List[dict]
+        kept = []  # type: List[str]
+        while self.pending_tasks and len(tasks) < count:
+            task_uuid = self.pending_tasks.pop()
+            task_info = self.tasks.get(task_uuid)
+            if not task_info or task_info.status not in PLACEMENT_STATUSES:
+                continue
+            if task_info.home_shard is not None:
+                kept.append(task_uuid)
+                continue
+            task_info.status = TaskStatus.transferred_to_shard
+            task_info.placement_tm = time.time()
+            tasks.append(
+                {
+                    "task_uuid": task_uuid,
+                    "client": list(task_info.client_address),
+                    "params": task_info.task_params,
+                    "created_tm": task_info.created_tm,
+                }
+            )
+        self.pending_tasks.extend(reversed(kept))
+        return tasks
+
+    def get_local_free(self):
+        # type: () -> int
+        """ свободные слоты за вычетом задач в очереди, сообщаются соседним диспетчерам """
+        return max(self.get_free_slots() - len(self.pending_tasks), 0)
+
+    def transfer_tasks_callback(self, task_uuids, status):
+        # type: (List[str], int) -> None
+        """ задачи переданы другому шарду, при недоставке возвращаются в начало очереди """
+        if status == TransmissionStatus.success:
+            self.metrics.incr("transferred", len(task_uuids))
+        else:
+            self.requeue_tasks(task_uuids, TaskStatus.transferred_to_shard)
+
+    def requeue_tasks(self, task_uuids, status):
+        # type: (List[str], int) -> None
+        """ вернуть в начало очереди задачи, которые так и остались в статусе status.
+            Задачи с истекшим сроком размещения снимаются """
+        current_tm = time.time()
+        for task_uuid in reversed(task_uuids):
+            task_info = self.tasks.get(task_uuid)
+            if task_info and task_info.status == status:
+                if current_tm - task_info.created_tm >= self.timeout_task_placement:
+                    self.__expire_task(task_uuid, task_info)
+                    continue
+                task_info.status = TaskStatus.error_accepted_calculator
+                task_info.calculator_address = None
+                self.pending_tasks.appendleft(task_uuid)
+                self.metrics.incr("requeued")
+        self.place_pending_tasks()
+
+    def accept_transferred_tasks(self, home_shard, tasks):
+        # type: (Tuple[str, int], List[dict]) -> None
+        """ поставить в очередь задачи, переданные шардом home_shard """
+        for task in tasks:
+            task_uuid = task["task_uuid"]
+            if task_uuid in self.tasks:
+                # повтор команды, подтверждение прошлой не дошло до шарда
+                continue
+            task_info = TaskInfo()
+            task_info.client_address = tuple(task["client"])
+            task_info.task_params = task["params"]
+            task_info.created_tm = task["created_tm"]
+            task_info.home_shard = home_shard
+            task_info.status = TaskStatus.accepted_from_client
+            self.tasks.add(task_uuid, task_info)
+            heapq.heappush(
+                self.placement_deadlines,
+                (task_info.created_tm + self.timeout_task_placement, task_uuid),
+            )
+            self.pending_tasks.append(task_uuid)
+            self.metrics.incr("stolen")
+        self.place_pending_tasks()
+
+    def finish_transferred_tasks(self, results):
+        # type: (List[dict]) -> None
+        """ результаты задач, переданных другому шарду """
+        for result in results:
+            task_uuid = result["task_uuid"]
+            task_info = self.tasks.get(task_uuid)
+            if task_info is None or task_info.status != TaskStatus.transferred_to_shard:
+                continue
+            if result["success"]:
+                self.deliver_result(task_uuid, task_info, result.get("error"))
+            else:
+                # снятие задачи уже учтено шардом, которому она передана
+                logger.error(
+                    "Шард не разместил задачу %s принятую от %s",
+                    task_uuid,
+                    task_info.client_address,
+                )
+                self.tasks.finish(task_uuid, TaskStatus.error_placement_timeout)
+
+    def capacity_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> Optional[ResponseConfirmation]
+        """ отчет соседнего диспетчера о свободных слотах """
+        if self.federation is None:
+            logger.warning("Отчет диспетчера %s отклонен: федерация не настроена", address)
+            return None
+        self.federation.capacity_handler(address, message["params"])
+        return ResponseConfirmation(data=None)
+
+    def forward_tasks_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> Optional[ResponseConfirmation]
+        """ пачка задач от соседнего диспетчера, подтверждается целиком """
+        if self.federation is None:
+            # результат некому отправить, сосед вернет задачи в очередь
+            logger.warning("Задачи диспетчера %s отклонены: федерация не настроена", address)
+            return None
+        for task in message["params"]["tasks"]:
+            task_uuid = task["task_uuid"]
+            if task_uuid in self.tasks:
+                # повтор команды, подтверждение прошлой не дошло до диспетчера
+                continue
+            task_info = TaskInfo()
+            task_info.client_address = address
+            task_info.task_params = task["params"]
+            task_info.forwarded_from = address
+            task_info.hops = int(task.get("hops", 0)) + 1
+            task_info.status = TaskStatus.accepted_from_client
+            self.tasks.add(task_uuid, task_info)
+            heapq.heappush(
+                self.placement_deadlines,
+                (task_info.created_tm + self.timeout_task_placement, task_uuid),
+            )
+            self.pending_tasks.append(task_uuid)
+            self.metrics.incr("forwarded_in")
+        self.place_pending_tasks()
+        return ResponseConfirmation(data=None)
+
+    def forwarded_finished_handler(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        """ результаты задач, переданных соседнему диспетчеру """
+        failed = []  # type: List[str]
+        for result in message["params"]["tasks"]:
+            task_uuid = result["task_uuid"]
+            task_info = self.tasks.get(task_uuid)
+            if task_info is None or task_info.status != TaskStatus.forwarded_to_dispatcher:
+                continue
+            self.federation.forget_forwarded(address, task_uuid)
+            if result["success"]:
+                task_info.calculator_address = None
+                self.deliver_result(task_uuid, task_info, result.get("error"))
+            else:
+                # сосед не разместил задачу, она возвращается в очередь, если срок не истек
+                failed.append(task_uuid)
+        if failed:
+            self.requeue_tasks(failed, TaskStatus.forwarded_to_dispatcher)
+        return ResponseConfirmation(data=None)
+
+    def activity_poll(self):
+        # type: () -> None
+        """ проверить вычислители детектором отказа. Подозреваемый вычислитель убирается из пула
+            свободных и получает запрос status, при phi >= failure_phi он признается недоступным.
+            Недоступные вычислители не опрашиваются: они вернутся с очередным heartbeat """
+        current_tm = time.time()
+        detector = self.failure_detector
+        for calc_addr, calc_info in self.calculators.iteritems():
+            if calc_info.state == CalculatorStatus.not_available:
+                continue
+            phi = detector.phi(calc_addr, current_tm)
+            if phi >= detector.failure_phi:
+                logger.warning("Вычислитель %s недоступен, phi=%.1f", calc_addr, phi)
+                self.set_calculator_state(calc_addr, CalculatorStatus.not_available)
+            elif phi >= detector.suspect_phi:
+                if not calc_info.suspected:
+                    logger.info("Вычислитель %s под подозрением, phi=%.1f", calc_addr, phi)
+                    calc_info.suspected = True
+                    self.ready_calculators.discard(calc_addr)
+                if not calc_info.polling:
+                    calc_info.polling = True
+                    self.status_polls += 1
+                    data = self.__generate_command("status", {})
+                    self.net_client.send_command(
+                        calc_addr, data, self.activity_poll_callback
+                    )
+            elif calc_info.suspected:
+                calc_info.suspected = False
+                self.set_calculator_state(calc_addr, calc_info.state)
+
+    def activity_poll_callback(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        calculator_info = self.calculators[address]
+        calculator_info.polling = False
+        if status == TransmissionStatus.success:
+            self.failure_detector.touch(address)
+            calculator_info.suspected = False
+            # вычислитель, признанный недоступным, пока ждал ответа, снова принимает задачи
+            self.set_calculator_state(address, CalculatorStatus.ready)
+        elif status == TransmissionStatus.failure:
+            self.set_calculator_state(address, CalculatorStatus.not_available)
+            logger.debug("Вычислитель %s не отвечает", address)
+
+    def set_calculator_state(self, address, state, free_slots=None, capacity=None):
+        # type: (Tuple[str, int], int, Optional[int], Optional[int]) -> None
+        """ обновить состояние вычислителя и пул свободных вычислителей.
+            Вычислитель доступен для размещения, пока у него есть свободные слоты.
+            Задачи недоступного вычислителя возвращаются в очередь """
+        calculator_info = self.calculators.get(address)
+        if calculator_info is None:
+            calculator_info = self.calculators[address] = CalculatorInfo()
+        if capacity is not None:
+            calculator_info.capacity = capacity
+        if free_slots is not None:
+            calculator_info.free_slots = max(min(free_slots, calculator_info.capacity), 0)
+        if state != CalculatorStatus.not_available:
+            state = (
+                CalculatorStatus.ready
+                if calculator_info.free_slots > 0
+                else CalculatorStatus.busy
+            )
+        calculator_info.state = state
+        calculator_info.update_tm()
+        if state == CalculatorStatus.ready and not calculator_info.suspected:
+            self.ready_calculators.add(address)
+            # свободный вычислитель сразу получает ожидающую задачу
+            self.place_pending_tasks()
+        else:
+            self.ready_calculators.discard(address)
+            if state == CalculatorStatus.not_available:
+                self.__requeue_calculator_tasks(address, calculator_info)
+
+    def __requeue_calculator_tasks(self, address, calculator_info):
+        # type: (Tuple[str, int], CalculatorInfo) -> None
+        """ вернуть в начало очереди задачи, размещенные на вычислителе.
+            Задачи с истекшим сроком размещения снимаются """
+        # пачка еще не отправлена: подтверждения на нее не будет
+        batch = self.batches.pop(address, None)
+        if batch:
+            calculator_info.in_flight = max(calculator_info.in_flight - len(batch), 0)
+        if not calculator_info.tasks:
+            return
+        current_tm = time.time()
+        requeued = []  # type: List[str]
+        for task_uuid in calculator_info.tasks:
+            task_info = self.tasks.get(task_uuid)
+            if (
+                task_info is None
+                or task_info.calculator_address != address
+                or task_info.status not in EXECUTION_STATUSES
+            ):
+                continue
+            task_info.calculator_address = None
+            if current_tm - task_info.created_tm >= self.timeout_task_placement:
+                self.__expire_task(task_uuid, task_info)
+                continue
+            task_info.status = TaskStatus.error_accepted_calculator
+            requeued.append(task_uuid)
+        calculator_info.tasks.clear()
+        if requeued:
+            logger.warning(
+                "Вычислитель %s недоступен, его задачи возвращены в очередь: %s",
+                address,
+                len(requeued),
+            )
+            self.pending_tasks.extendleft(requeued)
+            self.metrics.incr("requeued", len(requeued))
+            self.place_pending_tasks()
+
+    def __generate_command(self, method, params):
+        # type: (str, dict) -> dict
+        return {"method": method, "params": params}
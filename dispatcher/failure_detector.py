@@ -0,0 +1,139 @@
+# coding: utf8
+from __future__ import print_function
+
+import math
+import sys
+import time
+from collections import deque
+
+try:
+    from typing import Dict, Optional, Tuple
+except ImportError:
+    pass
+
+
+class PhiAccrualDetector(object):
+    """ phi-accrual детектор отказа одного узла (Hayashibara и др.).
+        Вместо да/нет возвращает уровень подозрения phi = -log10(P), где P - вероятность того,
+        что очередной heartbeat опоздает на столько, сколько уже прошло с последнего.
+        Интервалы между heartbeat считаются нормально распределенными, среднее и дисперсия
+        считаются по последним window_size интервалам за O(1).
+        phi = 1 означает ошибку в 10% случаев, phi = 3 - в 0.1% """
+
+    def __init__(
+        self,
+        window_size=100,
+        min_std_deviation=0.5,
+        acceptable_pause=0.0,
+        first_interval=1.0,
+    ):
+        # type: (int, float, float, float) -> None
+        self.intervals = deque(maxlen=window_size)  # type: deque
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min_std_deviation = min_std_deviation
+        # допустимая задержка сверх среднего интервала, например на паузы сборщика мусора
+        self.acceptable_pause = acceptable_pause
+        # последний heartbeat, от него отсчитываются интервалы распределения
+        self.last_heartbeat_tm = None  # type: Optional[float]
+        # последний ответ узла (heartbeat или другой), от него отсчитывается текущее молчание
+        self.last_tm = None  # type: Optional[float]
+        # до первых измерений интервал оценивается как first_interval +- first_interval / 4
+        std_deviation = first_interval / 4.0
+        self.__add_interval(first_interval - std_deviation)
+        self.__add_interval(first_interval + std_deviation)
+
+    def heartbeat(self, current_tm):
+        # type: (float) -> None
+        """ получен периодический heartbeat, интервал от предыдущего heartbeat учитывается """
+        if self.last_heartbeat_tm is not None and current_tm > self.last_heartbeat_tm:
+            self.__add_interval(current_tm - self.last_heartbeat_tm)
+        self.last_heartbeat_tm = current_tm
+        self.touch(current_tm)
+
+    def touch(self, current_tm):
+        # type: (float) -> None
+        """ узел ответил вне расписания heartbeat: отсчет молчания начинается заново,
+            интервалы между heartbeat не меняются """
+        if self.last_tm is None or current_tm > self.last_tm:
+            self.last_tm = current_tm
+
+    def phi(self, current_tm):
+        # type: (float) -> float
+        if self.last_tm is None:
+            return 0.0
+        elapsed = current_tm - self.last_tm
+        count = len(self.intervals)
+        mean = self.total / count
+        variance = max(self.total_squares / count - mean * mean, 0.0)
+        std_deviation = max(math.sqrt(variance), self.min_std_deviation)
+        y = (elapsed - mean - self.acceptable_pause) / std_deviation
+        # логистическое приближение функции нормального распределения
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if y > 0:
+            probability = e / (1.0 + e)
+        else:
+            probability = 1.0 - 1.0 / (1.0 + e)
+        return -math.log10(max(probability, sys.float_info.min))
+
+    def __add_interval(self, interval):
+        # type: (float) -> None
+        if len(self.intervals) == self.intervals.maxlen:
+            dropped = self.intervals[0]
+            self.total -= dropped
+            self.total_squares -= dropped * dropped
+        self.intervals.append(interval)
+        self.total += interval
+        self.total_squares += interval * interval
+
+
+class FailureDetector(object):
+    """ детекторы отказа вычислителей по адресам.
+        phi >= suspect_phi - вычислитель подозревается: задачи на нем не размещаются, ему отправляется запрос status.
+        phi >= failure_phi - вычислитель признается недоступным без ожидания ответа на запрос """
+
+    def __init__(
+        self,
+        suspect_phi=3.0,
+        failure_phi=8.0,
+        window_size=100,
+        min_std_deviation=0.5,
+        acceptable_pause=0.0,
+        first_interval=1.0,
+    ):
+        # type: (float, float, int, float, float, float) -> None
+        self.suspect_phi = suspect_phi
+        self.failure_phi = failure_phi
+        self.window_size = window_size
+        self.min_std_deviation = min_std_deviation
+        self.acceptable_pause = acceptable_pause
+        self.first_interval = first_interval
+        self.detectors = {}  # type: Dict[Tuple[str, int], PhiAccrualDetector]
+
+    def heartbeat(self, address, interval=None, current_tm=None):
+        # type: (Tuple[str, int], Optional[float], Optional[float]) -> None
+        """ interval - период heartbeat, о котором сообщил вычислитель,
+            начальная оценка для нового детектора """
+        detector = self.detectors.get(address)
+        if detector is None:
+            detector = self.detectors[address] = PhiAccrualDetector(
+                self.window_size,
+                self.min_std_deviation,
+                self.acceptable_pause,
+                interval or self.first_interval,
+            )
+        detector.heartbeat(current_tm if current_tm is not None else time.time())
+
+    def touch(self, address, current_tm=None):
+        # type: (Tuple[str, int], Optional[float]) -> None
+        detector = self.detectors.get(address)
+        if detector is not None:
+            detector.touch(current_tm if current_tm is not None else time.time())
+
+    def phi(self, address, current_tm=None):
+        # type: (Tuple[str, int], Optional[float]) -> float
+        """ 0 для вычислителя, от которого не было heartbeat """
+        detector = self.detectors.get(address)
+        if detector is None:
+            return 0.0
+        return detector.phi(current_tm if current_tm is not None else time.time())
@@ -0,0 +1,326 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import logging
+import time
+from functools import partial
+
+from entities import TaskStatus
+from net_protocol import TransmissionStatus, resolve_address
+
+from .registry import PLACEMENT_STATUSES
+
+try:
+    from typing import Any, Dict, List, Optional, Set, Tuple
+    from net_protocol.event_loop import TimerHandle
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# задача от клиента передается не дальше соседа соседа: региональный диспетчер -> родитель ->
+# другой региональный диспетчер. Поэтому и свободные слоты соседей агрегируются на один уровень
+MAX_HOPS = 2
+
+
+class NeighborInfo(object):
+    __slots__ = (
+        "free",
+        "local_free",
+        "in_flight",
+        "forwarded",
+        "last_update_tm",
+        "configured",
+    )
+
+    def __init__(self, configured=False):
+        # type: (bool) -> None
+        # свободные слоты, доступные через соседа: его вычислители и вычислители его соседей
+        self.free = 0
+        # свободные слоты вычислителей самого соседа
+        self.local_free = 0
+        # задачи, переданные соседу, но еще не подтвержденные им
+        self.in_flight = 0
+        # задачи, переданные соседу, о выполнении которых он еще не сообщил
+        self.forwarded = set()  # type: Set[str]
+        self.last_update_tm = time.time()
+        # сосед из конфига, а не зарегистрировавшийся по первому отчету
+        self.configured = configured
+
+
+class Federation(object):
+    """ связь диспетчера с соседними диспетчерами (родителем, дочерними, равными).
+        Раз в report_interval диспетчер сообщает каждому соседу свободные слоты своих вычислителей
+        и вычислителей остальных соседей (capacity). Сосед, приславший отчет, регистрируется
+        автоматически, поэтому родителю список дочерних диспетчеров не нужен.
+
+        Задачи, не размещенные за forward_after секунд, передаются соседу с наибольшим
+        количеством свободных слотов (forward_tasks), но не тому, от кого задача получена.
+        О выполнении сосед сообщает командой forwarded_finished. Если сосед перестал присылать отчеты
+        или не сообщил о выполнении за forwarded_timeout, переданные ему задачи возвращаются в очередь.
+        Вызывается в цикле событий диспетчера """
+
+    def __init__(
+        self,
+        dispatcher,
+        neighbors=(),
+        report_interval=1.0,
+        forward_after=0.5,
+        neighbor_timeout=None,
+        forwarded_timeout=None,
+    ):
+        # type: (Any, List[dict], float, float, Optional[float], Optional[float]) -> None
+        self.dispatcher = dispatcher
+        self.neighbors = {}  # type: Dict[Tuple[str, int], NeighborInfo]
+        for neighbor in neighbors:
+            address = resolve_address((neighbor["host"], neighbor["port"]))
+            self.neighbors[address] = NeighborInfo(configured=True)
+        self.report_interval = report_interval
+        self.forward_after = forward_after
+        # сосед без отчетов дольше этого времени не получает задачи
+        self.neighbor_timeout = neighbor_timeout or 3 * report_interval
+        # сосед снимает задачу, не размещенную за свой timeout_task_placement, и сообщает об этом.
+        # Дольше ждать результата нельзя: сосед мог перезапуститься и потерять задачу
+        self.forwarded_timeout = (
+            forwarded_timeout or 2 * dispatcher.timeout_task_placement
+        )  # type: float
+        # куча (срок ожидания результата, task_uuid) переданных задач
+        self.forwarded_deadlines = []  # type: List[Tuple[float, str]]
+        self.report_timer = None  # type: Optional[TimerHandle]
+        self.forward_timer = None  # type: Optional[TimerHandle]
+        # сосед -> результаты переданных им задач, ожидающие отправки одной командой
+        self.finished = {}  # type: Dict[Tuple[str, int], List[dict]]
+
+    def start(self):
+        # type: () -> None
+        net_client = self.dispatcher.net_client
+        self.report_timer = net_client.call_repeatedly(
+            self.report_interval, self.report_capacity
+        )
+        self.forward_timer = net_client.call_repeatedly(
+            self.forward_after, self.forward_pending
+        )
+
+    def shutdown(self):
+        # type: () -> None
+        for timer in (self.report_timer, self.forward_timer):
+            if timer:
+                timer.cancel()
+
+    def get_stats(self):
+        # type: () -> Dict[str, int]
+        return {
+            "neighbors": len(self.neighbors),
+            "free": sum(info.free for info in self.neighbors.itervalues()),
+        }
+
+    def report_capacity(self):
+        # type: () -> None
+        """ отправить соседям свободные слоты. Соседу не сообщаются его же слоты """
+        current_tm = time.time()
+        self.expire_forwarded(current_tm)
+        for address, info in self.neighbors.items():
+            if current_tm - info.last_update_tm >= self.neighbor_timeout:
+                # сосед мог остановиться вместе с переданными ему задачами
+                self.__requeue_forwarded(address, info)
+                if not info.configured:
+                    logger.warning("Диспетчер %s не присылает отчеты, удален", address)
+                    del self.neighbors[address]
+                    continue
+                info.free = info.local_free = 0
+        local_free = self.dispatcher.get_local_free()
+        neighbors_free = sum(info.local_free for info in self.neighbors.itervalues())
+        for address, info in self.neighbors.iteritems():
+            self.dispatcher.net_client.send_command(
+                address,
+                {
+                    "method": "capacity",
+                    "params": {
+                        "free": local_free + neighbors_free - info.local_free,
+                        "local_free": local_free,
+                    },
+                },
+                self.report_callback,
+            )
+
+    def report_callback(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        info = self.neighbors.get(address)
+        if info is not None and status == TransmissionStatus.failure:
+            info.free = info.local_free = 0
+            logger.debug("Диспетчер %s не отвечает", address)
+
+    def capacity_handler(self, address, params):
+        # type: (Tuple[str, int], dict) -> None
+        info = self.neighbors.get(address)
+        if info is None:
+            logger.info("Зарегистрирован соседний диспетчер %s", address)
+            info = self.neighbors[address] = NeighborInfo()
+        info.free = int(params["free"])
+        info.local_free = int(params["local_free"])
+        info.last_update_tm = time.time()
+
+    def forward_pending(self):
+        # type: () -> None
+        """ передать соседям задачи, ожидающие размещения дольше forward_after """
+        dispatcher = self.dispatcher
+        current_tm = time.time()
+        deadline = current_tm - self.forward_after
+        batches = {}  # type: Dict[Tuple[str, int], List[str]]
+        kept = []  # type: List[str]
+        while dispatcher.pending_tasks:
+            task_uuid = dispatcher.pending_tasks[0]
+            task_info = dispatcher.tasks.get(task_uuid)
+            if not task_info or task_info.status not in PLACEMENT_STATUSES:
+                dispatcher.pending_tasks.popleft()
+                continue
+            if task_info.created_tm > deadline:
+                break
+            if task_info.hops >= MAX_HOPS:
+                kept.append(dispatcher.pending_tasks.popleft())
+                continue
+            address = self.__choose_neighbor(task_info)
+            if address is None:
+                break
+            dispatcher.pending_tasks.popleft()
+            info = self.neighbors[address]
+            info.in_flight += 1
+            info.forwarded.add(task_uuid)
+            task_info.status = TaskStatus.forwarded_to_dispatcher
+            task_info.calculator_address = address
+            task_info.placement_tm = current_tm
+            heapq.heappush(
+                self.forwarded_deadlines, (current_tm + self.forwarded_timeout, task_uuid)
+            )
+            batches.setdefault(address, []).append(task_uuid)
+        dispatcher.pending_tasks.extendleft(reversed(kept))
+
+        for address, task_uuids in batches.iteritems():
+            for index in range(0, len(task_uuids), dispatcher.max_batch_size):
+                self.send_tasks(
+                    address, task_uuids[index : index + dispatcher.max_batch_size]
+                )
+
+    def __choose_neighbor(self, task_info):
+        # type: (Any) -> Optional[Tuple[str, int]]
+        """ сосед с наибольшим количеством свободных слотов, кроме отправителя задачи.
+            Если задачу нельзя передать дальше соседа, учитываются только его вычислители """
+        last_hop = task_info.hops + 1 >= MAX_HOPS
+        best_address, best_free = None, 0
+        for address, info in self.neighbors.iteritems():
+            if address == task_info.forwarded_from:
+                continue
+            free = (info.local_free if last_hop else info.free) - info.in_flight
+            if free > best_free:
+                best_address, best_free = address, free
+        return best_address
+
+    def send_tasks(self, address, task_uuids):
+        # type: (Tuple[str, int], List[str]) -> None
+        tasks = []
+        for task_uuid in task_uuids:
+            task_info = self.dispatcher.tasks.get(task_uuid)
+            tasks.append(
+                {
+                    "task_uuid": task_uuid,
+                    "params": task_info.task_params,
+                    "hops": task_info.hops,
+                }
+            )
+        logger.info("Диспетчеру %s передано задач: %s", address, len(tasks))
+        self.dispatcher.net_client.send_command(
+            address,
+            {"method": "forward_tasks", "params": {"tasks": tasks}},
+            partial(self.forward_callback, task_uuids=task_uuids),
+        )
+
+    def forward_callback(self, address, transmission_id, status, task_uuids):
+        # type: (Tuple[str, int], int, int, List[str]) -> None
+        info = self.neighbors.get(address)
+        if info is not None:
+            info.in_flight = max(info.in_flight - len(task_uuids), 0)
+            if status == TransmissionStatus.failure:
+                info.free = info.local_free = 0
+                info.forwarded.difference_update(task_uuids)
+        if status == TransmissionStatus.success:
+            self.dispatcher.metrics.incr("forwarded", len(task_uuids))
+        else:
+            logger.warning("Диспетчер %s не принял задачи", address)
+            self.dispatcher.requeue_tasks(
+                task_uuids, TaskStatus.forwarded_to_dispatcher
+            )
+
+    def forget_forwarded(self, address, task_uuid):
+        # type: (Tuple[str, int], str) -> None
+        """ сосед сообщил о выполнении или снятии переданной ему задачи """
+        info = self.neighbors.get(address)
+        if info is not None:
+            info.forwarded.discard(task_uuid)
+
+    def expire_forwarded(self, current_tm):
+        # type: (float) -> None
+        """ вернуть в очередь задачи, о выполнении которых сосед не сообщил за forwarded_timeout.
+            Задача с истекшим сроком размещения снимается """
+        expired = []  # type: List[str]
+        while self.forwarded_deadlines and self.forwarded_deadlines[0][0] <= current_tm:
+            _, task_uuid = heapq.heappop(self.forwarded_deadlines)
+            task_info = self.dispatcher.tasks.get(task_uuid)
+            if (
+                task_info is None
+                or task_info.status != TaskStatus.forwarded_to_dispatcher
+                # задача возвращалась в очередь и передана снова, срок у нее новый
+                or task_info.placement_tm + self.forwarded_timeout > current_tm
+            ):
+                continue
+            logger.warning(
+                "Диспетчер %s не сообщил о выполнении задачи %s",
+                task_info.calculator_address,
+                task_uuid,
+            )
+            self.forget_forwarded(task_info.calculator_address, task_uuid)
+            expired.append(task_uuid)
+        if expired:
+            self.dispatcher.requeue_tasks(expired, TaskStatus.forwarded_to_dispatcher)
+
+    def __requeue_forwarded(self, address, info):
+        # type: (Tuple[str, int], NeighborInfo) -> None
+        if not info.forwarded:
+            return
+        logger.warning(
+            "Диспетчер %s не присылает отчеты, переданные ему задачи возвращены в очередь: %s",
+            address,
+            len(info.forwarded),
+        )
+        task_uuids = list(info.forwarded)
+        info.forwarded.clear()
+        self.dispatcher.requeue_tasks(task_uuids, TaskStatus.forwarded_to_dispatcher)
+
+    def report_finished(self, address, task_uuid, success, error=None):
+        # type: (Tuple[str, int], str, bool, Optional[str]) -> None
+        """ сообщить диспетчеру, передавшему задачу, о ее выполнении.
+            Результаты за один проход цикла событий отправляются одной командой """
+        results = self.finished.get(address)
+        if results is None:
+            results = self.finished[address] = []
+            self.dispatcher.net_client.call_later(0, self.flush_finished, address)
+        result = {"task_uuid": task_uuid, "success": success}
+        if error is not None:
+            # задача выполнена вычислителем с ошибкой
+            result["error"] = error
+        results.append(result)
+
+    def flush_finished(self, address):
+        # type: (Tuple[str, int]) -> None
+        results = self.finished.pop(address, None)
+        if results:
+            self.dispatcher.net_client.send_command(
+                address,
+                {"method": "forwarded_finished", "params": {"tasks": results}},
+                self.finished_callback,
+            )
+
+    def finished_callback(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        if status == TransmissionStatus.failure:
+            logger.error("Диспетчер %s не получил результаты переданных задач", address)
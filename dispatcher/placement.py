@@ -0,0 +1,208 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import itertools
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+try:
+    from typing import Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+
+class IReadyPool(object):
+    """ множество свободных вычислителей с политикой выбора вычислителя для задачи """
+
+    __metaclass__ = ABCMeta
+
+    name = None  # type: str
+
+    @abstractmethod
+    def add(self, address):
+        # type: (Tuple[str, int]) -> None
+        """ вычислитель стал свободен. Повторное добавление игнорируется """
+        pass
+
+    @abstractmethod
+    def discard(self, address):
+        # type: (Tuple[str, int]) -> None
+        """ вычислитель занят или недоступен """
+        pass
+
+    @abstractmethod
+    def acquire(self):
+        # type: () -> Optional[Tuple[str, int]]
+        """ извлечь вычислитель для задачи, None - свободных нет """
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        # type: () -> int
+        pass
+
+    @abstractmethod
+    def __contains__(self, address):
+        # type: (Tuple[str, int]) -> bool
+        pass
+
+    def record_latency(self, address, latency):
+        # type: (Tuple[str, int], float) -> None
+        """ время выполнения задачи вычислителем в секундах """
+        pass
+
+
+class RoundRobinPool(IReadyPool):
+    """ вычислители выбираются по очереди в порядке освобождения """
+
+    name = "round_robin"
+
+    def __init__(self):
+        # type: () -> None
+        self.ready = OrderedDict()  # type: OrderedDict[Tuple[str, int], None]
+
+    def add(self, address):
+        # type: (Tuple[str, int]) -> None
+        if address not in self.ready:
+            self.ready[address] = None
+
+    def discard(self, address):
+        # type: (Tuple[str, int]) -> None
+        self.ready.pop(address, None)
+
+    def acquire(self):
+        # type: () -> Optional[Tuple[str, int]]
+        if not self.ready:
+            return None
+        return self.ready.popitem(last=False)[0]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.ready)
+
+    def __contains__(self, address):
+        # type: (Tuple[str, int]) -> bool
+        return address in self.ready
+
+
+class _HeapPool(IReadyPool):
+    """ выбор вычислителя с наименьшим ключом.
+        Удаление из кучи ленивое: устаревшие записи пропускаются при извлечении """
+
+    def __init__(self):
+        # type: () -> None
+        self.heap = []  # type: List[Tuple[float, int, Tuple[str, int]]]
+        # адрес -> порядковый номер актуальной записи в куче
+        self.entries = {}  # type: Dict[Tuple[str, int], int]
+        self.counter = itertools.count()
+
+    @abstractmethod
+    def get_key(self, address):
+        # type: (Tuple[str, int]) -> float
+        pass
+
+    def add(self, address):
+        # type: (Tuple[str, int]) -> None
+        if address in self.entries:
+            return
+        seq = next(self.counter)
+        self.entries[address] = seq
+        heapq.heappush(self.heap, (self.get_key(address), seq, address))
+
+    def discard(self, address):
+        # type: (Tuple[str, int]) -> None
+        if self.entries.pop(address, None) is not None:
+            self.__compact()
+
+    def acquire(self):
+        # type: () -> Optional[Tuple[str, int]]
+        while self.heap:
+            _, seq, address = heapq.heappop(self.heap)
+            if self.entries.get(address) == seq:
+                del self.entries[address]
+                return address
+        return None
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.entries)
+
+    def __contains__(self, address):
+        # type: (Tuple[str, int]) -> bool
+        return address in self.entries
+
+    def __compact(self):
+        # type: () -> None
+        """ перестроить кучу, если устаревших записей стало больше актуальных """
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [
+                entry for entry in self.heap if self.entries.get(entry[2]) == entry[1]
+            ]
+            heapq.heapify(self.heap)
+
+
+class LruPool(_HeapPool):
+    """ выбирается вычислитель, который дольше всех не получал задач """
+
+    name = "lru"
+
+    def __init__(self):
+        # type: () -> None
+        super(LruPool, self).__init__()
+        self.last_used_tm = {}  # type: Dict[Tuple[str, int], float]
+
+    def get_key(self, address):
+        # type: (Tuple[str, int]) -> float
+        return self.last_used_tm.get(address, 0.0)
+
+    def acquire(self):
+        # type: () -> Optional[Tuple[str, int]]
+        address = super(LruPool, self).acquire()
+        if address is not None:
+            self.last_used_tm[address] = time.time()
+        return address
+
+
+class LatencyPool(_HeapPool):
+    """ выбирается вычислитель с наименьшим средним временем выполнения задачи.
+        Вычислители без измерений выбираются в первую очередь """
+
+    name = "latency"
+
+    def __init__(self, alpha=0.2):
+        # type: (float) -> None
+        super(LatencyPool, self).__init__()
+        # вес нового измерения в скользящем среднем
+        self.alpha = alpha
+        self.latency = {}  # type: Dict[Tuple[str, int], float]
+
+    def get_key(self, address):
+        # type: (Tuple[str, int]) -> float
+        return self.latency.get(address, 0.0)
+
+    def record_latency(self, address, latency):
+        # type: (Tuple[str, int], float) -> None
+        average = self.latency.get(address)
+        if average is None:
+            self.latency[address] = latency
+        else:
+            self.latency[address] = average + self.alpha * (latency - average)
+
+
+PLACEMENT_POLICIES = dict(
+    (pool.name, pool) for pool in (RoundRobinPool, LruPool, LatencyPool)
+)
+
+
+def create_ready_pool(policy):
+    # type: (str) -> IReadyPool
+    try:
+        return PLACEMENT_POLICIES[policy]()
+    except KeyError:
+        raise ValueError(
+            "Неизвестная политика размещения {}, допустимые: {}".format(
+                policy, ", ".join(sorted(PLACEMENT_POLICIES))
+            )
+        )
@@ -0,0 +1,141 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+from collections import OrderedDict
+
+from entities import TaskStatus
+
+try:
+    from typing import Dict, Iterator, List, Optional, Tuple
+except ImportError:
+    pass
+
+# статусы задач, ожидающих размещения на вычислителе
+PLACEMENT_STATUSES = (
+    TaskStatus.accepted_from_client,
+    TaskStatus.error_accepted_calculator,
+)
+
+# статусы задач, отправленных вычислителю
+EXECUTION_STATUSES = (
+    TaskStatus.sent_to_calculator,
+    TaskStatus.accepted_for_execution_calculator,
+)
+
+
+class TaskInfo(object):
+    __slots__ = (
+        "client_address",
+        "calculator_address",
+        "status",
+        "task_params",
+        "created_tm",
+        "placement_tm",
+        "home_shard",
+        "forwarded_from",
+        "hops",
+    )
+
+    def __init__(self):
+        # type: () -> None
+        self.client_address = None  # type: Optional[Tuple[str, int]]
+        self.calculator_address = None  # type: Optional[Tuple[str, int]]
+        self.status = None  # type: Optional[int]
+        self.task_params = None  # type: Optional[dict]
+        self.created_tm = time.time()
+        # время отправки задачи вычислителю
+        self.placement_tm = None  # type: Optional[float]
+        # адрес шарда, принявшего задачу от клиента, если задача передана этому шарду
+        self.home_shard = None  # type: Optional[Tuple[str, int]]
+        # адрес диспетчера, передавшего задачу, и сколько раз задача передавалась между диспетчерами
+        self.forwarded_from = None  # type: Optional[Tuple[str, int]]
+        self.hops = 0
+
+
+class TaskRegistry(object):
+    """ реестр задач диспетчера.
+        Завершенные задачи заменяются компактной записью (статус, время завершения),
+        которая нужна только для отсева повторных add_task и completed_task.
+        Такие записи удаляются через ttl секунд или при превышении max_finished.
+        Незавершенная задача старше max_age считается потерянной и завершается с ошибкой """
+
+    def __init__(self, ttl=300.0, max_finished=100000, max_age=3600.0):
+        # type: (float, int, float) -> None
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.max_age = max_age
+        self.active = {}  # type: Dict[str, TaskInfo]
+        # task_uuid -> (статус, время завершения), упорядочены по времени завершения
+        self.finished = OrderedDict()  # type: OrderedDict[str, Tuple[int, float]]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.active)
+
+    def __contains__(self, task_uuid):
+        # type: (str) -> bool
+        return task_uuid in self.active or task_uuid in self.finished
+
+    def __iter__(self):
+        # type: () -> Iterator[str]
+        return iter(self.active)
+
+    def get(self, task_uuid):
+        # type: (str) -> Optional[TaskInfo]
+        """ незавершенная задача """
+        return self.active.get(task_uuid)
+
+    def get_status(self, task_uuid):
+        # type: (str) -> Optional[int]
+        task_info = self.active.get(task_uuid)
+        if task_info is not None:
+            return task_info.status
+        record = self.finished.get(task_uuid)
+        return record[0] if record else None
+
+    def add(self, task_uuid, task_info):
+        # type: (str, TaskInfo) -> None
+        self.finished.pop(task_uuid, None)
+        self.active[task_uuid] = task_info
+
+    def finish(self, task_uuid, status):
+        # type: (str, int) -> None
+        """ перевести задачу в завершенные """
+        task_info = self.active.pop(task_uuid, None)
+        if task_info is None:
+            return
+        task_info.status = status
+        self.finished[task_uuid] = (status, time.time())
+        while len(self.finished) > self.max_finished:
+            self.finished.popitem(last=False)
+
+    def expire(self, current_tm=None):
+        # type: (Optional[float]) -> int
+        """ удалить завершенные задачи старше ttl, возвращает количество удаленных """
+        if current_tm is None:
+            current_tm = time.time()
+        count = 0
+        while self.finished:
+            task_uuid = next(iter(self.finished))
+            if current_tm - self.finished[task_uuid][1] < self.ttl:
+                break
+            del self.finished[task_uuid]
+            count += 1
+        return count
+
+    def expire_active(self, current_tm=None):
+        # type: (Optional[float]) -> List[Tuple[str, TaskInfo]]
+        """ завершить со статусом error_lost незавершенные задачи старше max_age.
+            Обходит все незавершенные задачи, поэтому вызывается редко.
+            Возвращает завершенные задачи """
+        if current_tm is None:
+            current_tm = time.time()
+        expired = [
+            (task_uuid, task_info)
+            for task_uuid, task_info in self.active.iteritems()
+            if current_tm - task_info.created_tm >= self.max_age
+        ]
+        for task_uuid, _ in expired:
+            self.finish(task_uuid, TaskStatus.error_lost)
+        return expired
@@ -0,0 +1,264 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from functools import partial
+
+from entities import TaskStatus
+from net_protocol import ResponseConfirmation, TransmissionStatus
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+    from net_protocol import INetClient
+    from net_protocol.event_loop import TimerHandle
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+class ShardLink(object):
+    """ связь шарда диспетчера с остальными шардами.
+        Шарды слушают общий порт с SO_REUSEPORT, ядро закрепляет каждого клиента и вычислитель
+        за одним шардом. Команды между шардами идут через отдельный сетевой клиент на порту
+        peer_port + номер шарда, его цикл событий работает в своем потоке, а обработка
+        передается в цикл событий диспетчера.
+
+        Шард со свободными слотами и пустой очередью раз в steal_interval просит задачи
+        у следующего шарда (steal_tasks), тот отдает неразмещенные задачи из конца очереди
+        (transfer_tasks). О выполнении переданной задачи получатель сообщает шарду,
+        принявшему ее от клиента (shard_finished), и уже он отвечает клиенту.
+        Если получатель не сообщил о задаче за transfer_timeout, она возвращается в очередь """
+
+    def __init__(
+        self,
+        dispatcher,
+        net_client_class,
+        index,
+        shards,
+        peer_port,
+        steal_interval=0.2,
+        transfer_timeout=None,
+        **net_client_config
+    ):
+        # type: (Any, INetClient, int, int, int, float, Optional[float], **Any) -> None
+        self.dispatcher = dispatcher
+        self.index = index
+        self.address = ("127.0.0.1", peer_port + index)
+        self.peers = [
+            ("127.0.0.1", peer_port + peer_index)
+            for peer_index in range(shards)
+            if peer_index != index
+        ]  # type: List[Tuple[str, int]]
+        self.net_client = net_client_class(self.address, **net_client_config)
+        self.net_client.add_handler_request(self.handle_message)
+        self.thread = None  # type: Optional[threading.Thread]
+
+        self.steal_interval = steal_interval
+        self.steal_timer = None  # type: Optional[TimerHandle]
+        self.next_peer = 0
+        # запрос задач отправлен, подтверждение еще не получено
+        self.steal_in_progress = False
+        # шард-владелец -> результаты переданных задач, ожидающие отправки одной командой
+        self.finished = {}  # type: Dict[Tuple[str, int], List[dict]]
+        # получатель снимает задачу, не размещенную за timeout_task_placement, и сообщает об этом.
+        # Дольше ждать результата нельзя: сообщение могло потеряться, шард - перезапуститься
+        self.transfer_timeout = (
+            transfer_timeout or 2 * dispatcher.timeout_task_placement
+        )  # type: float
+        # куча (срок ожидания результата, task_uuid) переданных задач
+        self.transfer_deadlines = []  # type: List[Tuple[float, str]]
+
+    def start(self):
+        # type: () -> None
+        self.thread = threading.Thread(
+            target=self.net_client.serve_forever, name="shard-link"
+        )
+        self.thread.daemon = True
+        self.thread.start()
+        self.steal_timer = self.dispatcher.net_client.call_repeatedly(
+            self.steal_interval, self.steal
+        )
+
+    def shutdown(self):
+        # type: () -> None
+        if self.steal_timer:
+            self.steal_timer.cancel()
+        self.net_client.shutdown()
+
+    def call_in_dispatcher(self, func, *args):
+        # type: (Callable, *Any) -> None
+        """ передать вызов в цикл событий диспетчера, владеющий его состоянием """
+        self.dispatcher.net_client.call_later(0, func, *args)
+
+    def handle_message(self, address, message):
+        # type: (Tuple[str, int], dict) -> ResponseConfirmation
+        """ вызывается в потоке сетевого клиента шардов """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("шард: %s data: %s", address, message)
+        method = message["method"]
+        params = message["params"]
+        if method == "steal_tasks":
+            self.call_in_dispatcher(self.give_tasks, address, int(params["count"]))
+        elif method == "transfer_tasks":
+            self.call_in_dispatcher(
+                self.dispatcher.accept_transferred_tasks, address, params["tasks"]
+            )
+        elif method == "shard_finished":
+            self.call_in_dispatcher(
+                self.dispatcher.finish_transferred_tasks, params["tasks"]
+            )
+        else:
+            logger.warning("Неизвестная команда %s от шарда %s", method, address)
+            return None
+        return ResponseConfirmation(data=None)
+
+    def steal(self):
+        # type: () -> None
+        """ запросить задачи у следующего шарда, если своих задач нет, а слоты свободны """
+        if self.steal_in_progress or not self.peers or self.dispatcher.pending_tasks:
+            return
+        free_slots = self.dispatcher.get_free_slots()
+        if free_slots <= 0:
+            return
+        peer = self.peers[self.next_peer % len(self.peers)]
+        self.next_peer += 1
+        self.steal_in_progress = True
+        self.net_client.send_command(
+            peer,
+            {
+                "method": "steal_tasks",
+                "params": {"count": min(free_slots, self.dispatcher.max_batch_size)},
+            },
+            self.steal_callback,
+        )
+
+    def steal_callback(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        self.call_in_dispatcher(self.__finish_steal)
+
+    def __finish_steal(self):
+        # type: () -> None
+        self.steal_in_progress = False
+
+    def give_tasks(self, address, count):
+        # type: (Tuple[str, int], int) -> None
+        """ отдать шарду address до count неразмещенных задач """
+        tasks = self.dispatcher.take_pending_tasks(count)
+        if not tasks:
+            return
+        logger.info("Шарду %s передано задач: %s", address, len(tasks))
+        task_uuids = [task["task_uuid"] for task in tasks]
+        deadline = time.time() + self.transfer_timeout
+        for task_uuid in task_uuids:
+            heapq.heappush(self.transfer_deadlines, (deadline, task_uuid))
+        self.net_client.send_command(
+            address,
+            {"method": "transfer_tasks", "params": {"tasks": tasks}},
+            partial(self.transfer_callback, task_uuids=task_uuids),
+        )
+
+    def transfer_callback(self, address, transmission_id, status, task_uuids):
+        # type: (Tuple[str, int], int, int, List[str]) -> None
+        self.call_in_dispatcher(
+            self.dispatcher.transfer_tasks_callback, task_uuids, status
+        )
+
+    def expire_transferred(self, current_tm):
+        # type: (float) -> None
+        """ вернуть в очередь задачи, о выполнении которых шард не сообщил за transfer_timeout.
+            Задача с истекшим сроком размещения снимается, поздний shard_finished игнорируется """
+        expired = []  # type: List[str]
+        while self.transfer_deadlines and self.transfer_deadlines[0][0] <= current_tm:
+            _, task_uuid = heapq.heappop(self.transfer_deadlines)
+            task_info = self.dispatcher.tasks.get(task_uuid)
+            if (
+                task_info is None
+                or task_info.status != TaskStatus.transferred_to_shard
+                # задача возвращалась в очередь и передана снова, срок у нее новый
+                or task_info.placement_tm + self.transfer_timeout > current_tm
+            ):
+                continue
+            expired.append(task_uuid)
+        if expired:
+            logger.warning(
+                "Шарды не сообщили о выполнении переданных задач, возвращено в очередь: %s",
+                len(expired),
+            )
+            self.dispatcher.requeue_tasks(expired, TaskStatus.transferred_to_shard)
+
+    def report_finished(self, home_shard, task_uuid, success, error=None):
+        # type: (Tuple[str, int], str, bool, Optional[str]) -> None
+        """ сообщить шарду-владельцу о выполнении задачи.
+            Результаты за один проход цикла событий отправляются одной командой """
+        results = self.finished.get(home_shard)
+        if results is None:
+            results = self.finished[home_shard] = []
+            self.dispatcher.net_client.call_later(0, self.flush_finished, home_shard)
+        result = {"task_uuid": task_uuid, "success": success}
+        if error is not None:
+            # задача выполнена вычислителем с ошибкой
+            result["error"] = error
+        results.append(result)
+
+    def flush_finished(self, home_shard):
+        # type: (Tuple[str, int]) -> None
+        results = self.finished.pop(home_shard, None)
+        if results:
+            self.net_client.send_command(
+                home_shard,
+                {"method": "shard_finished", "params": {"tasks": results}},
+                self.report_callback,
+            )
+
+    def report_callback(self, address, transmission_id, status):
+        # type: (Tuple[str, int], int, int) -> None
+        if status == TransmissionStatus.failure:
+            logger.error("Шард %s не получил результаты переданных задач", address)
+
+
+def _run_shard(dispatcher_class, net_client_class, address, index, shards, kwargs):
+    # type: (Callable, INetClient, Tuple[str, int], int, int, dict) -> None
+    # Ctrl+C получает вся группа процессов, шард останавливается сам
+    dispatcher_class(
+        net_client_class, address, shard_index=index, shards=shards, **kwargs
+    ).start()
+
+
+def run_shards(dispatcher_class, net_client_class, address, shards, **kwargs):
+    # type: (Callable, INetClient, Tuple[str, int], int, **Any) -> None
+    """ запустить shards процессов диспетчера на общем порту и дождаться их завершения """
+    processes = [
+        multiprocessing.Process(
+            target=_run_shard,
+            args=(dispatcher_class, net_client_class, address, index, shards, kwargs),
+            name="dispatcher-shard-{}".format(index),
+        )
+        for index in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    logger.info("Запущено шардов диспетчера: %s", shards)
+
+    def terminate(signum, frame):
+        for shard in processes:
+            if shard.is_alive():
+                shard.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            # join без таймаута в Python 2 не прерывается по Ctrl+C
+            while process.is_alive():
+                process.join(1.0)
+    except KeyboardInterrupt:
+        logger.info("Ctrl+C Pressed. Waiting for shards.")
+        for process in processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,219 @@
+# coding: utf8
+from __future__ import print_function
+
+import logging
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from entities import CalculatorStatus
+from metrics import LatencyHistogram
+
+try:
+    from typing import Any, Callable, Dict, List, Tuple
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+CALCULATOR_STATE_NAMES = {
+    CalculatorStatus.ready: "ready",
+    CalculatorStatus.busy: "busy",
+    CalculatorStatus.not_available: "not_available",
+}
+
+# этапы прохождения задачи через диспетчер
+LATENCY_STAGES = (
+    # accepted_from_client -> sent_to_calculator
+    "placement",
+    # sent_to_calculator -> solved
+    "execution",
+    # accepted_from_client -> sent_to_client
+    "total",
+)
+
+PERCENTS = (50, 90, 99, 99.9)
+
+
+class DispatcherMetrics(object):
+    """ счетчики задач, время этапов задачи и время обработчиков по методам """
+
+    def __init__(self):
+        # type: () -> None
+        self.lock = threading.Lock()
+        self.counters = dict(
+            (name, 0)
+            for name in (
+                "accepted",
+                "duplicates",
+                "solved",
+                # задачи, выполнение которых завершилось ошибкой
+                "failed",
+                "requeued",
+                "expired",
+                # задачи, снятые по максимальному возрасту
+                "lost",
+                # задачи, полученные от других шардов и переданные им
+                "stolen",
+                "transferred",
+                # задачи, полученные от соседних диспетчеров и переданные им
+                "forwarded_in",
+                "forwarded",
+            )
+        )  # type: Dict[str, int]
+        self.latency = dict(
+            (stage, LatencyHistogram()) for stage in LATENCY_STAGES
+        )  # type: Dict[str, LatencyHistogram]
+        self.handler_time = {}  # type: Dict[str, LatencyHistogram]
+
+    def incr(self, name, count=1):
+        # type: (str, int) -> None
+        with self.lock:
+            self.counters[name] += count
+
+    def record_latency(self, stage, value):
+        # type: (str, float) -> None
+        self.latency[stage].record(value)
+
+    def record_handler_time(self, method, value):
+        # type: (str, float) -> None
+        histogram = self.handler_time.get(method)
+        if histogram is None:
+            with self.lock:
+                histogram = self.handler_time.setdefault(method, LatencyHistogram())
+        histogram.record(value)
+
+    def get_stats(self):
+        # type: () -> Dict[str, Any]
+        with self.lock:
+            counters = dict(self.counters)
+            handler_time = dict(self.handler_time)
+        return {
+            "tasks": counters,
+            "latency": dict(
+                (stage, histogram.get_stats(PERCENTS))
+                for stage, histogram in self.latency.iteritems()
+            ),
+            "handlers": dict(
+                (method, histogram.get_stats(PERCENTS))
+                for method, histogram in handler_time.iteritems()
+            ),
+        }
+
+
+def render_prometheus(stats):
+    # type: (Dict[str, Any]) -> str
+    """ статистика диспетчера в текстовом формате Prometheus """
+    lines = []  # type: List[str]
+
+    def add(name, value, **labels):
+        if labels:
+            name += "{{{}}}".format(
+                ",".join(
+                    '{}="{}"'.format(key, value)
+                    for key, value in sorted(labels.iteritems())
+                )
+            )
+        lines.append("{} {}".format(name, value))
+
+    def add_summary(name, histogram_stats, **labels):
+        for percent in PERCENTS:
+            value = histogram_stats.get("p{}".format(percent))
+            if value is not None:
+                add(name, value, quantile=percent / 100.0, **labels)
+        add(name + "_sum", histogram_stats["sum"], **labels)
+        add(name + "_count", histogram_stats["count"], **labels)
+
+    lines.append("# TYPE dispatcher_shard gauge")
+    add("dispatcher_shard", stats["shard"])
+    lines.append("# TYPE dispatcher_pending_tasks gauge")
+    add("dispatcher_pending_tasks", stats["pending_tasks"])
+    lines.append("# TYPE dispatcher_active_tasks gauge")
+    add("dispatcher_active_tasks", stats["active_tasks"])
+    lines.append("# TYPE dispatcher_calculators gauge")
+    for state, count in sorted(stats["calculators"].iteritems()):
+        add("dispatcher_calculators", count, state=state)
+    lines.append("# TYPE dispatcher_suspected_calculators gauge")
+    add("dispatcher_suspected_calculators", stats["suspected_calculators"])
+    lines.append("# TYPE dispatcher_status_polls_total counter")
+    add("dispatcher_status_polls_total", stats["status_polls"])
+    lines.append("# TYPE dispatcher_tasks_total counter")
+    for event, count in sorted(stats["tasks"].iteritems()):
+        add("dispatcher_tasks_total", count, event=event)
+    lines.append("# TYPE dispatcher_task_latency_seconds summary")
+    for stage, histogram_stats in sorted(stats["latency"].iteritems()):
+        add_summary("dispatcher_task_latency_seconds", histogram_stats, stage=stage)
+    lines.append("# TYPE dispatcher_handler_seconds summary")
+    for method, histogram_stats in sorted(stats["handlers"].iteritems()):
+        add_summary("dispatcher_handler_seconds", histogram_stats, method=method)
+
+    federation_stats = stats.get("federation")
+    if federation_stats:
+        lines.append("# TYPE dispatcher_federation_neighbors gauge")
+        add("dispatcher_federation_neighbors", federation_stats["neighbors"])
+        lines.append("# TYPE dispatcher_federation_free_slots gauge")
+        add("dispatcher_federation_free_slots", federation_stats["free"])
+
+    net_stats = stats["net"]
+    lines.append("# TYPE dispatcher_net_pending_commands gauge")
+    add("dispatcher_net_pending_commands", net_stats["pending"])
+    lines.append("# TYPE dispatcher_net_backlog_datagrams gauge")
+    add("dispatcher_net_backlog_datagrams", net_stats["backlog"])
+    lines.append("# TYPE dispatcher_net_commands_total counter")
+    for peer, peer_stats in sorted(net_stats["peers"].iteritems()):
+        for event, count in sorted(peer_stats.iteritems()):
+            add("dispatcher_net_commands_total", count, peer=peer, event=event)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHttpServer(object):
+    """ HTTP-сервер, отдающий статистику в формате Prometheus по GET /metrics.
+        Работает в отдельном потоке, get_stats вызывается при каждом запросе """
+
+    def __init__(self, address, get_stats):
+        # type: (Tuple[str, int], Callable[[], Dict[str, Any]]) -> None
+        self.get_stats = get_stats
+        self.server = HTTPServer(address, self.__create_handler_class())
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics-http"
+        )
+        self.thread.daemon = True
+
+    def start(self):
+        # type: () -> None
+        self.thread.start()
+        logger.info(
+            "Статистика доступна по адресу http://%s:%s/metrics",
+            *self.server.server_address
+        )
+
+    def shutdown(self):
+        # type: () -> None
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __create_handler_class(self):
+        # type: () -> type
+        get_stats = self.get_stats
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                # noinspection PyBroadException
+                try:
+                    body = render_prometheus(get_stats())
+                except:
+                    logger.exception("Ошибка при формировании статистики")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("HTTP %s: " + format, self.client_address, *args)
+
+        return MetricsHandler
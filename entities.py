@@ -32,3 +32,11 @@ class TaskStatus(object):
     sent_to_client = 8
     # решена, клиент получил от диспетчера выполненную задачу
     resolved = 9
+    # передана другому шарду диспетчера
+    transferred_to_shard = 10
+    # передана соседнему диспетчеру
+    forwarded_to_dispatcher = 11
+    # вычислитель сообщил об ошибке выполнения, получена диспетчером
+    error_execution = 12
+    # задача не завершилась за максимальный возраст, запись о ней снята диспетчером
+    error_lost = 13
@@ -0,0 +1,146 @@
+# coding: utf8
+from __future__ import print_function
+
+import threading
+import time
+
+try:
+    from typing import Any, Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+
+class LatencyHistogram(object):
+    """ гистограмма времени в стиле HDR Histogram.
+        Значения хранятся в микросекундах в логарифмических корзинах,
+        каждая из которых делится на sub_buckets линейных частей.
+        Относительная погрешность не больше 2 / sub_buckets, запись за O(1) """
+
+    def __init__(self, sub_bucket_bits=7):
+        # type: (int) -> None
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.half = self.sub_buckets >> 1
+        self.counts = []  # type: List[int]
+        self.count = 0
+        self.total = 0.0
+        self.min = None  # type: Optional[float]
+        self.max = None  # type: Optional[float]
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        # type: (float) -> None
+        """ добавить значение в секундах """
+        index = self.__get_index(max(int(value * 1e6), 0))
+        with self.lock:
+            if index >= len(self.counts):
+                self.counts.extend([0] * (index + 1 - len(self.counts)))
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        # type: (float) -> Optional[float]
+        """ значение в секундах, не больше которого percent процентов значений """
+        with self.lock:
+            if not self.count:
+                return None
+            rank = max(int(self.count * percent / 100.0 + 0.5), 1)
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    # середина корзины, но не за пределами наблюдаемых значений
+                    low, high = self.__get_bounds(index)
+                    value = (low + high) / 2.0 / 1e6
+                    return min(max(value, self.min), self.max)
+            return self.max
+
+    def mean(self):
+        # type: () -> Optional[float]
+        with self.lock:
+            return self.total / self.count if self.count else None
+
+    def get_stats(self, percents=(50, 90, 99, 99.9)):
+        # type: (Tuple[float, ...]) -> Dict[str, Any]
+        """ количество, сумма, среднее, максимум и перцентили в секундах """
+        stats = {"count": self.count, "sum": self.total}  # type: Dict[str, Any]
+        if self.count:
+            stats["mean"] = self.mean()
+            stats["max"] = self.max
+            for percent in percents:
+                stats["p{}".format(percent)] = self.percentile(percent)
+        return stats
+
+    def __get_index(self, value):
+        # type: (int) -> int
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_buckets + (shift - 1) * self.half + (value >> shift) - self.half
+
+    def __get_bounds(self, index):
+        # type: (int) -> Tuple[int, int]
+        """ границы корзины в микросекундах [low, high) """
+        if index < self.sub_buckets:
+            return index, index + 1
+        shift = (index - self.sub_buckets) // self.half + 1
+        sub_index = (index - self.sub_buckets) % self.half + self.half
+        return sub_index << shift, (sub_index + 1) << shift
+
+
+class RateMeter(object):
+    """ количество событий по секундам за последние max_window секунд,
+        запись за O(1). Текущая неполная секунда в расчет скорости не входит """
+
+    def __init__(self, max_window=61):
+        # type: (int) -> None
+        self.max_window = max_window
+        self.buckets = [0] * max_window
+        self.seconds = [0] * max_window
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def mark(self, count=1, current_tm=None):
+        # type: (int, Optional[float]) -> None
+        second = int(current_tm if current_tm is not None else time.time())
+        index = second % self.max_window
+        with self.lock:
+            if self.seconds[index] != second:
+                self.seconds[index] = second
+                self.buckets[index] = 0
+            self.buckets[index] += count
+            self.total += count
+
+    def rate(self, window, current_tm=None):
+        # type: (int, Optional[float]) -> float
+        """ среднее количество событий в секунду за последние window полных секунд """
+        window = min(window, self.max_window - 1)
+        second = int(current_tm if current_tm is not None else time.time())
+        count = 0
+        with self.lock:
+            for offset in range(1, window + 1):
+                index = (second - offset) % self.max_window
+                if self.seconds[index] == second - offset:
+                    count += self.buckets[index]
+        return count / float(window)
+
+
+def format_percentiles(histogram, percents=(50, 90, 99, 99.9)):
+    # type: (LatencyHistogram, Tuple[float, ...]) -> str
+    return " ".join(
+        "p{}={:.3f}".format(percent, histogram.percentile(percent))
+        for percent in percents
+    )
+
+
+def format_rates(meter, windows=(1, 10, 60)):
+    # type: (RateMeter, Tuple[int, ...]) -> str
+    return " ".join(
+        "{}с={:.1f}/с".format(window, meter.rate(window)) for window in windows
+    )
+
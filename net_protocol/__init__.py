@@ -2,3 +2,5 @@
 from .client import NetClient
 from .client_interface import INetClient
 from .net_proto import ResponseConfirmation, TransmissionStatus
+from .resolver import AddressResolver, default_resolver, resolve_address
+from .codec import BinaryCodec, CodecError, ICodec, JsonCodec, get_codec
@@ -1,131 +1,486 @@
 # coding: utf8
 from __future__ import print_function
 
-import json
 import logging
 import socket
+import sys
 import threading
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 from .client_interface import INetClient
-from .net_proto import NetCommand, PacketType, ResponseConfirmation, TransmissionStatus
+from .codec import CODECS, CodecError, detect_codec, get_codec
+from .datagram_io import create_datagram_io
+from .event_loop import (
+    EVENT_READ,
+    EVENT_WRITE,
+    Poller,
+    TimerHandle,
+    TimerScheduler,
+    Waker,
+)
+from .executor import HandlerExecutor
+from .fragmentation import Fragmenter, Reassembler, is_fragment
+from .net_proto import (
+    MSG_FIELD_ACKS,
+    MSG_FIELD_PACKET_TYPE,
+    MSG_FIELD_TRANSMISSION_ID,
+    NetCommand,
+    PacketType,
+    ResponseConfirmation,
+    TransmissionIdGenerator,
+    TransmissionStatus,
+)
+from .pending import PendingCommands, PendingLimitExceeded
+from .resolver import AddressResolver, default_resolver
+from .retransmit import RtoEstimator
 
 try:
-    from typing import Optional, Callable, Tuple, Any, Dict
+    from typing import Optional, Callable, Tuple, Any, Dict, List
+    from .codec import ICodec
+    from .datagram_io import IDatagramIO
 except ImportError:
     pass
 
 logger = logging.getLogger(__name__)
 
-MSG_FIELD_PACKET_TYPE = "packet_type"
-MSG_FIELD_TRANSMISSION_ID = "transmission_id"
+# максимальное количество подтверждаемых команд в одном пакете, защита от некорректных пакетов
+MAX_ACK_IDS = 65536
+
+# в Python 2.7 константы нет, значение для Linux
+SO_REUSEPORT = getattr(
+    socket, "SO_REUSEPORT", 15 if sys.platform.startswith("linux") else None
+)
+
+
+class PeerStats(object):
+    """ счетчики команд, отправленных на один адрес """
+
+    __slots__ = ("sent", "retransmitted", "confirmed", "failed", "rejected")
+
+    def __init__(self):
+        # type: () -> None
+        self.sent = 0
+        self.retransmitted = 0
+        self.confirmed = 0
+        # истекли попытки отправки
+        self.failed = 0
+        # не поставлены в очередь из-за ее переполнения
+        self.rejected = 0
+
+    def as_dict(self):
+        # type: () -> Dict[str, int]
+        return dict((name, getattr(self, name)) for name in self.__slots__)
 
 
 class NetClient(INetClient):
     def __init__(self, address, **kwargs):
         # type: (Tuple[str, int], **Any) -> None
         self.addr = address  # type: Tuple[str, int]
-        self.timeout = kwargs.get("timeout", 0.05)  # type: float
         self.max_attempts = kwargs.get("max_attempts", 3)  # type: int
+        # максимальное число команд, отправляемых за один проход планировщика
+        self.send_budget = kwargs.get("send_budget", 256)  # type: int
+        # таймаут повторной отправки, пока для адреса нет измерений RTT
+        self.retransmit_interval = kwargs.get("retransmit_interval", 0.2)  # type: float
+        # относительный разброс таймаута повторной отправки
+        self.backoff_jitter = kwargs.get("backoff_jitter", 0.1)  # type: float
+        self.rto_estimator = RtoEstimator(
+            self.retransmit_interval,
+            kwargs.get("min_rto", 0.05),
+            kwargs.get("max_rto", 5.0),
+        )
 
+        # формат исходящих пакетов, входящие декодируются в формате отправителя
+        self.codec = get_codec(kwargs.get("codec", "json"))  # type: ICodec
+        self.codecs = dict(
+            (name, get_codec(name)) for name in CODECS
+        )  # type: Dict[str, ICodec]
+        # размер буфера приема, максимальный размер UDP-датаграммы 65507 байт
+        self.recv_buffer_size = kwargs.get("recv_buffer_size", 65535)  # type: int
+        # размер буферов сокета в ядре, None - значение по умолчанию ОС
+        self.socket_rcvbuf = kwargs.get("socket_rcvbuf")  # type: Optional[int]
+        self.socket_sndbuf = kwargs.get("socket_sndbuf")  # type: Optional[int]
+        # несколько процессов слушают один порт, ядро распределяет отправителей между ними
+        self.reuse_port = kwargs.get("reuse_port", False)  # type: bool
+        # способ ввода-вывода: drain или mmsg (recvmmsg/sendmmsg)
+        self.io_backend = kwargs.get("io_backend", "drain")  # type: str
+        # максимальное число датаграмм, читаемых или отправляемых за один системный вызов
+        self.io_batch_size = kwargs.get("io_batch_size", 32)  # type: int
+        self.datagram_io = None  # type: Optional[IDatagramIO]
+        # датаграммы, не отправленные из-за переполнения буфера сокета
+        self.backlog = deque()  # type: deque
+        self.max_backlog = kwargs.get("max_backlog", 65536)  # type: int
+        # сообщения больше mtu разбиваются на фрагменты
+        self.fragmenter = Fragmenter(kwargs.get("mtu", 1400))
+        self.reassembler = Reassembler(
+            max_messages=kwargs.get("reassembly_max_messages", 1024),
+            timeout=kwargs.get("reassembly_timeout", 5.0),
+            max_message_size=kwargs.get("max_message_size", 1 << 20),
+        )
+        self.resolver = kwargs.get("resolver", default_resolver)  # type: AddressResolver
         self.socket = None  # type: Optional[socket.socket]
         self.is_alive = True  # type: bool
         self.handle_request_callback = self.__default_handler_request
         self.lock = threading.Lock()
-        self.cmd_dict = OrderedDict()  # type: Dict[Tuple[str, int, int],NetCommand]
+        self.pending = PendingCommands(
+            kwargs.get("max_pending", 65536)
+        )  # type: PendingCommands
+        # команды, не поставленные в очередь из-за ее переполнения
+        self.rejected = []  # type: List[NetCommand]
+        # сообщения без подтверждения, поставленные в очередь из других потоков
+        self.outgoing = []  # type: List[Tuple[Tuple[str, int], dict]]
+        # transmission_id полученных команд, подтверждение которых еще не отправлено
+        self.pending_acks = {}  # type: Dict[Tuple[str, int], List[int]]
+        # добавлять подтверждения к командам на тот же адрес
+        self.piggyback_acks = kwargs.get("piggyback_acks", True)  # type: bool
+        # статистика по адресам, при превышении max_peer_stats удаляются самые старые
+        self.peer_stats = OrderedDict()  # type: OrderedDict[Tuple[str, int], PeerStats]
+        self.max_peer_stats = kwargs.get("max_peer_stats", 1024)  # type: int
+        self.transmission_ids = TransmissionIdGenerator()
+        # обработчики команд и callback выполняются в пуле потоков, 0 - в цикле событий
+        handler_workers = kwargs.get("handler_workers", 0)  # type: int
+        self.executor = None  # type: Optional[HandlerExecutor]
+        if handler_workers:
+            self.executor = HandlerExecutor(
+                handler_workers, kwargs.get("handler_queue_size", 1024)
+            )
+        self.poller = Poller()
+        self.waker = Waker()
+        # таймеры вызываются в цикле событий
+        self.timers = TimerScheduler()
+        self.loop_thread = None  # type: Optional[threading.Thread]
+        # за прошлый проход отправлены не все команды, которым пора
+        self.send_budget_exhausted = False
         self.__create_socket()
 
     def serve_forever(self):
         # type: () -> None
-        self.is_alive = True
-        self.socket.settimeout(self.timeout)
-        while self.is_alive:
-            self.__send_commands_from_queue()
+        """ цикл событий: прием, отправка и повторная отправка команд.
+            Пробуждается по готовности сокета, по сроку повторной отправки
+            или при постановке команды в очередь из другого потока """
+        self.loop_thread = threading.current_thread()
+        if self.executor:
+            self.executor.start()
+        sock_fd = self.socket.fileno()
+        self.poller.register(sock_fd, EVENT_READ)
+        self.poller.register(self.waker.fileno(), EVENT_READ)
+        try:
+            while self.is_alive:
+                for fd, events in self.poller.poll(self.__get_poll_timeout()):
+                    if fd == sock_fd:
+                        if events & EVENT_WRITE:
+                            self.__flush_backlog()
+                        if events & EVENT_READ:
+                            self.__receive()
+                    else:
+                        self.waker.drain()
+                if not self.is_alive:
+                    break
+                self.timers.run_due()
+                self.__send_queued()
+        finally:
+            self.__close()
+
+    def __get_poll_timeout(self):
+        # type: () -> Optional[float]
+        if self.send_budget_exhausted:
+            return 0
+        with self.lock:
+            if self.outgoing or self.rejected or self.pending_acks:
+                return 0
+            next_deadline = self.pending.next_deadline()
+        deadlines = [
+            deadline
+            for deadline in (next_deadline, self.timers.next_deadline())
+            if deadline is not None
+        ]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.time(), 0)
+
+    def __receive(self):
+        # type: () -> None
+        outbox = []  # type: List[Tuple[bytes, Tuple[str, int]]]
+        for data, addr in self.datagram_io.drain():
+            # ошибка в одной датаграмме не должна останавливать цикл событий
             try:
-                data, addr = self.socket.recvfrom(1024)
-            except socket.timeout:
-                continue
-            except socket.error:
-                continue
-
-            message = self.__unpack_data(data)
-            if message is None:
-                continue
-            if not self.__check_message(message, verbose=True):
-                continue
-
-            # если это подтверждение прошлой команды
-            if message[MSG_FIELD_PACKET_TYPE] >= PacketType.response:
-                self.process_answer_confirmation(addr, message)
-                continue
-
-            # поступила новая команда
-            # noinspection PyBroadException
+                self.__process_datagram(addr, data, outbox)
+            except Exception:
+                logger.exception("Ошибка при обработке датаграммы от %s", addr)
+        # подтверждения на всю пачку входящих команд отправляются вместе
+        self.__send_datagrams(outbox)
+
+    def __send_queued(self):
+        # type: () -> None
+        """ отправить сообщения без подтверждения и команды, срок которых наступил """
+        outbox = []  # type: List[Tuple[bytes, Tuple[str, int]]]
+        with self.lock:
+            outgoing = self.outgoing
+            self.outgoing = []
+            for addr, message in outgoing:
+                self.__piggyback_acks(addr, message)
+        for addr, message in outgoing:
             try:
-                cb_result = self.handle_request_callback(addr, message)
-                if cb_result:  # отправить подтверждение команды
-                    if cb_result.data:
-                        message["result"] = cb_result.data
-                    self.confirm_message(addr, message)
-            except:
-                logger.exception(
-                    "Ошибка при вызове callback-обработчика новой команды от {}. Данные: {}".format(
-                        addr, message
-                    )
+                self.__send_command_udp(addr, message, outbox)
+            except ValueError:
+                logger.exception("Ошибка при упаковке данных без подтверждения")
+        count = self.__send_commands_from_queue(outbox)
+        # бюджет исчерпан, остальные команды отправим на следующем проходе
+        self.send_budget_exhausted = count >= self.send_budget
+        # подтверждения, которые не удалось добавить к командам, отправляются отдельно
+        with self.lock:
+            pending_acks = self.pending_acks
+            self.pending_acks = {}
+        for addr, transmission_ids in pending_acks.iteritems():
+            message = {
+                MSG_FIELD_PACKET_TYPE: PacketType.ack,
+                MSG_FIELD_ACKS: self.__pack_ack_ranges(transmission_ids),
+            }
+            self.__send_command_udp(addr, message, outbox)
+        self.__send_datagrams(outbox)
+
+    def __piggyback_acks(self, addr, message):
+        # type: (Tuple[str, int], dict) -> None
+        """ добавить к сообщению ожидающие подтверждения для того же адреса.
+            Вызывается под self.lock """
+        if self.piggyback_acks and self.pending_acks:
+            transmission_ids = self.pending_acks.pop(addr, None)
+            if transmission_ids:
+                message[MSG_FIELD_ACKS] = self.__pack_ack_ranges(transmission_ids)
+
+    @staticmethod
+    def __pack_ack_ranges(transmission_ids):
+        # type: (List[int]) -> List[int]
+        """ сжать transmission_id в диапазоны идущих подряд значений """
+        ranges = []  # type: List[int]
+        for transmission_id in sorted(set(transmission_ids)):
+            if ranges and ranges[-1] + 1 == transmission_id:
+                ranges[-1] = transmission_id
+            else:
+                ranges.extend((transmission_id, transmission_id))
+        return ranges
+
+    def __send_datagrams(self, datagrams):
+        # type: (List[Tuple[bytes, Tuple[str, int]]]) -> None
+        if not datagrams:
+            return
+        if self.backlog:
+            # сохраняем порядок: новые датаграммы после неотправленных
+            self.backlog.extend(datagrams)
+        else:
+            processed = self.datagram_io.send_batch(datagrams)
+            if processed == len(datagrams):
+                return
+            self.backlog.extend(datagrams[processed:])
+            # ждем готовности сокета к записи
+            self.poller.register(self.socket.fileno(), EVENT_READ | EVENT_WRITE)
+        while len(self.backlog) > self.max_backlog:
+            self.backlog.popleft()
+            logger.warning("Очередь неотправленных датаграмм переполнена, датаграмма отброшена")
+
+    def __flush_backlog(self):
+        # type: () -> None
+        datagrams = list(self.backlog)
+        processed = self.datagram_io.send_batch(datagrams)
+        for _ in range(processed):
+            self.backlog.popleft()
+        if not self.backlog:
+            self.poller.register(self.socket.fileno(), EVENT_READ)
+
+    def __wake(self):
+        # type: () -> None
+        """ разбудить цикл событий, если вызов произошел не из него """
+        if threading.current_thread() is not self.loop_thread:
+            self.waker.wake()
+
+    def __process_datagram(self, addr, data, outbox):
+        # type: (Tuple[str, int], bytes, List[Tuple[bytes, Tuple[str, int]]]) -> None
+        if is_fragment(data):
+            data = self.__reassemble(addr, data)
+            if data is None:
+                return
+
+        message = self.__unpack_data(data)
+        if message is None:
+            return
+        if not self.__check_message(message, verbose=True):
+            return
+
+        # подтверждения, отправленные отдельно или вместе с командой
+        acks = message.pop(MSG_FIELD_ACKS, None)
+        if acks:
+            self.__process_acks(addr, acks)
+        if message[MSG_FIELD_PACKET_TYPE] == PacketType.ack:
+            return
+
+        # если это подтверждение прошлой команды
+        if message[MSG_FIELD_PACKET_TYPE] >= PacketType.response:
+            self.process_answer_confirmation(addr, message)
+            return
+
+        # поступила новая команда
+        if self.executor is None:
+            self.__handle_request(addr, message, outbox)
+        elif not self.executor.submit(addr, self.__handle_request, addr, message):
+            # подтверждение не отправляем, отправитель повторит команду позже
+            logger.warning(
+                "Очередь обработчиков переполнена, команда от %s отброшена", addr
+            )
+
+    def __handle_request(self, addr, message, outbox=None):
+        # type: (Tuple[str, int], dict, Optional[List[Tuple[bytes, Tuple[str, int]]]]) -> None
+        # noinspection PyBroadException
+        try:
+            cb_result = self.handle_request_callback(addr, message)
+            if cb_result:  # отправить подтверждение команды
+                if cb_result.data:
+                    message["result"] = cb_result.data
+                self.confirm_message(addr, message, outbox)
+        except:
+            logger.exception(
+                "Ошибка при вызове callback-обработчика новой команды от %s. Данные: %s",
+                addr,
+                message,
+            )
+
+    def __process_acks(self, addr, acks):
+        # type: (Tuple[str, int], Any) -> None
+        if not self.__check_acks(acks):
+            logger.warning("Некорректные подтверждения от %s отброшены: %r", addr, acks)
+            return
+        for index in xrange(0, len(acks), 2):
+            for transmission_id in xrange(acks[index], acks[index + 1] + 1):
+                self.process_answer_confirmation(
+                    addr, {MSG_FIELD_TRANSMISSION_ID: transmission_id}
                 )
 
+    @staticmethod
+    def __check_acks(acks):
+        # type: (Any) -> bool
+        """ подтверждения - список пар first, last целых чисел, first <= last,
+            всего не больше MAX_ACK_IDS команд """
+        if not isinstance(acks, list) or len(acks) % 2:
+            return False
+        total = 0
+        for index in xrange(0, len(acks), 2):
+            first, last = acks[index], acks[index + 1]
+            for value in (first, last):
+                if not isinstance(value, (int, long)) or isinstance(value, bool):
+                    return False
+            if first > last:
+                return False
+            total += last - first + 1
+            if total > MAX_ACK_IDS:
+                return False
+        return True
+
     def process_answer_confirmation(self, addr, message):
         # type: (Tuple[str, int], dict) -> None
         """ обработать ответ-подтверждение """
         transmission_id = message[MSG_FIELD_TRANSMISSION_ID]
-        ckey = self.__generate_confirm_key(*addr, transmission_id=transmission_id)
-        cmd = self.cmd_dict.get(ckey)
+        # адрес отправителя подтверждения уже содержит ip, разрешать имя не нужно
+        ckey = self.__generate_confirm_key(addr, transmission_id)
+        cmd = self.pending.get(ckey)
         if cmd:
-            # noinspection PyBroadException
-            try:
-                cmd.callback(addr, transmission_id, TransmissionStatus.success)
-            except:
-                logger.exception(
-                    "Ошибка при вызове callback. Адрес: {}, данные: {}".format(
-                        addr, message
-                    )
-                )
-            else:
+            # по алгоритму Карна RTT измеряется только для команд,
+            # подтвержденных после единственной отправки
+            if cmd.attempts == 1:
+                self.rto_estimator.update(cmd.address, time.time() - cmd.sent_tm)
+            with self.lock:
+                self.__get_peer_stats(cmd.address).confirmed += 1
+            if self.executor is None:
+                if self.__call_success_callback(cmd, addr, message):
+                    with self.lock:
+                        self.__remove_cmd(ckey)
+            elif self.executor.submit(
+                addr, self.__call_success_callback, cmd, addr, message
+            ):
+                # повторное подтверждение не должно вызвать callback еще раз
                 with self.lock:
                     self.__remove_cmd(ckey)
+            else:
+                # команда остается в очереди, подтверждение придет на повторную отправку
+                logger.warning(
+                    "Очередь обработчиков переполнена, подтверждение от %s отброшено",
+                    addr,
+                )
         else:
             logger.warning(
-                "Поступило неизвестно подтверждение от {}. Данные: {}".format(
-                    addr, message
-                )
+                "Поступило неизвестно подтверждение от %s. Данные: %s", addr, message
             )
 
+    @staticmethod
+    def __call_success_callback(cmd, addr, message):
+        # type: (NetCommand, Tuple[str, int], dict) -> bool
+        # noinspection PyBroadException
+        try:
+            cmd.callback(addr, message[MSG_FIELD_TRANSMISSION_ID], TransmissionStatus.success)
+        except:
+            logger.exception(
+                "Ошибка при вызове callback. Адрес: %s, данные: %s", addr, message
+            )
+            return False
+        return True
+
     def send_command(self, address, data, callback):
         # type: (Tuple[str, int], dict, Callable) -> None
-        transmission_id = self.__generation_transmission_id()
-        ckey = self.__generate_confirm_key(*address, transmission_id=transmission_id)
+        transmission_id = self.transmission_ids.next()
+        address = self.__normalize_address(address)
+        ckey = self.__generate_confirm_key(address, transmission_id)
         cmd = NetCommand(
             address=address,
             packet_type=PacketType.request,
             transmission_id=transmission_id,
             data=data,
             callback=callback,
+            next_send_tm=time.time(),
         )
         with self.lock:
-            self.cmd_dict[ckey] = cmd
+            try:
+                self.pending.add(ckey, cmd)
+            except PendingLimitExceeded:
+                # о недоставке сообщаем из планировщика, а не из вызывающего кода
+                logger.error(
+                    "Очередь отправки переполнена, команда на адрес %s отклонена",
+                    address,
+                )
+                self.rejected.append(cmd)
+                self.__get_peer_stats(address).rejected += 1
+        self.__wake()
 
     def send_command_without_confirmation(self, addr, data):
         # type: (Tuple[str, int], dict) -> None
         try:
-            data[MSG_FIELD_PACKET_TYPE] = PacketType.no_answer
-            self.__send_command_udp(addr, data)
+            addr = self.resolver.resolve_address(addr)
         except socket.gaierror:
             logger.exception("Не могу найти диспетчера")
-        except socket.error:
-            logger.exception(
-                "Ошибка при работе с сокетом при отправке данных без подтверждения"
-            )
+            return
+        data[MSG_FIELD_PACKET_TYPE] = PacketType.no_answer
+        self.__enqueue(addr, data)
+
+    def __enqueue(self, addr, message):
+        # type: (Tuple[str, int], dict) -> None
+        """ передать сообщение на отправку циклу событий """
+        with self.lock:
+            self.outgoing.append((addr, message))
+        self.__wake()
+
+    def call_later(self, delay, func, *args):
+        # type: (float, Callable, *Any) -> TimerHandle
+        """ вызвать func в цикле событий через delay секунд """
+        return self.__schedule(time.time() + delay, None, func, args)
+
+    def call_repeatedly(self, interval, func, *args):
+        # type: (float, Callable, *Any) -> TimerHandle
+        """ вызывать func в цикле событий каждые interval секунд, первый раз через interval """
+        return self.__schedule(time.time() + interval, interval, func, args)
+
+    def __schedule(self, deadline, interval, func, args):
+        # type: (float, Optional[float], Callable, tuple) -> TimerHandle
+        handle, is_earliest = self.timers.schedule(deadline, interval, func, *args)
+        if is_earliest:
+            self.__wake()
+        return handle
 
     def add_handler_request(self, callback):
         # type: (Callable) -> None
@@ -134,30 +489,80 @@ class NetClient(INetClient):
         self.handle_request_callback = callback
 
     def __remove_cmd(self, ckey):
-        del self.cmd_dict[ckey]
+        self.pending.remove(ckey)
+
+    def __get_peer_stats(self, address):
+        # type: (Tuple[str, int]) -> PeerStats
+        """ вызывается под self.lock """
+        stats = self.peer_stats.get(address)
+        if stats is None:
+            stats = self.peer_stats[address] = PeerStats()
+            while len(self.peer_stats) > self.max_peer_stats:
+                self.peer_stats.popitem(last=False)
+        return stats
 
-    def __generate_confirm_key(self, host, port, transmission_id):
-        # type: (str, int, int) -> Tuple[str, int, int]
+    def get_fds(self):
+        # type: () -> List[int]
+        fds = [
+            self.socket.fileno(),
+            self.waker.reader.fileno(),
+            self.waker.writer.fileno(),
+        ]
+        poller_fd = self.poller.fileno()
+        if poller_fd is not None:
+            fds.append(poller_fd)
+        return fds
+
+    def get_stats(self):
+        # type: () -> Dict[str, Any]
+        with self.lock:
+            stats = {
+                "pending": len(self.pending),
+                "backlog": len(self.backlog),
+                "peers": dict(
+                    ("{}:{}".format(*address), peer.as_dict())
+                    for address, peer in self.peer_stats.iteritems()
+                ),
+            }  # type: Dict[str, Any]
+        if self.executor:
+            stats["handlers"] = self.executor.get_stats()
+        return stats
+
+    def __normalize_address(self, address):
+        # type: (Tuple[str, int]) -> Tuple[str, int]
+        """ заменить имя хоста на ip-адрес через кэш """
         try:
-            _host = socket.gethostbyname(host)
+            return self.resolver.resolve_address(address)
         except socket.error:
-            _host = host
+            return address
+
+    @staticmethod
+    def __generate_confirm_key(address, transmission_id):
+        # type: (Tuple[str, int], int) -> Tuple[str, int, int]
+        """ address должен быть нормализован: содержать ip, а не имя хоста """
         return (
-            _host,
-            port,
+            address[0],
+            address[1],
             transmission_id,
         )
 
     def __unpack_data(self, data):
-        # type: (str) -> dict
+        # type: (bytes) -> dict
         try:
-            return json.loads(data, encoding="utf-8")
-        except ValueError:
+            return detect_codec(data, self.codecs).decode(data)
+        except CodecError:
             logger.exception("Ошибка при декодировании сообщения")
 
+    def __reassemble(self, addr, data):
+        # type: (Tuple[str, int], bytes) -> Optional[bytes]
+        try:
+            return self.reassembler.add(addr, data)
+        except ValueError:
+            logger.exception("Ошибка при сборке сообщения от %s", addr)
+
     def __pack_data(self, data):
         # type: (dict) -> bytes
-        return json.dumps(data).encode("utf-8")
+        return self.codec.encode(data)
 
     def __check_message(self, message, verbose=False):
         # type: (dict, bool) -> bool
@@ -165,92 +570,164 @@ class NetClient(INetClient):
         if (packet_type is None) or (packet_type not in PacketType.get_states()):
             if verbose:
                 logger.error(
-                    "packet_type принимает неизвестное значение. Данные: {}".format(
-                        message
-                    )
+                    "packet_type принимает неизвестное значение. Данные: %s", message
                 )
             return False
 
         transmission_id = message.get(MSG_FIELD_TRANSMISSION_ID)
-        if (packet_type != PacketType.no_answer) and (transmission_id is None):
+        if (packet_type not in (PacketType.no_answer, PacketType.ack)) and (
+            transmission_id is None
+        ):
             if verbose:
-                logger.error(
-                    "Должен быть задан transmission_id. Данные: {}".format(message)
-                )
+                logger.error("Должен быть задан transmission_id. Данные: %s", message)
             return False
         return True
 
-    def __send_commands_from_queue(self):
-        # type: () -> None
+    def __send_commands_from_queue(self, outbox):
+        # type: (List[Tuple[bytes, Tuple[str, int]]]) -> int
+        """ упаковать в outbox все команды, для которых наступил срок отправки.
+            Возвращает количество обработанных команд """
         cmd_delete = []
         with self.lock:
-            for ckey, cmd in self.cmd_dict.iteritems():
+            current_tm = time.time()
+            cmd_delete.extend((None, cmd) for cmd in self.rejected)
+            self.rejected = []
+            due = self.pending.pop_due(current_tm, self.send_budget)
+            for ckey, cmd in due:
+                peer_stats = self.__get_peer_stats(cmd.address)
                 if cmd.attempts > self.max_attempts:
                     cmd_delete.append((ckey, cmd))
+                    peer_stats.failed += 1
                     continue
+                if cmd.attempts:
+                    peer_stats.retransmitted += 1
                 else:
-                    message = cmd.data.copy()
-                    if cmd.packet_type:
-                        message[MSG_FIELD_PACKET_TYPE] = cmd.packet_type
-                    if cmd.transmission_id:
-                        message[MSG_FIELD_TRANSMISSION_ID] = cmd.transmission_id
-                    try:
-                        self.__send_command_udp(cmd.address, message)
-                    except socket.error:
-                        logger.exception(
-                            "Ошибка при работе с сокетом при отправке данных на адрес {}. Данные: {}".format(
-                                cmd.address, message
-                            )
-                        )
-
-                    cmd.attempts += 1
-                    break
+                    peer_stats.sent += 1
+                message = cmd.data.copy()
+                if cmd.packet_type:
+                    message[MSG_FIELD_PACKET_TYPE] = cmd.packet_type
+                if cmd.transmission_id:
+                    message[MSG_FIELD_TRANSMISSION_ID] = cmd.transmission_id
+                self.__piggyback_acks(cmd.address, message)
+                try:
+                    self.__send_command_udp(cmd.address, message, outbox)
+                except ValueError:
+                    logger.exception(
+                        "Ошибка при отправке данных на адрес %s. Данные: %s",
+                        cmd.address,
+                        message,
+                    )
+
+                cmd.attempts += 1
+                cmd.sent_tm = current_tm
+                self.pending.reschedule(
+                    ckey,
+                    current_tm
+                    + self.rto_estimator.get_backoff(
+                        cmd.address, cmd.attempts, self.backoff_jitter
+                    ),
+                )
             # удаление команд по которым истекли попытки
             for ckey, cmd in cmd_delete:
-                self.__remove_cmd(ckey)
+                if ckey is not None:
+                    self.__remove_cmd(ckey)
 
         # вызов callback для команд по которым истекли попытки
         for ckey, cmd in cmd_delete:
-            # noinspection PyBroadException
-            try:
-                cmd.callback(
-                    cmd.address, cmd.transmission_id, TransmissionStatus.failure
-                )
-            except:
-                logger.exception("Ошибка при вызове callback о неудачной доставке")
+            if self.executor is None or not self.executor.submit(
+                cmd.address, self.__call_failure_callback, cmd
+            ):
+                self.__call_failure_callback(cmd)
+        return len(due)
+
+    @staticmethod
+    def __call_failure_callback(cmd):
+        # type: (NetCommand) -> None
+        # noinspection PyBroadException
+        try:
+            cmd.callback(cmd.address, cmd.transmission_id, TransmissionStatus.failure)
+        except:
+            logger.exception("Ошибка при вызове callback о неудачной доставке")
 
     def shutdown(self, immediate=False):
         # type: (bool) -> None
         self.is_alive = False
+        if self.loop_thread is None:
+            # цикл событий не запускался
+            self.__close()
+        else:
+            self.waker.wake()
+
+    def __close(self):
+        # type: () -> None
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            logger.info("Статистика обработчиков: %s", self.executor.get_stats())
+        self.timers.clear()
+        self.poller.close()
+        self.waker.close()
         if self.socket:
             self.socket.close()
 
-    def __send_command_udp(self, addr, message):
-        # type: (Tuple[str, int], dict) -> None
-        self.socket.sendto(self.__pack_data(message), addr)
-        logger.debug("отправлен пакет на адрес {}, данные {}".format(addr, message))
+    def __send_command_udp(self, addr, message, outbox=None):
+        # type: (Tuple[str, int], dict, Optional[List[Tuple[bytes, Tuple[str, int]]]]) -> None
+        """ упаковать сообщение и отправить сразу или добавить в пачку outbox """
+        datagrams = [
+            (datagram, addr)
+            for datagram in self.fragmenter.split(self.__pack_data(message))
+        ]
+        if outbox is None:
+            self.__send_datagrams(datagrams)
+        else:
+            outbox.extend(datagrams)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("отправлен пакет на адрес %s, данные %s", addr, message)
 
     def __create_socket(self):
         # type: () -> None
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.socket_rcvbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_rcvbuf)
+        if self.socket_sndbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_sndbuf)
+        if self.reuse_port:
+            if SO_REUSEPORT is None:
+                raise ValueError("SO_REUSEPORT не поддерживается на этой платформе")
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         # todo: тут может произойти ошибка <class 'socket.error'>, error(98, 'Address already in use')
         self.socket.bind(self.addr)
+        self.socket.setblocking(False)
+        self.datagram_io = create_datagram_io(
+            self.socket, self.recv_buffer_size, self.io_batch_size, self.io_backend
+        )
         port = self.socket.getsockname()[1]
-        logger.debug("Приложение слушает по порту {}".format(port))
+        logger.debug("Приложение слушает по порту %s", port)
 
     def __default_handler_request(self, address, message):
         # type: (Tuple[str, int], dict) -> ResponseConfirmation
         logger.warning("Обработчик запросов не зарегистрирован")
 
-    @staticmethod
-    def __generation_transmission_id():
-        # type: () -> int
-        return int(time.time() * 1000)
-
-    def confirm_message(self, addr, message):
-        # type: (Tuple[str, int], dict) -> None
+    def confirm_message(self, addr, message, outbox=None):
+        # type: (Tuple[str, int], dict, Optional[List[Tuple[bytes, Tuple[str, int]]]]) -> None
+        """ подтвердить команду. Подтверждение без результата откладывается до конца прохода
+            цикла событий: подтверждения для одного адреса объединяются в диапазоны и
+            по возможности добавляются к командам на этот адрес """
         transmission_id = message.get(MSG_FIELD_TRANSMISSION_ID)
-        if transmission_id:
-            reply_message = message.copy()
-            reply_message[MSG_FIELD_PACKET_TYPE] = PacketType.response
-            self.__send_command_udp(addr, reply_message)
+        if not transmission_id:
+            return
+        if "result" not in message:
+            with self.lock:
+                self.pending_acks.setdefault(addr, []).append(transmission_id)
+            self.__wake()
+            return
+        # ответ с результатом содержит только transmission_id и результат, без данных команды
+        reply_message = {
+            MSG_FIELD_PACKET_TYPE: PacketType.response,
+            MSG_FIELD_TRANSMISSION_ID: transmission_id,
+            "result": message["result"],
+        }
+        if outbox is None and threading.current_thread() is not self.loop_thread:
+            # подтверждение из потока обработчика отправляет цикл событий
+            self.__enqueue(addr, reply_message)
+        else:
+            self.__send_command_udp(addr, reply_message, outbox)
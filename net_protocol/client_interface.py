@@ -4,7 +4,7 @@ from abc import ABCMeta, abstractmethod
 from .net_proto import ResponseConfirmation
 
 try:
-    from typing import Callable, Tuple, Any
+    from typing import Callable, Dict, List, Tuple, Any
 except ImportError:
     pass
 
@@ -39,8 +39,35 @@ class INetClient(object):
         """ отправить команду без подтверждения """
         pass
 
+    @abstractmethod
+    def call_later(self, delay, func, *args):
+        # type: (float, Callable, *Any) -> Any
+        """ вызвать func в цикле событий через delay секунд.
+            Возвращает таймер с методом cancel """
+        pass
+
+    @abstractmethod
+    def call_repeatedly(self, interval, func, *args):
+        # type: (float, Callable, *Any) -> Any
+        """ вызывать func в цикле событий каждые interval секунд.
+            Возвращает таймер с методом cancel """
+        pass
+
     @abstractmethod
     def add_handler_request(self, callback):
         # type: (Callable[[Tuple[str, int], dict], ResponseConfirmation]) -> None
         """ добавить обработчик входящих команд """
         pass
+
+    @abstractmethod
+    def get_stats(self):
+        # type: () -> Dict[str, Any]
+        """ статистика очередей и счетчики команд по адресам """
+        pass
+
+    @abstractmethod
+    def get_fds(self):
+        # type: () -> List[int]
+        """ файловые дескрипторы клиента. Процессы, созданные fork, закрывают их,
+            чтобы не держать порт после завершения родителя """
+        pass
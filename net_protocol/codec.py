@@ -0,0 +1,315 @@
+# coding: utf8
+from __future__ import print_function
+
+import json
+import struct
+from abc import ABCMeta, abstractmethod
+
+from .net_proto import MSG_FIELD_METHOD, MSG_FIELD_PACKET_TYPE, MSG_FIELD_TRANSMISSION_ID
+
+try:
+    from typing import Any, Dict, List, Tuple
+except ImportError:
+    pass
+
+try:
+    integer_types = (int, long)  # type: ignore
+    text_type = unicode  # type: ignore
+except NameError:
+    integer_types = (int,)
+    text_type = str
+
+# максимальная вложенность списков и словарей в теле сообщения
+MAX_DEPTH = 32
+
+
+class CodecError(ValueError):
+    """ ошибка кодирования или декодирования сообщения """
+
+
+class ICodec(object):
+    __metaclass__ = ABCMeta
+
+    name = None  # type: str
+
+    @abstractmethod
+    def encode(self, message):
+        # type: (dict) -> bytes
+        pass
+
+    @abstractmethod
+    def decode(self, data):
+        # type: (bytes) -> dict
+        pass
+
+
+class JsonCodec(ICodec):
+    """ текстовый формат, удобен для отладки """
+
+    name = "json"
+
+    def encode(self, message):
+        # type: (dict) -> bytes
+        return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data):
+        # type: (bytes) -> dict
+        try:
+            message = json.loads(data.decode("utf-8"))
+        except Exception as e:
+            # в том числе RuntimeError при слишком глубокой вложенности
+            raise CodecError(str(e))
+        if not isinstance(message, dict):
+            raise CodecError("Сообщение должно быть объектом JSON")
+        return message
+
+
+class BinaryCodec(ICodec):
+    """ компактный бинарный формат.
+        Заголовок фиксированной длины: маркер, packet_type, код метода, transmission_id.
+        Остальные поля сообщения упаковываются в тело в формате подмножества msgpack """
+
+    name = "binary"
+
+    MAGIC = 0xB1
+    HEADER = struct.Struct("!BBBQ")
+    # коды методов, 0 - метод передается в теле сообщения
+    METHODS = (
+        "add_task",
+        "notify_task",
+        "perform_task",
+        "completed_task",
+        "heartbeat",
+        "status",
+        "perform_tasks",
+        "completed_tasks",
+        "add_tasks",
+        "stats",
+        "steal_tasks",
+        "transfer_tasks",
+        "shard_finished",
+        "capacity",
+        "forward_tasks",
+        "forwarded_finished",
+    )
+    METHOD_CODES = dict((method, code) for code, method in enumerate(METHODS, 1))
+
+    def encode(self, message):
+        # type: (dict) -> bytes
+        body = dict(message)
+        packet_type = body.pop(MSG_FIELD_PACKET_TYPE, 0)
+        transmission_id = body.pop(MSG_FIELD_TRANSMISSION_ID, None) or 0
+        method_code = self.METHOD_CODES.get(body.get(MSG_FIELD_METHOD), 0)
+        if method_code:
+            del body[MSG_FIELD_METHOD]
+        chunks = [self.HEADER.pack(self.MAGIC, packet_type, method_code, transmission_id)]
+        pack_value(body, chunks)
+        return b"".join(chunks)
+
+    def decode(self, data):
+        # type: (bytes) -> dict
+        buf = bytearray(data)
+        if len(buf) < self.HEADER.size or buf[0] != self.MAGIC:
+            raise CodecError("Неверный заголовок бинарного сообщения")
+        _, packet_type, method_code, transmission_id = self.HEADER.unpack_from(buf)
+        try:
+            message, pos = unpack_value(buf, self.HEADER.size)
+        except CodecError:
+            raise
+        except Exception as e:
+            # пакет из сети не должен ронять цикл событий, любая ошибка разбора - CodecError
+            raise CodecError("Тело сообщения повреждено: {!r}".format(e))
+        if pos != len(buf) or not isinstance(message, dict):
+            raise CodecError("Тело сообщения повреждено")
+        message[MSG_FIELD_PACKET_TYPE] = packet_type
+        if transmission_id:
+            message[MSG_FIELD_TRANSMISSION_ID] = transmission_id
+        if method_code:
+            try:
+                message[MSG_FIELD_METHOD] = self.METHODS[method_code - 1]
+            except IndexError:
+                raise CodecError("Неизвестный код метода {}".format(method_code))
+        return message
+
+
+CODECS = dict((codec.name, codec) for codec in (JsonCodec, BinaryCodec))
+
+
+def get_codec(name):
+    # type: (str) -> ICodec
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(
+            "Неизвестный формат {}, допустимые: {}".format(name, ", ".join(CODECS))
+        )
+
+
+def detect_codec(data, codecs):
+    # type: (bytes, Dict[str, ICodec]) -> ICodec
+    """ определить формат входящего пакета по первому байту """
+    if data[:1] == struct.pack("!B", BinaryCodec.MAGIC):
+        return codecs[BinaryCodec.name]
+    return codecs[JsonCodec.name]
+
+
+def pack_value(value, chunks):
+    # type: (Any, List[bytes]) -> None
+    """ упаковать значение в формат msgpack """
+    if value is None:
+        chunks.append(b"\xc0")
+    elif value is True:
+        chunks.append(b"\xc3")
+    elif value is False:
+        chunks.append(b"\xc2")
+    elif isinstance(value, integer_types):
+        if 0 <= value < 0x80:
+            chunks.append(struct.pack("!B", value))
+        elif -32 <= value < 0:
+            chunks.append(struct.pack("!b", value))
+        elif 0 <= value <= 0xFFFFFFFF:
+            chunks.append(struct.pack("!BI", 0xCE, value))
+        elif 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+            chunks.append(struct.pack("!BQ", 0xCF, value))
+        elif -0x80000000 <= value < 0:
+            chunks.append(struct.pack("!Bi", 0xD2, value))
+        elif -0x8000000000000000 <= value < 0:
+            chunks.append(struct.pack("!Bq", 0xD3, value))
+        else:
+            raise CodecError("Целое число вне допустимого диапазона: {}".format(value))
+    elif isinstance(value, float):
+        chunks.append(struct.pack("!Bd", 0xCB, value))
+    elif isinstance(value, (text_type, str)):
+        if isinstance(value, text_type):
+            value = value.encode("utf-8")
+        size = len(value)
+        if size < 32:
+            chunks.append(struct.pack("!B", 0xA0 | size))
+        elif size <= 0xFF:
+            chunks.append(struct.pack("!BB", 0xD9, size))
+        elif size <= 0xFFFF:
+            chunks.append(struct.pack("!BH", 0xDA, size))
+        else:
+            chunks.append(struct.pack("!BI", 0xDB, size))
+        chunks.append(value)
+    elif isinstance(value, (list, tuple)):
+        size = len(value)
+        if size < 16:
+            chunks.append(struct.pack("!B", 0x90 | size))
+        elif size <= 0xFFFF:
+            chunks.append(struct.pack("!BH", 0xDC, size))
+        else:
+            chunks.append(struct.pack("!BI", 0xDD, size))
+        for item in value:
+            pack_value(item, chunks)
+    elif isinstance(value, dict):
+        size = len(value)
+        if size < 16:
+            chunks.append(struct.pack("!B", 0x80 | size))
+        elif size <= 0xFFFF:
+            chunks.append(struct.pack("!BH", 0xDE, size))
+        else:
+            chunks.append(struct.pack("!BI", 0xDF, size))
+        for key, item in value.items():
+            pack_value(key, chunks)
+            pack_value(item, chunks)
+    else:
+        raise CodecError("Тип {} не поддерживается".format(type(value)))
+
+
+# тип -> (формат длины или значения, размер)
+_FIXED_FORMATS = {
+    0xCC: ("!B", 1),
+    0xCD: ("!H", 2),
+    0xCE: ("!I", 4),
+    0xCF: ("!Q", 8),
+    0xD0: ("!b", 1),
+    0xD1: ("!h", 2),
+    0xD2: ("!i", 4),
+    0xD3: ("!q", 8),
+    0xCA: ("!f", 4),
+    0xCB: ("!d", 8),
+}
+_STR_SIZES = {0xD9: ("!B", 1), 0xDA: ("!H", 2), 0xDB: ("!I", 4)}
+_ARRAY_SIZES = {0xDC: ("!H", 2), 0xDD: ("!I", 4)}
+_MAP_SIZES = {0xDE: ("!H", 2), 0xDF: ("!I", 4)}
+
+
+def unpack_value(buf, pos, depth=0):
+    # type: (bytearray, int, int) -> Tuple[Any, int]
+    """ распаковать значение, начинающееся с позиции pos.
+        Возвращает значение и позицию следующего значения """
+    if depth > MAX_DEPTH:
+        raise CodecError("Превышена вложенность {}".format(MAX_DEPTH))
+    code = buf[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xE0:
+        return code - 0x100, pos
+    if 0xA0 <= code <= 0xBF:
+        return _unpack_str(buf, pos, code & 0x1F)
+    if 0x90 <= code <= 0x9F:
+        return _unpack_array(buf, pos, code & 0x0F, depth)
+    if 0x80 <= code <= 0x8F:
+        return _unpack_map(buf, pos, code & 0x0F, depth)
+    if code == 0xC0:
+        return None, pos
+    if code == 0xC2:
+        return False, pos
+    if code == 0xC3:
+        return True, pos
+    if code in _FIXED_FORMATS:
+        fmt, size = _FIXED_FORMATS[code]
+        return struct.unpack_from(fmt, buf, pos)[0], pos + size
+    if code in _STR_SIZES:
+        fmt, size = _STR_SIZES[code]
+        return _unpack_str(buf, pos + size, struct.unpack_from(fmt, buf, pos)[0])
+    for sizes, unpacker in ((_ARRAY_SIZES, _unpack_array), (_MAP_SIZES, _unpack_map)):
+        if code in sizes:
+            fmt, size = sizes[code]
+            length = struct.unpack_from(fmt, buf, pos)[0]
+            return unpacker(buf, pos + size, length, depth)
+    raise CodecError("Неизвестный тип значения 0x{:02x}".format(code))
+
+
+def _unpack_str(buf, pos, size):
+    # type: (bytearray, int, int) -> Tuple[Any, int]
+    end = pos + size
+    if end > len(buf):
+        raise CodecError("Строка выходит за границы сообщения")
+    try:
+        return buf[pos:end].decode("utf-8"), end
+    except UnicodeDecodeError as e:
+        raise CodecError(str(e))
+
+
+def _check_length(buf, pos, size):
+    # type: (bytearray, int, int) -> None
+    """ каждый элемент занимает хотя бы байт, длина больше остатка сообщения - повреждение """
+    if size > len(buf) - pos:
+        raise CodecError("Длина {} выходит за границы сообщения".format(size))
+
+
+def _unpack_array(buf, pos, size, depth):
+    # type: (bytearray, int, int, int) -> Tuple[Any, int]
+    _check_length(buf, pos, size)
+    items = []
+    for _ in range(size):
+        item, pos = unpack_value(buf, pos, depth + 1)
+        items.append(item)
+    return items, pos
+
+
+def _unpack_map(buf, pos, size, depth):
+    # type: (bytearray, int, int, int) -> Tuple[Any, int]
+    _check_length(buf, pos, size * 2)
+    result = {}
+    for _ in range(size):
+        key, pos = unpack_value(buf, pos, depth + 1)
+        if not isinstance(key, (text_type, str) + integer_types) or isinstance(
+            key, bool
+        ):
+            raise CodecError("Недопустимый тип ключа {}".format(type(key).__name__))
+        result[key], pos = unpack_value(buf, pos, depth + 1)
+    return result, pos
@@ -0,0 +1,379 @@
+# coding: utf8
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import select
+import socket
+import struct
+import sys
+from abc import ABCMeta, abstractmethod
+
+try:
+    from typing import Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# ошибки, означающие что данных нет или буфер отправки заполнен
+WOULD_BLOCK_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class IDatagramIO(object):
+    """ пакетный ввод-вывод датаграмм для неблокирующего сокета """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, sock, buffer_size, batch_size):
+        # type: (socket.socket, int, int) -> None
+        self.socket = sock
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+
+    @staticmethod
+    def is_available():
+        # type: () -> bool
+        """ способ поддерживается платформой """
+        return True
+
+    def wait_readable(self, timeout):
+        # type: (Optional[float]) -> bool
+        """ дождаться входящих данных не дольше timeout секунд """
+        try:
+            readable, _, _ = select.select([self.socket], [], [], timeout)
+        except (select.error, socket.error, ValueError):
+            # сокет закрыт или вызов прерван сигналом
+            return False
+        return bool(readable)
+
+    def recv_batch(self, timeout):
+        # type: (Optional[float]) -> List[Tuple[bytes, Tuple[str, int]]]
+        """ дождаться данных и вычитать не больше batch_size датаграмм """
+        if not self.wait_readable(timeout):
+            return []
+        return self.drain()
+
+    @abstractmethod
+    def drain(self):
+        # type: () -> List[Tuple[bytes, Tuple[str, int]]]
+        """ вычитать готовые датаграммы без ожидания """
+        pass
+
+    @abstractmethod
+    def send_batch(self, datagrams):
+        # type: (List[Tuple[bytes, Tuple[str, int]]]) -> int
+        """ отправить датаграммы по порядку. Отправка прекращается, если буфер сокета
+            заполнен. Датаграммы с ошибкой отправки пропускаются.
+            Возвращает количество обработанных датаграмм """
+        pass
+
+
+class DrainDatagramIO(IDatagramIO):
+    """ вычитывание датаграмм в цикле до опустошения буфера сокета """
+
+    def drain(self):
+        # type: () -> List[Tuple[bytes, Tuple[str, int]]]
+        datagrams = []
+        while len(datagrams) < self.batch_size:
+            try:
+                datagrams.append(self.socket.recvfrom(self.buffer_size))
+            except socket.error as e:
+                if e.args[0] not in WOULD_BLOCK_ERRORS:
+                    logger.debug("Ошибка при чтении из сокета: %s", e)
+                break
+        return datagrams
+
+    def send_batch(self, datagrams):
+        # type: (List[Tuple[bytes, Tuple[str, int]]]) -> int
+        processed = 0
+        for data, addr in datagrams:
+            try:
+                self.socket.sendto(data, addr)
+            except socket.error as e:
+                if e.args[0] in WOULD_BLOCK_ERRORS:
+                    break
+                logger.error("Ошибка при отправке датаграммы на %s: %s", addr, e)
+            processed += 1
+        return processed
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+def _load_libc():
+    # type: () -> Optional[ctypes.CDLL]
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not (hasattr(libc, "recvmmsg") and hasattr(libc, "sendmmsg")):
+        return None
+    libc.recvmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(_MMsgHdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+        ctypes.c_void_p,
+    ]
+    libc.recvmmsg.restype = ctypes.c_int
+    libc.sendmmsg.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(_MMsgHdr),
+        ctypes.c_uint,
+        ctypes.c_int,
+    ]
+    libc.sendmmsg.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+MSG_TRUNC = getattr(socket, "MSG_TRUNC", 0x20)
+# максимальный размер кэшей адресов
+ADDR_CACHE_SIZE = 65536
+
+
+class MmsgDatagramIO(IDatagramIO):
+    """ пакетный ввод-вывод через системные вызовы recvmmsg/sendmmsg (Linux).
+        Структуры и буферы выделяются один раз, за проход заполняются
+        копированием подготовленных байтовых образов, чтобы не обращаться
+        к полям ctypes-структур по одному """
+
+    SOCKADDR_SIZE = ctypes.sizeof(_SockAddrIn)
+    MMSGHDR_SIZE = ctypes.sizeof(_MMsgHdr)
+    # смещения полей результата recvmmsg внутри mmsghdr
+    MSG_FLAGS_OFFSET = _MMsgHdr.msg_hdr.offset + _MsgHdr.msg_flags.offset
+    MSG_LEN_OFFSET = _MMsgHdr.msg_len.offset
+    IOVEC = struct.Struct(
+        "@" + {4: "I", 8: "Q"}[ctypes.sizeof(ctypes.c_void_p)]
+        + {4: "I", 8: "Q"}[ctypes.sizeof(ctypes.c_size_t)]
+    )
+
+    def __init__(self, sock, buffer_size, batch_size):
+        # type: (socket.socket, int, int) -> None
+        if not self.is_available():
+            raise RuntimeError("recvmmsg/sendmmsg недоступны на этой платформе")
+        super(MmsgDatagramIO, self).__init__(sock, buffer_size, batch_size)
+        self.fd = sock.fileno()
+        # кэш адресов: упакованный sockaddr_in <-> (ip, port)
+        self.addr_by_name = {}  # type: Dict[bytes, Tuple[str, int]]
+        self.name_by_addr = {}  # type: Dict[Tuple[str, int], bytes]
+
+        self.recv_buffer = ctypes.create_string_buffer(buffer_size * batch_size)
+        self.recv_names = (_SockAddrIn * batch_size)()
+        self.recv_iovecs = (_IoVec * batch_size)()
+        self.recv_msgs = (_MMsgHdr * batch_size)()
+        self.__init_msgs(
+            self.recv_msgs, self.recv_names, self.recv_iovecs, self.recv_buffer
+        )
+        for i in range(batch_size):
+            self.recv_iovecs[i].iov_len = buffer_size
+        # исходное состояние заголовков, восстанавливается перед каждым приемом
+        self.recv_msgs_image = ctypes.string_at(
+            ctypes.addressof(self.recv_msgs), ctypes.sizeof(self.recv_msgs)
+        )
+
+        self.send_buffer = ctypes.create_string_buffer(buffer_size * batch_size)
+        self.send_names = (_SockAddrIn * batch_size)()
+        self.send_iovecs = (_IoVec * batch_size)()
+        self.send_msgs = (_MMsgHdr * batch_size)()
+        self.__init_msgs(
+            self.send_msgs, self.send_names, self.send_iovecs, self.send_buffer
+        )
+        # запасной вариант для адресов, которые не являются ip,
+        # и датаграмм, не помещающихся в буфер
+        self.fallback = DrainDatagramIO(sock, buffer_size, batch_size)
+
+    def __init_msgs(self, msgs, names, iovecs, buf):
+        # type: (ctypes.Array, ctypes.Array, ctypes.Array, ctypes.Array) -> None
+        base = ctypes.addressof(buf)
+        for i in range(self.batch_size):
+            iovecs[i].iov_base = base + i * self.buffer_size
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(names[i])
+            hdr.msg_namelen = self.SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(iovecs[i])
+            hdr.msg_iovlen = 1
+
+    @staticmethod
+    def is_available():
+        # type: () -> bool
+        return _libc is not None
+
+    def drain(self):
+        # type: () -> List[Tuple[bytes, Tuple[str, int]]]
+        msgs_addr = ctypes.addressof(self.recv_msgs)
+        ctypes.memmove(msgs_addr, self.recv_msgs_image, len(self.recv_msgs_image))
+        count = _libc.recvmmsg(
+            self.fd, self.recv_msgs, self.batch_size, MSG_DONTWAIT, None
+        )
+        if count < 0:
+            err = ctypes.get_errno()
+            if err not in WOULD_BLOCK_ERRORS:
+                logger.debug("Ошибка recvmmsg: %s", errno.errorcode.get(err, err))
+            return []
+        msgs = ctypes.string_at(msgs_addr, count * self.MMSGHDR_SIZE)
+        names = ctypes.string_at(
+            ctypes.addressof(self.recv_names), count * self.SOCKADDR_SIZE
+        )
+        base = ctypes.addressof(self.recv_buffer)
+        datagrams = []
+        for i in range(count):
+            offset = i * self.MMSGHDR_SIZE
+            flags = struct.unpack_from("@i", msgs, offset + self.MSG_FLAGS_OFFSET)[0]
+            if flags & MSG_TRUNC:
+                logger.warning("Датаграмма обрезана, увеличьте recv_buffer_size")
+                continue
+            length = struct.unpack_from("@I", msgs, offset + self.MSG_LEN_OFFSET)[0]
+            name = names[i * self.SOCKADDR_SIZE : i * self.SOCKADDR_SIZE + 8]
+            addr = self.addr_by_name.get(name)
+            if addr is None:
+                addr = self.__cache_name(name)
+            datagrams.append(
+                (ctypes.string_at(base + i * self.buffer_size, length), addr)
+            )
+        return datagrams
+
+    def send_batch(self, datagrams):
+        # type: (List[Tuple[bytes, Tuple[str, int]]]) -> int
+        processed = 0
+        base = ctypes.addressof(self.send_buffer)
+        names = []
+        iovecs = []
+        for data, addr in datagrams:
+            name = self.name_by_addr.get(addr)
+            if name is None:
+                name = self.__cache_addr(addr)
+            if name is None or len(data) > self.buffer_size:
+                # сначала отправляем подготовленные, чтобы сохранить порядок
+                if names:
+                    count = self.__send_prepared(names, iovecs)
+                    processed += count
+                    if count < len(names):
+                        return processed
+                    names = []
+                    iovecs = []
+                count = self.fallback.send_batch([(data, addr)])
+                processed += count
+                if not count:
+                    return processed
+                continue
+            slot = len(names)
+            ctypes.memmove(base + slot * self.buffer_size, data, len(data))
+            names.append(name)
+            iovecs.append(self.IOVEC.pack(base + slot * self.buffer_size, len(data)))
+            if len(names) == self.batch_size:
+                count = self.__send_prepared(names, iovecs)
+                processed += count
+                if count < len(names):
+                    return processed
+                names = []
+                iovecs = []
+        if names:
+            processed += self.__send_prepared(names, iovecs)
+        return processed
+
+    def __send_prepared(self, names, iovecs):
+        # type: (List[bytes], List[bytes]) -> int
+        """ отправить подготовленные датаграммы, возвращает количество обработанных """
+        count = len(names)
+        name_image = b"".join(names)
+        iovec_image = b"".join(iovecs)
+        ctypes.memmove(self.send_names, name_image, len(name_image))
+        ctypes.memmove(self.send_iovecs, iovec_image, len(iovec_image))
+        pos = 0
+        while pos < count:
+            msgs = ctypes.cast(
+                ctypes.byref(self.send_msgs, pos * self.MMSGHDR_SIZE),
+                ctypes.POINTER(_MMsgHdr),
+            )
+            result = _libc.sendmmsg(self.fd, msgs, count - pos, 0)
+            if result < 0:
+                err = ctypes.get_errno()
+                if err in WOULD_BLOCK_ERRORS:
+                    break
+                logger.error("Ошибка sendmmsg: %s", errno.errorcode.get(err, err))
+                # пропускаем датаграмму, на которой произошла ошибка
+                pos += 1
+                continue
+            pos += result
+        return pos
+
+    def __cache_name(self, name):
+        # type: (bytes) -> Tuple[str, int]
+        addr = (socket.inet_ntoa(name[4:8]), struct.unpack("!H", name[2:4])[0])
+        if len(self.addr_by_name) >= ADDR_CACHE_SIZE:
+            self.addr_by_name.clear()
+        self.addr_by_name[name] = addr
+        return addr
+
+    def __cache_addr(self, addr):
+        # type: (Tuple[str, int]) -> Optional[bytes]
+        try:
+            packed_ip = socket.inet_aton(addr[0])
+        except (socket.error, TypeError):
+            return None
+        name = (
+            struct.pack("@H", socket.AF_INET)
+            + struct.pack("!H", addr[1])
+            + packed_ip
+            + b"\0" * 8
+        )
+        if len(self.name_by_addr) >= ADDR_CACHE_SIZE:
+            self.name_by_addr.clear()
+        self.name_by_addr[addr] = name
+        return name
+
+
+DATAGRAM_IO_BACKENDS = {"drain": DrainDatagramIO, "mmsg": MmsgDatagramIO}
+
+
+def create_datagram_io(sock, buffer_size, batch_size, backend="drain"):
+    # type: (socket.socket, int, int, str) -> IDatagramIO
+    try:
+        backend_class = DATAGRAM_IO_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            "Неизвестный способ ввода-вывода {}, допустимые: {}".format(
+                backend, ", ".join(DATAGRAM_IO_BACKENDS)
+            )
+        )
+    if not backend_class.is_available():
+        logger.warning(
+            "Способ ввода-вывода %s недоступен на этой платформе, используется drain",
+            backend,
+        )
+        backend_class = DrainDatagramIO
+    return backend_class(sock, buffer_size, batch_size)
@@ -0,0 +1,231 @@
+# coding: utf8
+from __future__ import print_function
+
+import errno
+import heapq
+import itertools
+import logging
+import select
+import socket
+import threading
+import time
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+EVENT_READ = 1
+EVENT_WRITE = 2
+
+
+class Poller(object):
+    """ ожидание готовности файловых дескрипторов.
+        Использует epoll, если доступен, иначе poll """
+
+    def __init__(self):
+        # type: () -> None
+        if hasattr(select, "epoll"):
+            self.impl = select.epoll()
+            self.read_mask = select.EPOLLIN
+            self.write_mask = select.EPOLLOUT
+            self.error_mask = select.EPOLLERR | select.EPOLLHUP
+            self.timeout_scale = 1.0
+        else:
+            self.impl = select.poll()
+            self.read_mask = select.POLLIN
+            self.write_mask = select.POLLOUT
+            self.error_mask = select.POLLERR | select.POLLHUP
+            # poll принимает таймаут в миллисекундах
+            self.timeout_scale = 1000.0
+        self.events = {}  # type: Dict[int, int]
+
+    def register(self, fd, events):
+        # type: (int, int) -> None
+        if fd in self.events:
+            self.impl.modify(fd, self.__to_mask(events))
+        else:
+            self.impl.register(fd, self.__to_mask(events))
+        self.events[fd] = events
+
+    def unregister(self, fd):
+        # type: (int) -> None
+        if self.events.pop(fd, None) is not None:
+            try:
+                self.impl.unregister(fd)
+            except (IOError, OSError, ValueError, KeyError):
+                # дескриптор уже закрыт
+                pass
+
+    def poll(self, timeout):
+        # type: (Optional[float]) -> List[Tuple[int, int]]
+        """ дождаться событий не дольше timeout секунд, None - без ограничения """
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout = max(timeout, 0) * self.timeout_scale
+        try:
+            ready = self.impl.poll(timeout)
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                # прервано сигналом
+                return []
+            raise
+        result = []
+        for fd, mask in ready:
+            events = 0
+            if mask & (self.read_mask | self.error_mask):
+                events |= EVENT_READ
+            if mask & self.write_mask:
+                events |= EVENT_WRITE
+            result.append((fd, events))
+        return result
+
+    def fileno(self):
+        # type: () -> Optional[int]
+        """ дескриптор epoll, у poll своего дескриптора нет """
+        if hasattr(self.impl, "fileno"):
+            return self.impl.fileno()
+        return None
+
+    def close(self):
+        # type: () -> None
+        if hasattr(self.impl, "close"):
+            self.impl.close()
+
+    def __to_mask(self, events):
+        # type: (int) -> int
+        mask = 0
+        if events & EVENT_READ:
+            mask |= self.read_mask
+        if events & EVENT_WRITE:
+            mask |= self.write_mask
+        return mask
+
+
+class Waker(object):
+    """ пробуждение цикла событий из других потоков """
+
+    def __init__(self):
+        # type: () -> None
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(False)
+        self.writer.setblocking(False)
+
+    def fileno(self):
+        # type: () -> int
+        return self.reader.fileno()
+
+    def wake(self):
+        # type: () -> None
+        try:
+            self.writer.send(b"\0")
+        except socket.error:
+            # буфер заполнен, значит цикл и так будет разбужен
+            pass
+
+    def drain(self):
+        # type: () -> None
+        try:
+            while self.reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        # type: () -> None
+        self.reader.close()
+        self.writer.close()
+
+
+class TimerHandle(object):
+    """ отложенный или периодический вызов, возвращается TimerScheduler """
+
+    __slots__ = ("deadline", "interval", "func", "args", "cancelled")
+
+    def __init__(self, deadline, interval, func, args):
+        # type: (float, Optional[float], Callable, tuple) -> None
+        self.deadline = deadline
+        # период повторения, None - однократный вызов
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # type: () -> None
+        """ отменить таймер, запись удаляется из кучи при извлечении """
+        self.cancelled = True
+
+
+class TimerScheduler(object):
+    """ таймеры цикла событий в куче по сроку срабатывания.
+        Таймеры можно добавлять из любого потока, вызываются они в потоке run_due.
+        Срок периодического таймера отсчитывается от прошлого срока, а не от времени
+        вызова, поэтому интервал не накапливает сдвиг. Пропущенные срабатывания не повторяются """
+
+    def __init__(self):
+        # type: () -> None
+        self.heap = []  # type: List[Tuple[float, int, TimerHandle]]
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.heap)
+
+    def schedule(self, deadline, interval, func, *args):
+        # type: (float, Optional[float], Callable, *Any) -> Tuple[TimerHandle, bool]
+        """ добавить таймер. Второе значение - таймер стал ближайшим,
+            то есть ожидающий цикл событий нужно разбудить """
+        handle = TimerHandle(deadline, interval, func, args)
+        with self.lock:
+            self.__push(handle)
+            return handle, self.heap[0][2] is handle
+
+    def next_deadline(self):
+        # type: () -> Optional[float]
+        with self.lock:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+    def run_due(self, current_tm=None):
+        # type: (Optional[float]) -> int
+        """ вызвать таймеры, срок которых наступил. Возвращает количество вызовов """
+        if current_tm is None:
+            current_tm = time.time()
+        due = []  # type: List[TimerHandle]
+        with self.lock:
+            while self.heap and self.heap[0][0] <= current_tm:
+                handle = heapq.heappop(self.heap)[2]
+                if handle.cancelled:
+                    continue
+                due.append(handle)
+                if handle.interval:
+                    missed = int((current_tm - handle.deadline) // handle.interval)
+                    handle.deadline += (missed + 1) * handle.interval
+                    self.__push(handle)
+        for handle in due:
+            # таймер мог быть отменен вызовом предыдущего
+            if handle.cancelled:
+                continue
+            # noinspection PyBroadException
+            try:
+                handle.func(*handle.args)
+            except:
+                logger.exception("Ошибка при вызове таймера %s", handle.func)
+        return len(due)
+
+    def clear(self):
+        # type: () -> None
+        with self.lock:
+            for _, _, handle in self.heap:
+                handle.cancel()
+            self.heap = []
+
+    def __push(self, handle):
+        # type: (TimerHandle) -> None
+        heapq.heappush(self.heap, (handle.deadline, next(self.counter), handle))
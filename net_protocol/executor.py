@@ -0,0 +1,151 @@
+# coding: utf8
+from __future__ import print_function
+
+import logging
+import threading
+import time
+from collections import deque
+
+try:
+    from typing import Any, Callable, Dict, Hashable
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerExecutor(object):
+    """ выполнение обработчиков сообщений в пуле потоков.
+        Задачи с одинаковым ключом (адресом отправителя) выполняются одним потоком
+        в порядке поступления. Очередь каждого потока ограничена, при переполнении
+        задача не принимается """
+
+    def __init__(self, workers, queue_size=1024):
+        # type: (int, int) -> None
+        if workers < 1:
+            raise ValueError("Количество потоков должно быть больше 0")
+        self.queue_size = queue_size
+        self.workers = [_Worker(self, index) for index in range(workers)]
+        self.lock = threading.Lock()
+        # статистика
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.errors = 0
+        self.wait_sec_total = 0.0
+        self.run_sec_total = 0.0
+        self.run_sec_max = 0.0
+
+    def start(self):
+        # type: () -> None
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, key, func, *args):
+        # type: (Hashable, Callable, *Any) -> bool
+        """ поставить задачу в очередь потока, закрепленного за key.
+            Возвращает False, если очередь потока заполнена """
+        worker = self.workers[hash(key) % len(self.workers)]
+        accepted = worker.put((time.time(), func, args))
+        with self.lock:
+            if accepted:
+                self.submitted += 1
+            else:
+                self.rejected += 1
+        return accepted
+
+    def shutdown(self, wait=True):
+        # type: (bool) -> None
+        """ остановить потоки. Задачи, уже поставленные в очередь, выполняются """
+        for worker in self.workers:
+            worker.stop()
+        if wait:
+            for worker in self.workers:
+                if worker.thread is not threading.current_thread():
+                    worker.thread.join()
+
+    def queued(self):
+        # type: () -> int
+        return sum(len(worker) for worker in self.workers)
+
+    def get_stats(self):
+        # type: () -> Dict[str, Any]
+        with self.lock:
+            completed = self.completed
+            return {
+                "workers": len(self.workers),
+                "queued": self.queued(),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": completed,
+                "errors": self.errors,
+                "wait_sec_avg": self.wait_sec_total / completed if completed else 0.0,
+                "run_sec_avg": self.run_sec_total / completed if completed else 0.0,
+                "run_sec_max": self.run_sec_max,
+            }
+
+    def _record(self, wait_sec, run_sec, failed):
+        # type: (float, float, bool) -> None
+        with self.lock:
+            self.completed += 1
+            if failed:
+                self.errors += 1
+            self.wait_sec_total += wait_sec
+            self.run_sec_total += run_sec
+            if run_sec > self.run_sec_max:
+                self.run_sec_max = run_sec
+
+
+class _Worker(object):
+    def __init__(self, executor, index):
+        # type: (HandlerExecutor, int) -> None
+        self.executor = executor
+        self.queue = deque()  # type: deque
+        self.condition = threading.Condition(threading.Lock())
+        self.is_alive = True
+        self.thread = threading.Thread(
+            target=self.run, name="handler-{}".format(index)
+        )
+        self.thread.daemon = True
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.queue)
+
+    def start(self):
+        # type: () -> None
+        self.thread.start()
+
+    def put(self, item):
+        # type: (tuple) -> bool
+        with self.condition:
+            if not self.is_alive or len(self.queue) >= self.executor.queue_size:
+                return False
+            self.queue.append(item)
+            self.condition.notify()
+        return True
+
+    def stop(self):
+        # type: () -> None
+        with self.condition:
+            self.is_alive = False
+            self.condition.notify()
+
+    def run(self):
+        # type: () -> None
+        while True:
+            with self.condition:
+                while self.is_alive and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                submit_tm, func, args = self.queue.popleft()
+            start_tm = time.time()
+            failed = False
+            # noinspection PyBroadException
+            try:
+                func(*args)
+            except:
+                failed = True
+                logger.exception("Ошибка при выполнении обработчика")
+            self.executor._record(start_tm - submit_tm, time.time() - start_tm, failed)
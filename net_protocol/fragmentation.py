@@ -0,0 +1,140 @@
+# coding: utf8
+from __future__ import print_function
+
+import struct
+import time
+from collections import OrderedDict
+
+from .net_proto import TransmissionIdGenerator
+
+try:
+    from typing import Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+# маркер, идентификатор сообщения, номер фрагмента, количество фрагментов
+FRAGMENT_HEADER = struct.Struct("!BQHH")
+FRAGMENT_MAGIC = 0xF7
+MAX_FRAGMENTS = 0xFFFF
+
+
+def is_fragment(data):
+    # type: (bytes) -> bool
+    return data[:1] == struct.pack("!B", FRAGMENT_MAGIC)
+
+
+class Fragmenter(object):
+    """ разбиение сообщения на датаграммы размером не больше mtu """
+
+    def __init__(self, mtu):
+        # type: (int) -> None
+        if mtu <= FRAGMENT_HEADER.size:
+            raise ValueError(
+                "mtu должен быть больше размера заголовка {}".format(
+                    FRAGMENT_HEADER.size
+                )
+            )
+        self.mtu = mtu
+        self.chunk_size = mtu - FRAGMENT_HEADER.size
+        self.message_ids = TransmissionIdGenerator()
+
+    def split(self, data):
+        # type: (bytes) -> List[bytes]
+        if len(data) <= self.mtu:
+            return [data]
+        count = (len(data) + self.chunk_size - 1) // self.chunk_size
+        if count > MAX_FRAGMENTS:
+            raise ValueError(
+                "Сообщение размером {} байт не может быть разбито на фрагменты".format(
+                    len(data)
+                )
+            )
+        message_id = self.message_ids.next()
+        return [
+            FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id, index, count)
+            + data[index * self.chunk_size : (index + 1) * self.chunk_size]
+            for index in range(count)
+        ]
+
+
+class _PartialMessage(object):
+    __slots__ = ("created_tm", "count", "fragments", "size")
+
+    def __init__(self, count):
+        # type: (int) -> None
+        self.created_tm = time.time()
+        self.count = count
+        self.fragments = {}  # type: Dict[int, bytes]
+        self.size = 0
+
+
+class Reassembler(object):
+    """ сборка сообщений из фрагментов.
+        Количество одновременно собираемых сообщений и их размер ограничены,
+        недособранные сообщения удаляются по таймауту """
+
+    def __init__(self, max_messages=1024, timeout=5.0, max_message_size=1 << 20):
+        # type: (int, float, int) -> None
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.max_message_size = max_message_size
+        self.messages = (
+            OrderedDict()
+        )  # type: OrderedDict[Tuple[Tuple[str, int], int], _PartialMessage]
+        self.dropped = 0
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.messages)
+
+    def add(self, address, datagram):
+        # type: (Tuple[str, int], bytes) -> Optional[bytes]
+        """ добавить фрагмент. Возвращает сообщение, если собраны все фрагменты """
+        self.expire()
+        if len(datagram) < FRAGMENT_HEADER.size:
+            raise ValueError("Фрагмент меньше размера заголовка")
+        _, message_id, index, count = FRAGMENT_HEADER.unpack_from(datagram)
+        if index >= count:
+            raise ValueError("Номер фрагмента {} вне диапазона {}".format(index, count))
+        key = (address, message_id)
+        message = self.messages.get(key)
+        if message is None:
+            if len(self.messages) >= self.max_messages:
+                # вытесняем самое старое недособранное сообщение
+                self.messages.popitem(last=False)
+                self.dropped += 1
+            message = _PartialMessage(count)
+            self.messages[key] = message
+        elif message.count != count:
+            raise ValueError("Количество фрагментов не совпадает с первым фрагментом")
+
+        if index not in message.fragments:
+            chunk = datagram[FRAGMENT_HEADER.size :]
+            message.size += len(chunk)
+            if message.size > self.max_message_size:
+                del self.messages[key]
+                self.dropped += 1
+                raise ValueError(
+                    "Превышен максимальный размер сообщения {}".format(
+                        self.max_message_size
+                    )
+                )
+            message.fragments[index] = chunk
+        if len(message.fragments) < message.count:
+            return None
+        del self.messages[key]
+        return b"".join(message.fragments[i] for i in range(message.count))
+
+    def expire(self, current_tm=None):
+        # type: (Optional[float]) -> None
+        """ удалить сообщения, которые не удалось собрать за timeout """
+        if current_tm is None:
+            current_tm = time.time()
+        # сообщения упорядочены по времени поступления первого фрагмента
+        while self.messages:
+            key = next(iter(self.messages))
+            message = self.messages[key]
+            if current_tm - message.created_tm < self.timeout:
+                break
+            del self.messages[key]
+            self.dropped += 1
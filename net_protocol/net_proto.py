@@ -1,14 +1,24 @@
 # coding: utf8
+import threading
+import time
 from collections import Callable, namedtuple
 
 try:
-    from typing import Tuple, Iterable
+    from typing import Tuple, Iterable, Optional
 except ImportError:
     pass
 
 
+MSG_FIELD_METHOD = "method"
+MSG_FIELD_PACKET_TYPE = "packet_type"
+MSG_FIELD_TRANSMISSION_ID = "transmission_id"
+# подтвержденные transmission_id: плоский список границ диапазонов [начало, конец, ...]
+MSG_FIELD_ACKS = "acks"
+
+
 class PacketType(object):
-    no_answer, request, response = range(3)
+    # ack - только подтверждения, без данных команды
+    no_answer, request, response, ack = range(4)
 
     @classmethod
     def get_states(cls):
@@ -17,6 +27,7 @@ class PacketType(object):
             cls.no_answer,
             cls.request,
             cls.response,
+            cls.ack,
         )
 
 
@@ -40,6 +51,7 @@ class NetCommand(object):
         transmission_id,  # type: int
         callback,  # type: Callable
         attempts=0,  # type: int
+        next_send_tm=0.0,  # type: float
     ):
         self.__address = None
         self.__packet_type = None
@@ -52,6 +64,10 @@ class NetCommand(object):
         self.packet_type = packet_type
         self.callback = callback
         self.attempts = attempts
+        # время следующей отправки
+        self.next_send_tm = next_send_tm
+        # время последней отправки
+        self.sent_tm = None  # type: Optional[float]
 
     @property
     def address(self):
@@ -102,4 +118,31 @@ class NetCommand(object):
         self.__transmission_id = value
 
 
+class TransmissionIdGenerator(object):
+    """ генератор 64-битных transmission_id.
+        Старшие 32 бита - время запуска процесса в секундах, младшие - счетчик.
+        Идентификаторы возрастают в пределах процесса и между перезапусками,
+        если перезапуск произошел не раньше чем через секунду """
+
+    COUNTER_BITS = 32
+    COUNTER_MASK = (1 << COUNTER_BITS) - 1
+    PREFIX_MASK = (1 << 32) - 1
+
+    def __init__(self):
+        # type: () -> None
+        self.lock = threading.Lock()
+        self.prefix = int(time.time()) & self.PREFIX_MASK
+        self.counter = 0
+
+    def next(self):
+        # type: () -> int
+        with self.lock:
+            self.counter += 1
+            if self.counter > self.COUNTER_MASK:
+                # счетчик переполнен, переходим на следующий префикс
+                self.prefix = max(self.prefix + 1, int(time.time())) & self.PREFIX_MASK
+                self.counter = 1
+            return (self.prefix << self.COUNTER_BITS) | self.counter
+
+
 ResponseConfirmation = namedtuple("ResponseConfirmation", ["data"])
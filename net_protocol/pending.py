@@ -0,0 +1,87 @@
+# coding: utf8
+from __future__ import print_function
+
+from .net_proto import NetCommand
+from .retransmit import RetransmitTimer
+
+try:
+    from typing import Dict, List, Optional, Tuple
+except ImportError:
+    pass
+
+
+class PendingLimitExceeded(Exception):
+    """ превышено максимальное количество неподтвержденных команд """
+
+
+class PendingCommands(object):
+    """ индекс неподтвержденных команд.
+        Поиск и удаление по ключу подтверждения за O(1),
+        поиск команд для отправки по куче сроков за O(log n) """
+
+    def __init__(self, max_pending):
+        # type: (int) -> None
+        self.max_pending = max_pending
+        self.commands = {}  # type: Dict[Tuple[str, int, int], NetCommand]
+        self.timer = RetransmitTimer()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.commands)
+
+    def __contains__(self, ckey):
+        # type: (Tuple[str, int, int]) -> bool
+        return ckey in self.commands
+
+    def get(self, ckey):
+        # type: (Tuple[str, int, int]) -> Optional[NetCommand]
+        return self.commands.get(ckey)
+
+    def add(self, ckey, cmd):
+        # type: (Tuple[str, int, int], NetCommand) -> None
+        if ckey in self.commands:
+            raise KeyError("Команда с ключом {} уже ожидает подтверждения".format(ckey))
+        if len(self.commands) >= self.max_pending:
+            raise PendingLimitExceeded(
+                "Превышено количество неподтвержденных команд {}".format(
+                    self.max_pending
+                )
+            )
+        self.commands[ckey] = cmd
+        self.timer.push(cmd.next_send_tm, ckey)
+
+    def reschedule(self, ckey, deadline):
+        # type: (Tuple[str, int, int], float) -> None
+        cmd = self.commands[ckey]
+        cmd.next_send_tm = deadline
+        self.timer.push(deadline, ckey)
+
+    def remove(self, ckey):
+        # type: (Tuple[str, int, int]) -> Optional[NetCommand]
+        cmd = self.commands.pop(ckey, None)
+        # в куче остаются записи удаленных команд, периодически их вычищаем
+        if len(self.timer) > 2 * len(self.commands) + 1024:
+            self.timer.compact(self.__is_actual)
+        return cmd
+
+    def next_deadline(self):
+        # type: () -> Optional[float]
+        return self.timer.next_deadline()
+
+    def pop_due(self, current_tm, limit):
+        # type: (float, int) -> List[Tuple[Tuple[str, int, int], NetCommand]]
+        """ извлечь не более limit команд, срок отправки которых наступил """
+        due = []
+        while len(due) < limit:
+            items = self.timer.pop_due(current_tm, limit - len(due))
+            if not items:
+                break
+            for deadline, ckey in items:
+                if self.__is_actual(deadline, ckey):
+                    due.append((ckey, self.commands[ckey]))
+        return due
+
+    def __is_actual(self, deadline, ckey):
+        # type: (float, Tuple[str, int, int]) -> bool
+        cmd = self.commands.get(ckey)
+        return cmd is not None and cmd.next_send_tm == deadline
@@ -0,0 +1,73 @@
+# coding: utf8
+from __future__ import print_function
+
+import socket
+import threading
+import time
+
+try:
+    from typing import Dict, Optional, Tuple
+except ImportError:
+    pass
+
+
+class AddressResolver(object):
+    """ кэш разрешения имен хостов в ip-адреса.
+        Неудачные попытки тоже кэшируются, но на меньший срок """
+
+    def __init__(self, ttl=60.0, negative_ttl=5.0):
+        # type: (float, float) -> None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        # хост -> (ip или None, время истечения записи)
+        self.cache = {}  # type: Dict[str, Tuple[Optional[str], float]]
+
+    def resolve(self, host):
+        # type: (str) -> str
+        """ вернуть ip-адрес хоста. Если хост не найден, то socket.gaierror """
+        if not host or self.is_ip(host):
+            return host
+        current_tm = time.time()
+        entry = self.cache.get(host)
+        if entry is None or entry[1] <= current_tm:
+            try:
+                ip = socket.gethostbyname(host)
+            except socket.error:
+                ip = None
+            with self.lock:
+                entry = (ip, current_tm + (self.ttl if ip else self.negative_ttl))
+                self.cache[host] = entry
+        if entry[0] is None:
+            raise socket.gaierror("Не удалось разрешить имя хоста {}".format(host))
+        return entry[0]
+
+    def resolve_address(self, address):
+        # type: (Tuple[str, int]) -> Tuple[str, int]
+        return self.resolve(address[0]), address[1]
+
+    def invalidate(self, host=None):
+        # type: (Optional[str]) -> None
+        with self.lock:
+            if host is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(host, None)
+
+    @staticmethod
+    def is_ip(host):
+        # type: (str) -> bool
+        try:
+            socket.inet_aton(host)
+        except (socket.error, TypeError, ValueError):
+            return False
+        return host.count(".") == 3
+
+
+# общий для всего процесса кэш
+default_resolver = AddressResolver()
+
+
+def resolve_address(address):
+    # type: (Tuple[str, int]) -> Tuple[str, int]
+    return default_resolver.resolve_address(address)
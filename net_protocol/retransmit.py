@@ -0,0 +1,99 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import itertools
+import random
+
+try:
+    from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+except ImportError:
+    pass
+
+
+class RtoEstimator(object):
+    """ оценка таймаута повторной отправки (RTO) по RFC 6298.
+        SRTT/RTTVAR ведутся отдельно для каждого адреса """
+
+    ALPHA = 1.0 / 8
+    BETA = 1.0 / 4
+    K = 4
+
+    def __init__(self, initial_rto, min_rto, max_rto):
+        # type: (float, float, float) -> None
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        # адрес -> (srtt, rttvar)
+        self.peers = {}  # type: Dict[Hashable, Tuple[float, float]]
+
+    def update(self, peer, rtt):
+        # type: (Hashable, float) -> None
+        """ учесть новое измерение времени доставки """
+        state = self.peers.get(peer)
+        if state is None:
+            srtt, rttvar = rtt, rtt / 2.0
+        else:
+            srtt, rttvar = state
+            rttvar = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+            srtt = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+        self.peers[peer] = (srtt, rttvar)
+
+    def get_rto(self, peer):
+        # type: (Hashable) -> float
+        state = self.peers.get(peer)
+        if state is None:
+            rto = self.initial_rto
+        else:
+            srtt, rttvar = state
+            rto = srtt + self.K * rttvar
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def get_backoff(self, peer, attempt, jitter=0.0):
+        # type: (Hashable, int, float) -> float
+        """ таймаут для попытки attempt (начиная с 1) с экспоненциальным
+            увеличением и случайным отклонением в пределах jitter """
+        rto = min(self.max_rto, self.get_rto(peer) * (2 ** max(attempt - 1, 0)))
+        if jitter:
+            rto *= random.uniform(1 - jitter, 1 + jitter)
+        return rto
+
+
+class RetransmitTimer(object):
+    """ очередь сроков повторной отправки на куче.
+        Отмена записи ленивая: устаревшие записи отбрасываются при извлечении,
+        поэтому вызывающий код должен проверять актуальность срока """
+
+    def __init__(self):
+        # type: () -> None
+        self.heap = []  # type: List[Tuple[float, int, Any]]
+        self.counter = itertools.count()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.heap)
+
+    def push(self, deadline, key):
+        # type: (float, Any) -> None
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+
+    def next_deadline(self):
+        # type: () -> Optional[float]
+        if self.heap:
+            return self.heap[0][0]
+        return None
+
+    def pop_due(self, current_tm, limit):
+        # type: (float, int) -> List[Tuple[float, Any]]
+        """ извлечь не более limit записей, срок которых наступил """
+        due = []
+        while self.heap and len(due) < limit and self.heap[0][0] <= current_tm:
+            deadline, _, key = heapq.heappop(self.heap)
+            due.append((deadline, key))
+        return due
+
+    def compact(self, is_actual):
+        # type: (Callable[[float, Any], bool]) -> None
+        """ удалить устаревшие записи """
+        self.heap = [item for item in self.heap if is_actual(item[0], item[2])]
+        heapq.heapify(self.heap)
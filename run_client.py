@@ -1,19 +1,14 @@
 # coding: utf8
 from __future__ import print_function
 
-import logging
-
 from client import Client
 from net_protocol import NetClient
-from utils import argparse_worker, read_config
+from utils import argparse_worker, read_config, setup_logging
 
 if __name__ == "__main__":
-    logging.basicConfig(format="%(asctime)s | %(name)s | %(levelname)s | %(message)s")
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
     args, _ = argparse_worker()
     config = read_config(args.settings)
+    setup_logging(**config.pop("logging", {}))
 
     dispatcher_addr = (
         config["dispatcher"]["host"],
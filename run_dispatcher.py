@@ -1,23 +1,24 @@
 # coding: utf8
 from __future__ import print_function
 
-import logging
-
 from dispatcher import Dispatcher
+from dispatcher.sharding import run_shards
 from net_protocol import NetClient
-from utils import argparse_worker, read_config
+from utils import argparse_worker, read_config, setup_logging
 
 if __name__ == "__main__":
-    logging.basicConfig(format="%(asctime)s | %(name)s | %(levelname)s | %(message)s")
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
     args, _ = argparse_worker()
     config = read_config(args.settings)
+    setup_logging(**config.pop("logging", {}))
 
     client_address = config.pop("client_address")
     local_address = (
         client_address.get("host", ""),
         client_address["port"],
     )
-    Dispatcher(NetClient, local_address, **config).start()
+    shards = config.pop("shards", 1)
+    if shards > 1:
+        # процессы диспетчера на общем порту, каждый со своей частью вычислителей
+        run_shards(Dispatcher, NetClient, local_address, shards, **config)
+    else:
+        Dispatcher(NetClient, local_address, **config).start()
@@ -6,6 +6,10 @@ import logging
 import socket
 from argparse import ArgumentParser
 
+from net_protocol.codec import CODECS, detect_codec, get_codec
+from net_protocol.fragmentation import Reassembler, is_fragment
+from net_protocol.net_proto import PacketType, TransmissionIdGenerator
+
 
 def send(data, host, port):
     conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -13,14 +17,41 @@ def send(data, host, port):
     conn.close()
 
 
+def request_stats(host, port, timeout):
+    """ отправить диспетчеру команду stats и дождаться ответа """
+    conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    conn.settimeout(timeout)
+    message = {
+        "method": "stats",
+        "params": {},
+        "packet_type": PacketType.request,
+        "transmission_id": TransmissionIdGenerator().next(),
+    }
+    conn.sendto(json.dumps(message).encode("utf-8"), (host, port))
+    codecs = dict((name, get_codec(name)) for name in CODECS)
+    reassembler = Reassembler()
+    try:
+        while True:
+            data, addr = conn.recvfrom(65535)
+            if is_fragment(data):
+                data = reassembler.add(addr, data)
+                if data is None:
+                    continue
+            reply = detect_codec(data, codecs).decode(data)
+            if reply.get("transmission_id") == message["transmission_id"]:
+                return reply.get("result")
+    finally:
+        conn.close()
+
+
 def main(data, host, port, count):
-    logger.info("Будут отправлены данные {} на адрес {}:{}".format(data, host, port))
+    logger.info("Будут отправлены данные %s на адрес %s:%s", data, host, port)
     for i in range(count):
         if data:
             try:
                 send(data, host, port)
             except ValueError:
-                logger.exception("Ошибка при преобразовании json {}".format(data))
+                logger.exception("Ошибка при преобразовании json %s", data)
         else:
             send(str(i), host, port)
     logger.info("данные отправлены")
@@ -38,11 +69,18 @@ if __name__ == "__main__":
     parser.add_argument("--data", "-d", default=None)
     parser.add_argument("--count", "-c", type=int, default=1)
     parser.add_argument("--filename", "-f", default=None)
+    parser.add_argument(
+        "--stats", action="store_true", help=u"запросить статистику диспетчера"
+    )
+    parser.add_argument("--timeout", "-t", type=float, default=2.0)
     args, unknown = parser.parse_known_args()
-    if args.filename:
-        with open(args.filename, "r") as fp:
-            data = json.load(fp)
-            logger.info("Загружен файл с данными: {}".format(data))
+    if args.stats:
+        print(json.dumps(request_stats(args.host, args.port, args.timeout), indent=2))
     else:
-        data = args.data
-    main(data, args.host, args.port, args.count)
+        if args.filename:
+            with open(args.filename, "r") as fp:
+                data = json.load(fp)
+                logger.info("Загружен файл с данными: %s", data)
+        else:
+            data = args.data
+        main(data, args.host, args.port, args.count)
@@ -0,0 +1,5 @@
+# coding: utf8
+import logging
+
+# предупреждения тестируемого кода не выводятся, в Python 2 без обработчика пишется ошибка
+logging.getLogger().addHandler(logging.NullHandler())
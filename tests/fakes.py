@@ -0,0 +1,50 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+from collections import deque
+
+from net_protocol import INetClient
+from net_protocol.event_loop import TimerHandle
+
+try:
+    from typing import Any, Callable, Tuple
+except ImportError:
+    pass
+
+
+class FakeNetClient(INetClient):
+    """ сетевой клиент без сети: команды диспетчера складываются в очередь,
+        таймеры не запускаются """
+
+    def __init__(self, address, **kwargs):
+        # type: (Tuple[str, int], **Any) -> None
+        self.handler = None  # type: Callable
+        self.commands = deque()  # type: deque
+
+    def serve_forever(self):
+        pass
+
+    def shutdown(self, immediate=False):
+        pass
+
+    def send_command(self, address, data, callback):
+        self.commands.append((address, data, callback))
+
+    def send_command_without_confirmation(self, address, data):
+        pass
+
+    def call_later(self, delay, func, *args):
+        return TimerHandle(time.time() + delay, None, func, args)
+
+    def call_repeatedly(self, interval, func, *args):
+        return TimerHandle(time.time() + interval, interval, func, args)
+
+    def add_handler_request(self, callback):
+        self.handler = callback
+
+    def get_stats(self):
+        return {"pending": len(self.commands), "backlog": 0, "peers": {}}
+
+    def get_fds(self):
+        return []
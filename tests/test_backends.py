@@ -0,0 +1,76 @@
+# coding: utf8
+from __future__ import print_function
+
+import os
+import socket
+import threading
+import unittest
+
+from calculator.backends import ProcessBackend
+
+
+def _square(value):
+    return value * value
+
+
+def _unpicklable():
+    return threading.Lock()
+
+
+def _crash():
+    os._exit(1)
+
+
+def _is_closed(fd):
+    try:
+        os.fstat(fd)
+    except OSError:
+        return True
+    return False
+
+
+class ProcessBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.backend = ProcessBackend(1, task_timeout=0.5)
+        self.backend.start([self.socket.fileno()])
+        self.results = {}
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.backend.shutdown(immediate=True)
+        self.socket.close()
+
+    def callback(self, task_id, result, error):
+        self.results[task_id] = (result, error)
+        self.done.set()
+
+    def run_task(self, func, args=()):
+        self.done.clear()
+        self.backend.submit("task", func, args, self.callback)
+        self.assertTrue(self.done.wait(5.0))
+        return self.results.pop("task")
+
+    def test_result(self):
+        self.assertEqual(self.run_task(_square, (3,)), (9, None))
+
+    def test_inherited_fds_closed(self):
+        self.assertEqual(
+            self.run_task(_is_closed, (self.socket.fileno(),)), (True, None)
+        )
+
+    def test_unpicklable_result(self):
+        result, error = self.run_task(_unpicklable)
+        self.assertIsNone(result)
+        self.assertIsNotNone(error)
+        self.assertFalse(self.backend.pending)
+
+    def test_worker_crash(self):
+        result, error = self.run_task(_crash)
+        self.assertIsNone(result)
+        self.assertIn("0.5", error)
+        self.assertFalse(self.backend.pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
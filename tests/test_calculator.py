@@ -0,0 +1,67 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from calculator import Calculator
+from entities import CalculatorStatus
+from tests.fakes import FakeNetClient
+
+
+class OverCapacityTest(unittest.TestCase):
+    def setUp(self):
+        self.calculator = Calculator(
+            FakeNetClient, ("127.0.0.1", 5599), task_duration=(0, 0), capacity=1
+        )
+
+    def perform(self, method, params):
+        return self.calculator.handle_message_dispatcher(
+            ("127.0.0.1", 5599), {"method": method, "params": params}
+        )
+
+    def test_single_and_batch_queued(self):
+        # исполнитель не запущен, задачи остаются в его очереди
+        self.assertIsNotNone(self.perform("perform_task", {"task_uuid": "a"}))
+        self.assertIsNotNone(self.perform("perform_task", {"task_uuid": "b"}))
+        self.assertIsNotNone(
+            self.perform("perform_tasks", {"tasks": [{"task_uuid": "c"}]})
+        )
+        self.assertEqual(sorted(self.calculator.tasks), ["a", "b", "c"])
+        self.assertEqual(self.calculator.free_slots, 0)
+        self.assertEqual(self.calculator.status, CalculatorStatus.busy)
+
+
+class CompletedTaskTest(unittest.TestCase):
+    def setUp(self):
+        self.calculator = Calculator(
+            FakeNetClient,
+            ("127.0.0.1", 5599),
+            task_duration=(0, 0),
+            capacity=2,
+            completion_linger=0,
+        )
+        self.calculator.handle_message_dispatcher(
+            ("127.0.0.1", 5599),
+            {
+                "method": "perform_tasks",
+                "params": {"tasks": [{"task_uuid": "a"}, {"task_uuid": "b"}]},
+            },
+        )
+        self.complete = self.calculator._Calculator__task_completed_callback
+
+    def test_error_reported(self):
+        self.complete("a", None, "ZeroDivisionError")
+        self.complete("b", 1, None)
+        self.calculator.flush_completed()
+        address, data, _ = self.calculator.net_client.commands.popleft()
+        self.assertEqual(data["method"], "completed_tasks")
+        self.assertEqual(
+            data["params"]["tasks"],
+            [{"task_uuid": "a", "error": "ZeroDivisionError"}, {"task_uuid": "b"}],
+        )
+        self.assertEqual(data["params"]["free_slots"], 2)
+        self.assertEqual(self.calculator.failed_tasks, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+# coding: utf8
+from __future__ import print_function
+
+import json
+import logging
+import socket
+import threading
+import time
+import unittest
+
+from client import Client
+from net_protocol import ResponseConfirmation, TransmissionStatus
+from net_protocol.client import MAX_ACK_IDS, NetClient
+from net_protocol.codec import BinaryCodec
+from net_protocol.net_proto import PacketType
+from tests.fakes import FakeNetClient
+
+
+class CheckAcksTest(unittest.TestCase):
+    check_acks = staticmethod(NetClient._NetClient__check_acks)
+
+    def test_valid(self):
+        self.assertTrue(self.check_acks([1, 1, 3, 10]))
+        self.assertTrue(self.check_acks([1, MAX_ACK_IDS]))
+
+    def test_malformed(self):
+        for acks in (
+            5,
+            u"ab",
+            {1: 2},
+            [1],
+            [1.5, 2.5],
+            [u"a", u"b"],
+            [True, True],
+            [None, 1],
+            [5, 1],
+            [[1], [2]],
+        ):
+            self.assertFalse(self.check_acks(acks), acks)
+
+    def test_too_many_ids(self):
+        self.assertFalse(self.check_acks([1, MAX_ACK_IDS + 1]))
+        half = MAX_ACK_IDS // 2
+        self.assertFalse(self.check_acks([1, half, half + 1, MAX_ACK_IDS + 1]))
+
+
+class ServeForeverTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.server = NetClient(("127.0.0.1", 0))
+        self.server.add_handler_request(self.handle_request)
+        self.address = self.server.socket.getsockname()
+        self.received = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join(5)
+        logging.disable(logging.NOTSET)
+
+    def handle_request(self, address, message):
+        self.received.append(message)
+        return ResponseConfirmation(data=None)
+
+    def send(self, data):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(data, self.address)
+        sock.close()
+
+    def test_survives_broken_datagrams(self):
+        def broken(addr, message):
+            raise RuntimeError("broken")
+
+        self.server.process_answer_confirmation = broken
+        self.send(BinaryCodec.HEADER.pack(0xB1, 1, 0, 5) + b"\x81\x90\x00")
+        self.send(json.dumps({"packet_type": PacketType.ack, "acks": [1.5, 2.5]}))
+        self.send(
+            json.dumps({"packet_type": PacketType.response, "transmission_id": 1})
+        )
+        self.send(
+            json.dumps(
+                {"packet_type": PacketType.no_answer, "method": "status", "params": {}}
+            )
+        )
+        deadline = time.time() + 5
+        while not self.received and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.received), 1)
+        self.assertTrue(self.thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class SubmitBatchTest(unittest.TestCase):
+    """ задачи отправляются пачками не больше 3, без подтверждения не больше 4 """
+
+    def setUp(self):
+        self.client = Client(
+            FakeNetClient,
+            ("127.0.0.1", 0),
+            (1.0, 1.0),
+            max_batch_size=3,
+            submit_linger=0.005,
+            max_in_flight=4,
+        )
+        self.commands = self.client.net_client.commands
+
+    def submit(self, *task_ids):
+        for task_id in task_ids:
+            self.client.submit_task({"task_id": task_id})
+
+    def sent(self):
+        """ отправленные команды: списки task_id """
+        batches = []
+        for _, data, _ in self.commands:
+            if data["method"] == "add_task":
+                batches.append([data["params"]["task_id"]])
+            else:
+                batches.append([task["task_id"] for task in data["params"]["tasks"]])
+        return batches
+
+    def test_full_batch_sent(self):
+        self.submit(0, 1)
+        # пачка не заполнена, ждем submit_linger
+        self.assertEqual(self.sent(), [])
+        self.submit(2)
+        self.assertEqual(self.sent(), [[0, 1, 2]])
+
+    def test_linger(self):
+        self.submit(0)
+        self.client.flush_outbox()
+        self.assertEqual(self.sent(), [[0]])
+        self.assertEqual(self.commands[0][1]["method"], "add_task")
+
+    def test_in_flight_window(self):
+        self.submit(0, 1, 2, 3, 4, 5)
+        self.assertEqual(self.sent(), [[0, 1, 2], [3]])
+        self.assertEqual(self.client.in_flight, 4)
+        self.assertEqual(len(self.client.outbox), 2)
+        # подтверждение освобождает окно, накопленные задачи уходят
+        address, _, callback = self.commands[0]
+        callback(address, 1, TransmissionStatus.success)
+        self.assertEqual(self.sent(), [[0, 1, 2], [3], [4, 5]])
+        self.assertEqual(self.client.in_flight, 3)
+
+    def test_failure_frees_window(self):
+        self.submit(0, 1, 2)
+        address, _, callback = self.commands[0]
+        callback(address, 1, TransmissionStatus.failure)
+        self.assertEqual(self.client.in_flight, 0)
+
+
+class StatSignalTest(unittest.TestCase):
+    """ SIGUSR1 приходит, пока цикл событий держит блокировку клиента """
+
+    def setUp(self):
+        self.client = Client(FakeNetClient, ("127.0.0.1", 0), (1.0, 1.0))
+        self.printed = []
+        self.client.print_stat = lambda: self.printed.append(True)
+
+    def test_handler_does_not_lock(self):
+        with self.client.lock:
+            self.client.stat_signal_handler(10, None)
+        self.assertTrue(self.client.stat_requested)
+        self.assertFalse(self.printed)
+
+    def test_printed_from_loop_once(self):
+        self.client.stat_signal_handler(10, None)
+        self.client._Client__print_requested_stat()
+        self.client._Client__print_requested_stat()
+        self.assertEqual(self.printed, [True])
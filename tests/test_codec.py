@@ -0,0 +1,71 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from net_protocol.codec import MAX_DEPTH, BinaryCodec, CodecError, JsonCodec
+
+
+class BinaryCodecTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = BinaryCodec()
+
+    def header(self, method_code=1):
+        return BinaryCodec.HEADER.pack(0xB1, 1, 0, method_code)
+
+    def test_roundtrip(self):
+        message = {
+            "packet_type": 1,
+            "transmission_id": 7,
+            "method": "heartbeat",
+            "params": {"free_slots": 2, "tasks": [1, u"два", None, True, 1.5]},
+        }
+        self.assertEqual(self.codec.decode(self.codec.encode(message)), message)
+
+    def test_unhashable_key(self):
+        # ключ словаря - пустой список
+        with self.assertRaises(CodecError):
+            self.codec.decode(self.header(5) + b"\x81\x90\x00")
+
+    def test_non_scalar_key(self):
+        with self.assertRaises(CodecError):
+            self.codec.decode(self.header(5) + b"\x81\xc0\x00")
+
+    def test_deep_nesting(self):
+        body = b"\x91" * (MAX_DEPTH * 100) + b"\x00"
+        with self.assertRaises(CodecError):
+            self.codec.decode(self.header() + b"\x81\xa1p" + body)
+
+    def test_truncated(self):
+        message = {"packet_type": 1, "transmission_id": 7, "params": {"a": u"текст"}}
+        data = self.codec.encode(message)
+        for size in range(len(data)):
+            with self.assertRaises(CodecError):
+                self.codec.decode(data[:size])
+
+    def test_huge_length(self):
+        # массив из 2**32 - 1 элементов в пакете из нескольких байт
+        with self.assertRaises(CodecError):
+            self.codec.decode(self.header() + b"\x81\xa1p\xdd\xff\xff\xff\xff")
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(CodecError):
+            self.codec.decode(self.header() + b"\x81\xa1p\xa1\xff")
+
+
+class JsonCodecTest(unittest.TestCase):
+    def test_malformed(self):
+        codec = JsonCodec()
+        for data in (b"{", b"\xff", b"[" * 100000):
+            with self.assertRaises(CodecError):
+                codec.decode(data)
+
+    def test_not_object(self):
+        codec = JsonCodec()
+        for data in (b"[1]", b"5", b'"method"', b"null"):
+            with self.assertRaises(CodecError):
+                codec.decode(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+# coding: utf8
+from __future__ import print_function
+
+import socket
+import unittest
+
+from net_protocol import datagram_io
+from net_protocol.datagram_io import DrainDatagramIO, create_datagram_io
+
+
+class CreateDatagramIOTest(unittest.TestCase):
+    def setUp(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.setblocking(False)
+        self.libc = datagram_io._libc
+
+    def tearDown(self):
+        datagram_io._libc = self.libc
+        self.socket.close()
+
+    def test_mmsg_unavailable(self):
+        # платформа без recvmmsg/sendmmsg
+        datagram_io._libc = None
+        io = create_datagram_io(self.socket, 65535, 16, "mmsg")
+        self.assertIsInstance(io, DrainDatagramIO)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_datagram_io(self.socket, 65535, 16, "unknown")
+
+    def test_roundtrip(self):
+        for backend in sorted(datagram_io.DATAGRAM_IO_BACKENDS):
+            io = create_datagram_io(self.socket, 65535, 16, backend)
+            address = self.socket.getsockname()
+            self.assertEqual(io.send_batch([(b"ping", address)]), 1)
+            self.assertEqual(io.recv_batch(1.0), [(b"ping", address)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+# coding: utf8
+from __future__ import print_function
+
+import heapq
+import unittest
+
+from dispatcher import Dispatcher
+from entities import CalculatorStatus, TaskStatus
+from net_protocol import TransmissionStatus
+from tests.fakes import FakeNetClient
+
+CLIENT = ("127.0.0.2", 40000)
+CALCULATOR = ("127.0.0.3", 41000)
+OTHER_CALCULATOR = ("127.0.0.3", 41001)
+
+
+class FreeSlotsTest(unittest.TestCase):
+    """ у вычислителя с двумя слотами выполняются две задачи """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(FakeNetClient, ("127.0.0.1", 0))
+        self.net_client = self.dispatcher.net_client
+        self.heartbeat(free_slots=2, seq=1)
+        self.handle(
+            CLIENT,
+            "add_tasks",
+            {"tasks": [{"task_id": 1}, {"task_id": 2}, {"task_id": 3}]},
+        )
+        self.task_uuids = self.confirm_commands()
+        self.assertEqual(len(self.task_uuids), 2)
+        self.assertEqual(self.calculator.free_slots, 0)
+
+    @property
+    def calculator(self):
+        return self.dispatcher.calculators[CALCULATOR]
+
+    def handle(self, address, method, params):
+        return self.net_client.handler(address, {"method": method, "params": params})
+
+    def heartbeat(self, free_slots, seq, epoch=1, address=CALCULATOR):
+        self.handle(
+            address,
+            "heartbeat",
+            {
+                "status": CalculatorStatus.ready,
+                "capacity": 2,
+                "free_slots": free_slots,
+                "epoch": epoch,
+                "seq": seq,
+                "max_batch": 16,
+            },
+        )
+
+    def confirm_commands(
+        self, calculator=CALCULATOR, status=TransmissionStatus.success
+    ):
+        """ подтвердить команды диспетчера, вернуть задачи, отправленные вычислителю """
+        task_uuids = []
+        while self.net_client.commands:
+            address, data, callback = self.net_client.commands.popleft()
+            callback(address, 0, status)
+            if address != calculator:
+                continue
+            if data["method"] == "perform_task":
+                task_uuids.append(data["params"]["task_uuid"])
+            else:
+                task_uuids.extend(task["task_uuid"] for task in data["params"]["tasks"])
+        return task_uuids
+
+    def test_heartbeat_before_completed_task(self):
+        # слот освободился, heartbeat ушел раньше уведомления о задаче
+        self.heartbeat(free_slots=1, seq=2)
+        self.assertEqual(self.calculator.free_slots, 0)
+        self.assertEqual(self.confirm_commands(), [u"127.0.0.2:40000:3"])
+        self.handle(
+            CALCULATOR,
+            "completed_task",
+            {"task_uuid": self.task_uuids[0], "free_slots": 0, "epoch": 1, "seq": 3},
+        )
+        self.assertEqual(self.calculator.free_slots, 0)
+        self.assertEqual(self.calculator.state, CalculatorStatus.busy)
+
+    def test_stale_snapshot_ignored(self):
+        self.heartbeat(free_slots=0, seq=3)
+        self.handle(
+            CALCULATOR,
+            "completed_task",
+            {"task_uuid": self.task_uuids[0], "free_slots": 2, "epoch": 1, "seq": 2},
+        )
+        self.assertEqual(self.calculator.free_slots, 0)
+
+    def test_restarted_calculator(self):
+        self.heartbeat(free_slots=2, seq=1, epoch=2)
+        self.assertEqual(len(self.confirm_commands()), 1)
+        self.assertEqual(self.calculator.free_slots, 1)
+
+    def test_in_flight_subtracted(self):
+        self.handle(
+            CALCULATOR,
+            "completed_tasks",
+            {
+                "tasks": [{"task_uuid": task_uuid} for task_uuid in self.task_uuids],
+                "free_slots": 2,
+                "epoch": 1,
+                "seq": 2,
+            },
+        )
+        # третья задача отправлена, но еще не подтверждена
+        self.assertEqual(self.calculator.in_flight, 1)
+        self.heartbeat(free_slots=2, seq=3)
+        self.assertEqual(self.calculator.free_slots, 1)
+
+    def test_failed_task(self):
+        self.handle(
+            CALCULATOR,
+            "completed_task",
+            {"task_uuid": self.task_uuids[0], "error": "ZeroDivisionError"},
+        )
+        self.assertEqual(self.dispatcher.metrics.counters["failed"], 1)
+        self.assertEqual(self.dispatcher.metrics.counters["solved"], 0)
+        notifications = [
+            data["params"]
+            for address, data, _ in self.net_client.commands
+            if address == CLIENT
+        ]
+        self.assertEqual(
+            notifications,
+            [{"status": "error", "error": "ZeroDivisionError", "task_id": 1}],
+        )
+
+    def test_lost_calculator_tasks_requeued(self):
+        # вычислитель не ответил на запрос status
+        self.dispatcher.activity_poll_callback(
+            CALCULATOR, 0, TransmissionStatus.failure
+        )
+        for task_uuid in self.task_uuids:
+            task_info = self.dispatcher.tasks.get(task_uuid)
+            self.assertEqual(task_info.status, TaskStatus.error_accepted_calculator)
+            self.assertIsNone(task_info.calculator_address)
+        self.assertEqual(len(self.dispatcher.pending_tasks), 3)
+
+        # возвращенные задачи размещаются раньше остальных
+        self.heartbeat(free_slots=2, seq=1, address=OTHER_CALCULATOR)
+        self.assertEqual(
+            sorted(self.confirm_commands(OTHER_CALCULATOR)), sorted(self.task_uuids)
+        )
+        self.assertEqual(list(self.dispatcher.pending_tasks), [u"127.0.0.2:40000:3"])
+
+    def test_undelivered_batch_requeued_once(self):
+        self.heartbeat(free_slots=2, seq=2)
+        self.handle(CLIENT, "add_task", {"task_id": 4})
+        self.confirm_commands(status=TransmissionStatus.failure)
+        pending = list(self.dispatcher.pending_tasks)
+        self.assertEqual(len(pending), 4)
+        self.assertEqual(len(set(pending)), 4)
+        self.assertEqual(self.calculator.state, CalculatorStatus.not_available)
+        self.assertFalse(self.calculator.tasks)
+
+    def test_lost_calculator_expired_tasks(self):
+        for task_uuid in self.task_uuids:
+            self.dispatcher.tasks.get(task_uuid).created_tm -= 1000
+        self.dispatcher.set_calculator_state(CALCULATOR, CalculatorStatus.not_available)
+        self.assertEqual(self.dispatcher.metrics.counters["expired"], 2)
+        for task_uuid in self.task_uuids:
+            self.assertIsNone(self.dispatcher.tasks.get(task_uuid))
+
+    def test_lost_tasks_expired(self):
+        max_age = self.dispatcher.tasks.max_age
+        for task_uuid in self.task_uuids:
+            self.dispatcher.tasks.get(task_uuid).created_tm -= max_age
+        self.dispatcher.expire_lost_tasks()
+        self.assertEqual(self.dispatcher.metrics.counters["lost"], 2)
+        self.assertFalse(self.calculator.tasks)
+        # третья задача ждет в очереди, она моложе
+        self.assertEqual(len(self.dispatcher.tasks), 1)
+
+    def test_completed_task_without_snapshot(self):
+        self.handle(CALCULATOR, "completed_task", {"task_uuid": self.task_uuids[0]})
+        self.assertEqual(self.calculator.free_slots, 0)
+        self.assertEqual(self.confirm_commands(), [u"127.0.0.2:40000:3"])
+        self.handle(CALCULATOR, "completed_task", {"task_uuid": self.task_uuids[1]})
+        self.assertEqual(self.calculator.free_slots, 1)
+
+
+
+class PendingQueueTest(unittest.TestCase):
+    """ вычислителей нет, задачи ждут в очереди """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(
+            FakeNetClient, ("127.0.0.1", 0), timeout_task_placement=60
+        )
+        self.net_client = self.dispatcher.net_client
+        self.net_client.handler(
+            CLIENT,
+            {
+                "method": "add_tasks",
+                "params": {"tasks": [{"task_id": task_id} for task_id in range(4)]},
+            },
+        )
+        self.net_client.commands.clear()
+        self.task_uuids = [
+            "127.0.0.2:40000:{}".format(task_id) for task_id in range(4)
+        ]
+
+    def heartbeat(self, free_slots):
+        self.net_client.handler(
+            CALCULATOR,
+            {
+                "method": "heartbeat",
+                "params": {
+                    "status": CalculatorStatus.ready,
+                    "capacity": free_slots,
+                    "free_slots": free_slots,
+                    "epoch": 1,
+                    "seq": 1,
+                    "max_batch": 16,
+                },
+            },
+        )
+
+    def sent_task_uuids(self):
+        task_uuids = []
+        while self.net_client.commands:
+            _, data, _ = self.net_client.commands.popleft()
+            if data["method"] == "perform_task":
+                task_uuids.append(data["params"]["task_uuid"])
+            elif data["method"] == "perform_tasks":
+                task_uuids.extend(
+                    task["task_uuid"] for task in data["params"]["tasks"]
+                )
+        return task_uuids
+
+    def test_placed_in_arrival_order(self):
+        self.assertEqual(list(self.dispatcher.pending_tasks), self.task_uuids)
+        self.heartbeat(free_slots=3)
+        self.assertEqual(self.sent_task_uuids(), self.task_uuids[:3])
+        self.assertEqual(list(self.dispatcher.pending_tasks), self.task_uuids[3:])
+
+    def test_deadline_heap(self):
+        # срок размещения первой задачи истек
+        deadlines = self.dispatcher.placement_deadlines
+        for index, (deadline, task_uuid) in enumerate(deadlines):
+            if task_uuid == self.task_uuids[0]:
+                deadlines[index] = (deadline - 120, task_uuid)
+        heapq.heapify(deadlines)
+        self.dispatcher.repeat_unsuccessful_tasks()
+        self.assertIsNone(self.dispatcher.tasks.get(self.task_uuids[0]))
+        self.assertEqual(self.dispatcher.metrics.counters["expired"], 1)
+        self.assertEqual(len(self.dispatcher.placement_deadlines), 3)
+        # снятая задача остается в очереди и пропускается при извлечении
+        self.heartbeat(free_slots=4)
+        self.assertEqual(self.sent_task_uuids(), self.task_uuids[1:])
+        self.assertFalse(self.dispatcher.pending_tasks)
+
+    def test_placed_task_not_expired(self):
+        self.heartbeat(free_slots=4)
+        self.sent_task_uuids()
+        self.dispatcher.placement_deadlines = [
+            (0.0, task_uuid) for task_uuid in self.task_uuids
+        ]
+        self.dispatcher.repeat_unsuccessful_tasks()
+        self.assertEqual(self.dispatcher.metrics.counters["expired"], 0)
+        self.assertEqual(len(self.dispatcher.tasks), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from net_protocol.event_loop import TimerScheduler
+
+
+class TimerSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TimerScheduler()
+        self.calls = []
+
+    def record(self, name):
+        self.calls.append(name)
+
+    def test_deadline_order(self):
+        _, earliest = self.scheduler.schedule(2.0, None, self.record, "b")
+        self.assertTrue(earliest)
+        _, earliest = self.scheduler.schedule(3.0, None, self.record, "c")
+        self.assertFalse(earliest)
+        _, earliest = self.scheduler.schedule(1.0, None, self.record, "a")
+        self.assertTrue(earliest)
+        self.assertEqual(self.scheduler.run_due(2.5), 2)
+        self.assertEqual(self.calls, ["a", "b"])
+        self.assertEqual(self.scheduler.next_deadline(), 3.0)
+
+    def test_cancel(self):
+        handle, _ = self.scheduler.schedule(1.0, None, self.record, "a")
+        self.scheduler.schedule(2.0, None, self.record, "b")
+        handle.cancel()
+        # отмененный таймер пропускается и при поиске ближайшего срока
+        self.assertEqual(self.scheduler.next_deadline(), 2.0)
+        self.assertEqual(self.scheduler.run_due(10.0), 1)
+        self.assertEqual(self.calls, ["b"])
+
+    def test_cancelled_by_earlier_timer(self):
+        handle, _ = self.scheduler.schedule(2.0, None, self.record, "b")
+        self.scheduler.schedule(1.0, None, handle.cancel)
+        self.scheduler.run_due(10.0)
+        self.assertEqual(self.calls, [])
+
+    def test_periodic_without_drift(self):
+        handle, _ = self.scheduler.schedule(1.0, 1.0, self.record, "tick")
+        # вызов опоздал, следующий срок считается от прошлого срока
+        self.scheduler.run_due(1.3)
+        self.assertEqual(handle.deadline, 2.0)
+        # пропущенные срабатывания не повторяются
+        self.assertEqual(self.scheduler.run_due(4.5), 1)
+        self.assertEqual(handle.deadline, 5.0)
+        self.assertEqual(self.calls, ["tick", "tick"])
+        handle.cancel()
+        self.assertEqual(self.scheduler.run_due(10.0), 0)
+        self.assertIsNone(self.scheduler.next_deadline())
+
+    def test_error_not_stops_others(self):
+        def fail():
+            raise RuntimeError("ошибка таймера")
+
+        self.scheduler.schedule(1.0, None, fail)
+        self.scheduler.schedule(1.0, None, self.record, "a")
+        self.assertEqual(self.scheduler.run_due(1.0), 2)
+        self.assertEqual(self.calls, ["a"])
+
+    def test_clear(self):
+        handle, _ = self.scheduler.schedule(1.0, 1.0, self.record, "a")
+        self.scheduler.clear()
+        self.assertTrue(handle.cancelled)
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual(self.scheduler.run_due(10.0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
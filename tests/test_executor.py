@@ -0,0 +1,65 @@
+# coding: utf8
+from __future__ import print_function
+
+import threading
+import time
+import unittest
+
+from net_protocol.executor import HandlerExecutor
+
+PEERS = [("127.0.0.1", port) for port in range(9000, 9008)]
+
+
+class HandlerExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = HandlerExecutor(workers=4, queue_size=1000)
+        self.executor.start()
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def record(self, peer, seq):
+        # разная задержка меняет чередование потоков
+        time.sleep(0.0001 * (seq % 3))
+        with self.lock:
+            self.calls.setdefault(peer, []).append(seq)
+
+    def test_per_peer_order(self):
+        for seq in range(100):
+            for peer in PEERS:
+                self.assertTrue(self.executor.submit(peer, self.record, peer, seq))
+        self.executor.shutdown()
+        for peer in PEERS:
+            self.assertEqual(self.calls[peer], list(range(100)))
+        stats = self.executor.get_stats()
+        self.assertEqual(stats["completed"], 100 * len(PEERS))
+        self.assertEqual(stats["queued"], 0)
+
+    def test_queue_full(self):
+        executor = HandlerExecutor(workers=1, queue_size=2)
+        # потоки не запущены, задачи остаются в очереди
+        self.assertTrue(executor.submit(PEERS[0], self.record, PEERS[0], 0))
+        self.assertTrue(executor.submit(PEERS[0], self.record, PEERS[0], 1))
+        self.assertFalse(executor.submit(PEERS[0], self.record, PEERS[0], 2))
+        self.assertEqual(executor.get_stats()["rejected"], 1)
+
+    def test_error_counted(self):
+        def fail():
+            raise RuntimeError("ошибка обработчика")
+
+        self.executor.submit(PEERS[0], fail)
+        self.executor.submit(PEERS[0], self.record, PEERS[0], 0)
+        self.executor.shutdown()
+        self.assertEqual(self.executor.get_stats()["errors"], 1)
+        # ошибка не останавливает поток
+        self.assertEqual(self.calls[PEERS[0]], [0])
+
+    def test_rejected_after_shutdown(self):
+        self.executor.shutdown()
+        self.assertFalse(self.executor.submit(PEERS[0], self.record, PEERS[0], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from dispatcher.failure_detector import FailureDetector, PhiAccrualDetector
+
+ADDRESS = ("127.0.0.3", 41000)
+
+
+class PhiAccrualDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = PhiAccrualDetector(first_interval=1.0)
+        for tm in range(11):
+            self.detector.heartbeat(float(tm))
+
+    def mean_interval(self):
+        return self.detector.total / len(self.detector.intervals)
+
+    def test_phi_grows_with_silence(self):
+        self.assertLess(self.detector.phi(10.5), 1.0)
+        self.assertLess(self.detector.phi(11.0), self.detector.phi(12.0))
+        self.assertGreater(self.detector.phi(14.0), 8.0)
+
+    def test_touch_does_not_change_intervals(self):
+        self.detector.touch(10.9)
+        self.detector.heartbeat(11.0)
+        self.assertAlmostEqual(self.mean_interval(), 1.0)
+        self.assertAlmostEqual(self.detector.intervals[-1], 1.0)
+
+    def test_touch_resets_silence(self):
+        phi = self.detector.phi(13.0)
+        self.detector.touch(12.5)
+        self.assertLess(self.detector.phi(13.0), phi)
+        self.assertLess(self.detector.phi(13.0), 1.0)
+
+    def test_stale_touch_ignored(self):
+        self.detector.touch(5.0)
+        self.assertEqual(self.detector.last_tm, 10.0)
+
+    def test_window(self):
+        detector = PhiAccrualDetector(window_size=3, first_interval=1.0)
+        for tm in (0.0, 5.0, 10.0, 15.0, 20.0):
+            detector.heartbeat(tm)
+        self.assertEqual(list(detector.intervals), [5.0, 5.0, 5.0])
+        self.assertAlmostEqual(detector.total, 15.0)
+        self.assertAlmostEqual(detector.total_squares, 75.0)
+
+
+class FailureDetectorTest(unittest.TestCase):
+    def test_unknown_address(self):
+        detector = FailureDetector()
+        detector.touch(ADDRESS, 1.0)
+        self.assertEqual(detector.phi(ADDRESS, 100.0), 0.0)
+
+    def test_reported_interval(self):
+        detector = FailureDetector()
+        detector.heartbeat(ADDRESS, interval=5.0, current_tm=0.0)
+        self.assertLess(detector.phi(ADDRESS, 5.0), detector.suspect_phi)
+        self.assertGreater(detector.phi(ADDRESS, 12.0), detector.failure_phi)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+import unittest
+
+from dispatcher import Dispatcher
+from entities import TaskStatus
+from net_protocol import TransmissionStatus
+from tests.fakes import FakeNetClient
+
+CLIENT = ("127.0.0.2", 40000)
+NEIGHBOR = ("127.0.0.4", 5555)
+TASK_UUID = "127.0.0.2:40000:1"
+
+
+class ForwardedTasksTest(unittest.TestCase):
+    """ задача клиента передана соседу, своих вычислителей у диспетчера нет """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(
+            FakeNetClient,
+            ("127.0.0.1", 0),
+            federation={
+                "neighbors": [{"host": NEIGHBOR[0], "port": NEIGHBOR[1]}],
+                "forward_after": 0,
+            },
+        )
+        self.federation = self.dispatcher.federation
+        self.handle(NEIGHBOR, "capacity", {"free": 4, "local_free": 4})
+        self.handle(CLIENT, "add_task", {"task_id": 1})
+        self.federation.forward_pending()
+        address, data, callback = self.dispatcher.net_client.commands.popleft()
+        self.assertEqual((address, data["method"]), (NEIGHBOR, "forward_tasks"))
+        callback(address, 0, TransmissionStatus.success)
+        self.assertEqual(self.status(), TaskStatus.forwarded_to_dispatcher)
+
+    def handle(self, address, method, params):
+        return self.dispatcher.handle_message(
+            address, {"method": method, "params": params}
+        )
+
+    def status(self):
+        return self.dispatcher.tasks.get(TASK_UUID).status
+
+    def test_neighbor_stopped_reporting(self):
+        self.federation.neighbors[NEIGHBOR].last_update_tm -= 60
+        self.federation.report_capacity()
+        self.assertEqual(self.status(), TaskStatus.error_accepted_calculator)
+        self.assertEqual(list(self.dispatcher.pending_tasks), [TASK_UUID])
+
+    def test_forwarded_timeout(self):
+        self.federation.expire_forwarded(time.time())
+        self.assertEqual(self.status(), TaskStatus.forwarded_to_dispatcher)
+        self.federation.expire_forwarded(
+            time.time() + self.federation.forwarded_timeout
+        )
+        self.assertEqual(self.status(), TaskStatus.error_accepted_calculator)
+        self.assertFalse(self.federation.neighbors[NEIGHBOR].forwarded)
+
+    def test_finished_task_forgotten(self):
+        self.handle(
+            NEIGHBOR,
+            "forwarded_finished",
+            {"tasks": [{"task_uuid": TASK_UUID, "success": True}]},
+        )
+        self.assertFalse(self.federation.neighbors[NEIGHBOR].forwarded)
+        self.federation.neighbors[NEIGHBOR].last_update_tm -= 60
+        self.federation.report_capacity()
+        self.assertNotIn(TASK_UUID, self.dispatcher.pending_tasks)
+
+
+
+class WithoutFederationTest(unittest.TestCase):
+    def test_forward_tasks_rejected(self):
+        dispatcher = Dispatcher(FakeNetClient, ("127.0.0.1", 0))
+        response = dispatcher.handle_message(
+            NEIGHBOR,
+            {
+                "method": "forward_tasks",
+                "params": {"tasks": [{"task_uuid": TASK_UUID, "params": {}}]},
+            },
+        )
+        # без подтверждения сосед вернет задачу в очередь
+        self.assertIsNone(response)
+        self.assertNotIn(TASK_UUID, dispatcher.tasks)
+        self.assertFalse(dispatcher.pending_tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
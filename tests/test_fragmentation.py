@@ -0,0 +1,80 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+import unittest
+
+from net_protocol.fragmentation import FRAGMENT_HEADER, Fragmenter, Reassembler
+
+PEER = ("127.0.0.1", 9)
+OTHER_PEER = ("127.0.0.1", 10)
+
+
+class ReassemblerTest(unittest.TestCase):
+    def setUp(self):
+        self.fragmenter = Fragmenter(FRAGMENT_HEADER.size + 10)
+        self.reassembler = Reassembler(max_messages=2, timeout=5.0, max_message_size=40)
+
+    def test_small_message_not_split(self):
+        self.assertEqual(self.fragmenter.split(b"x" * 10), [b"x" * 10])
+
+    def test_out_of_order(self):
+        data = b"".join(str(index).encode("ascii") * 10 for index in range(3))
+        fragments = self.fragmenter.split(data)
+        self.assertEqual(len(fragments), 3)
+        self.assertIsNone(self.reassembler.add(PEER, fragments[2]))
+        # повтор фрагмента не учитывается
+        self.assertIsNone(self.reassembler.add(PEER, fragments[2]))
+        self.assertIsNone(self.reassembler.add(PEER, fragments[0]))
+        self.assertEqual(self.reassembler.add(PEER, fragments[1]), data)
+        self.assertEqual(len(self.reassembler), 0)
+
+    def test_same_id_from_other_address(self):
+        fragments = self.fragmenter.split(b"a" * 30)
+        self.assertIsNone(self.reassembler.add(PEER, fragments[0]))
+        self.assertIsNone(self.reassembler.add(OTHER_PEER, fragments[1]))
+        self.assertEqual(len(self.reassembler), 2)
+
+    def test_max_messages(self):
+        for _ in range(3):
+            self.reassembler.add(PEER, self.fragmenter.split(b"a" * 30)[0])
+        # самое старое сообщение вытеснено
+        self.assertEqual(len(self.reassembler), 2)
+        self.assertEqual(self.reassembler.dropped, 1)
+
+    def test_max_message_size(self):
+        fragments = self.fragmenter.split(b"a" * 50)
+        for fragment in fragments[:4]:
+            self.assertIsNone(self.reassembler.add(PEER, fragment))
+        with self.assertRaises(ValueError):
+            self.reassembler.add(PEER, fragments[4])
+        self.assertEqual(len(self.reassembler), 0)
+        self.assertEqual(self.reassembler.dropped, 1)
+
+    def test_timeout(self):
+        fragments = self.fragmenter.split(b"a" * 30)
+        self.reassembler.add(PEER, fragments[0])
+        self.reassembler.expire(time.time() + 4.0)
+        self.assertEqual(len(self.reassembler), 1)
+        self.reassembler.expire(time.time() + 5.0)
+        self.assertEqual(len(self.reassembler), 0)
+        self.assertEqual(self.reassembler.dropped, 1)
+        # оставшийся фрагмент начинает новое сообщение
+        self.assertIsNone(self.reassembler.add(PEER, fragments[1]))
+
+    def test_malformed(self):
+        fragments = self.fragmenter.split(b"a" * 30)
+        for datagram in (
+            fragments[0][: FRAGMENT_HEADER.size - 1],
+            FRAGMENT_HEADER.pack(0xF7, 1, 2, 2),
+        ):
+            with self.assertRaises(ValueError):
+                self.reassembler.add(PEER, datagram)
+        self.reassembler.add(PEER, fragments[0])
+        _, message_id, _, _ = FRAGMENT_HEADER.unpack_from(fragments[0])
+        with self.assertRaises(ValueError):
+            self.reassembler.add(PEER, FRAGMENT_HEADER.pack(0xF7, message_id, 1, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
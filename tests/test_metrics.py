@@ -0,0 +1,53 @@
+# coding: utf8
+from __future__ import print_function
+
+import random
+import unittest
+
+from metrics import LatencyHistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def setUp(self):
+        self.histogram = LatencyHistogram()
+
+    def test_empty(self):
+        self.assertIsNone(self.histogram.percentile(50))
+        self.assertIsNone(self.histogram.mean())
+        self.assertEqual(self.histogram.get_stats(), {"count": 0, "sum": 0.0})
+
+    def test_small_values_exact(self):
+        # значения меньше sub_buckets микросекунд хранятся без погрешности
+        for value in range(1, 101):
+            self.histogram.record(value / 1e6)
+        self.assertAlmostEqual(self.histogram.percentile(50), 50.5e-6)
+        self.assertAlmostEqual(self.histogram.percentile(100), 100e-6)
+        self.assertAlmostEqual(self.histogram.mean(), 50.5e-6)
+
+    def test_relative_error(self):
+        rnd = random.Random(1)
+        values = sorted(rnd.uniform(0.001, 10.0) for _ in range(10000))
+        for value in values:
+            self.histogram.record(value)
+        for percent in (50, 90, 99, 99.9):
+            expected = values[int(len(values) * percent / 100.0 + 0.5) - 1]
+            error = abs(self.histogram.percentile(percent) - expected) / expected
+            self.assertLess(error, 2.0 / self.histogram.sub_buckets, percent)
+
+    def test_bounded_by_observed(self):
+        self.histogram.record(1.2345)
+        for percent in (0, 50, 100):
+            self.assertEqual(self.histogram.percentile(percent), 1.2345)
+
+    def test_stats(self):
+        for value in (0.1, 0.2, 0.3):
+            self.histogram.record(value)
+        stats = self.histogram.get_stats(percents=(50,))
+        self.assertEqual(sorted(stats), ["count", "max", "mean", "p50", "sum"])
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual(stats["max"], 0.3)
+        self.assertAlmostEqual(stats["p50"], 0.2, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
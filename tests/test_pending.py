@@ -0,0 +1,98 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+import unittest
+
+from net_protocol.net_proto import NetCommand, PacketType, TransmissionIdGenerator
+from net_protocol.pending import PendingCommands, PendingLimitExceeded
+
+PEER = ("127.0.0.1", 9)
+
+
+def make_command(transmission_id, next_send_tm):
+    return NetCommand(
+        address=PEER,
+        data={"method": "ping"},
+        packet_type=PacketType.request,
+        transmission_id=transmission_id,
+        callback=lambda *args: None,
+        next_send_tm=next_send_tm,
+    )
+
+
+class PendingCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.pending = PendingCommands(max_pending=3)
+        for transmission_id, next_send_tm in ((1, 2.0), (2, 1.0), (3, 3.0)):
+            self.pending.add(
+                PEER + (transmission_id,), make_command(transmission_id, next_send_tm)
+            )
+
+    def test_pop_due_in_deadline_order(self):
+        due = self.pending.pop_due(2.5, 10)
+        self.assertEqual([ckey[2] for ckey, _ in due], [2, 1])
+        self.assertEqual(self.pending.next_deadline(), 3.0)
+
+    def test_limit(self):
+        with self.assertRaises(PendingLimitExceeded):
+            self.pending.add(PEER + (4,), make_command(4, 0.0))
+        with self.assertRaises(KeyError):
+            self.pending.add(PEER + (1,), make_command(1, 0.0))
+
+    def test_removed_skipped(self):
+        self.assertIsNotNone(self.pending.remove(PEER + (2,)))
+        self.assertNotIn(PEER + (2,), self.pending)
+        self.assertEqual(
+            [ckey[2] for ckey, _ in self.pending.pop_due(10.0, 10)], [1, 3]
+        )
+
+    def test_rescheduled_once(self):
+        # старая запись в куче устарела и пропускается
+        self.pending.reschedule(PEER + (2,), 5.0)
+        self.assertEqual(
+            [ckey[2] for ckey, _ in self.pending.pop_due(10.0, 10)], [1, 3, 2]
+        )
+
+    def test_compact(self):
+        pending = PendingCommands(max_pending=10000)
+        for transmission_id in range(1, 2001):
+            ckey = PEER + (transmission_id,)
+            pending.add(ckey, make_command(transmission_id, 1.0))
+        for transmission_id in range(1, 2001):
+            pending.remove(PEER + (transmission_id,))
+        self.assertEqual(len(pending), 0)
+        # записи удаленных команд вычищены из кучи
+        self.assertLessEqual(len(pending.timer), 1024)
+
+
+class TransmissionIdGeneratorTest(unittest.TestCase):
+    def test_format(self):
+        started_tm = int(time.time())
+        generator = TransmissionIdGenerator()
+        transmission_id = generator.next()
+        self.assertIn(transmission_id >> 32, (started_tm, started_tm + 1))
+        self.assertEqual(transmission_id & 0xFFFFFFFF, 1)
+        self.assertLess(transmission_id, 1 << 64)
+
+    def test_monotonic(self):
+        generator = TransmissionIdGenerator()
+        ids = [generator.next() for _ in range(1000)]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_counter_overflow(self):
+        generator = TransmissionIdGenerator()
+        last = generator.next()
+        generator.counter = generator.COUNTER_MASK
+        transmission_id = generator.next()
+        self.assertGreater(transmission_id, last)
+        self.assertEqual(transmission_id & generator.COUNTER_MASK, 1)
+
+    def test_restart_increases(self):
+        first = TransmissionIdGenerator()
+        first.prefix -= 1
+        self.assertGreater(TransmissionIdGenerator().next(), first.next())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from dispatcher.placement import (
+    PLACEMENT_POLICIES,
+    LatencyPool,
+    LruPool,
+    RoundRobinPool,
+    create_ready_pool,
+)
+
+CALCULATORS = [("127.0.0.3", port) for port in range(41000, 41004)]
+
+
+class ReadyPoolTest(unittest.TestCase):
+    """ общие свойства всех политик """
+
+    def test_add_discard_acquire(self):
+        for name in PLACEMENT_POLICIES:
+            pool = create_ready_pool(name)
+            for address in CALCULATORS:
+                pool.add(address)
+            # повторное добавление игнорируется
+            pool.add(CALCULATORS[0])
+            pool.discard(CALCULATORS[1])
+            self.assertEqual(len(pool), 3, name)
+            self.assertNotIn(CALCULATORS[1], pool, name)
+            acquired = [pool.acquire() for _ in range(4)]
+            self.assertEqual(
+                sorted(acquired[:3]),
+                sorted([CALCULATORS[0], CALCULATORS[2], CALCULATORS[3]]),
+                name,
+            )
+            self.assertIsNone(acquired[3], name)
+            self.assertEqual(len(pool), 0, name)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            create_ready_pool("random")
+
+
+class RoundRobinPoolTest(unittest.TestCase):
+    def test_release_order(self):
+        pool = RoundRobinPool()
+        for address in reversed(CALCULATORS):
+            pool.add(address)
+        self.assertEqual(pool.acquire(), CALCULATORS[3])
+        pool.add(CALCULATORS[3])
+        self.assertEqual(
+            [pool.acquire() for _ in range(4)],
+            [CALCULATORS[2], CALCULATORS[1], CALCULATORS[0], CALCULATORS[3]],
+        )
+
+
+class LruPoolTest(unittest.TestCase):
+    def test_least_recently_used(self):
+        pool = LruPool()
+        for address in CALCULATORS[:2]:
+            pool.add(address)
+        first = pool.acquire()
+        pool.add(first)
+        # второй вычислитель еще не получал задач
+        self.assertNotEqual(pool.acquire(), first)
+        self.assertEqual(pool.acquire(), first)
+
+
+class LatencyPoolTest(unittest.TestCase):
+    def test_fastest_first(self):
+        pool = LatencyPool(alpha=0.5)
+        pool.record_latency(CALCULATORS[0], 2.0)
+        pool.record_latency(CALCULATORS[1], 1.0)
+        pool.record_latency(CALCULATORS[1], 3.0)
+        self.assertEqual(pool.latency[CALCULATORS[1]], 2.0)
+        pool.record_latency(CALCULATORS[2], 0.5)
+        for address in CALCULATORS:
+            pool.add(address)
+        # вычислитель без измерений выбирается первым
+        self.assertEqual(
+            [pool.acquire() for _ in range(4)],
+            [CALCULATORS[3], CALCULATORS[2], CALCULATORS[0], CALCULATORS[1]],
+        )
+
+    def test_compact(self):
+        pool = LatencyPool()
+        pool.add(CALCULATORS[0])
+        for _ in range(200):
+            pool.add(CALCULATORS[1])
+            pool.discard(CALCULATORS[1])
+        # устаревшие записи вычищаются из кучи
+        self.assertLess(len(pool.heap), 100)
+        self.assertEqual(pool.acquire(), CALCULATORS[0])
+        self.assertIsNone(pool.acquire())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# coding: utf8
+from __future__ import print_function
+
+import unittest
+
+from dispatcher.registry import TaskInfo, TaskRegistry
+from entities import TaskStatus
+
+
+def make_task():
+    task_info = TaskInfo()
+    task_info.status = TaskStatus.accepted_from_client
+    return task_info
+
+
+class FinishedEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = TaskRegistry(ttl=10.0, max_finished=3)
+        for task_uuid in "abcd":
+            self.registry.add(task_uuid, make_task())
+
+    def test_finished_record(self):
+        self.registry.finish("a", TaskStatus.solved)
+        self.assertIsNone(self.registry.get("a"))
+        self.assertIn("a", self.registry)
+        self.assertEqual(self.registry.get_status("a"), TaskStatus.solved)
+        self.assertEqual(len(self.registry), 3)
+        self.assertEqual(sorted(self.registry), ["b", "c", "d"])
+
+    def test_max_finished(self):
+        for task_uuid in "abcd":
+            self.registry.finish(task_uuid, TaskStatus.solved)
+        # самая старая запись вытеснена
+        self.assertNotIn("a", self.registry)
+        self.assertEqual(list(self.registry.finished), ["b", "c", "d"])
+
+    def test_ttl(self):
+        self.registry.finish("a", TaskStatus.solved)
+        self.registry.finish("b", TaskStatus.solved)
+        finished_tm = self.registry.finished["b"][1]
+        self.assertEqual(self.registry.expire(finished_tm + 9), 0)
+        self.assertEqual(self.registry.expire(finished_tm + 10), 2)
+        self.assertNotIn("a", self.registry)
+        # незавершенные задачи по ttl не удаляются
+        self.assertEqual(len(self.registry), 2)
+
+    def test_readded_after_finish(self):
+        self.registry.finish("a", TaskStatus.error_placement_timeout)
+        task_info = make_task()
+        self.registry.add("a", task_info)
+        self.assertIs(self.registry.get("a"), task_info)
+        self.assertNotIn("a", self.registry.finished)
+
+
+class ActiveAgeTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = TaskRegistry(max_age=60.0)
+        self.task_info = make_task()
+        self.registry.add("a", self.task_info)
+
+    def test_young_task_kept(self):
+        expired = self.registry.expire_active(self.task_info.created_tm + 59)
+        self.assertEqual(expired, [])
+        self.assertIs(self.registry.get("a"), self.task_info)
+
+    def test_old_task_finished(self):
+        expired = self.registry.expire_active(self.task_info.created_tm + 60)
+        self.assertEqual(expired, [("a", self.task_info)])
+        self.assertIsNone(self.registry.get("a"))
+        self.assertEqual(self.registry.get_status("a"), TaskStatus.error_lost)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+import unittest
+
+from net_protocol.client import NetClient
+from net_protocol.net_proto import MSG_FIELD_TRANSMISSION_ID
+from net_protocol.retransmit import RetransmitTimer, RtoEstimator
+
+PEER = ("127.0.0.1", 9)
+
+
+class RtoEstimatorTest(unittest.TestCase):
+    def setUp(self):
+        self.estimator = RtoEstimator(0.2, 0.05, 5.0)
+
+    def test_initial_rto(self):
+        self.assertEqual(self.estimator.get_rto(PEER), 0.2)
+
+    def test_first_sample(self):
+        # SRTT = R, RTTVAR = R / 2, RTO = SRTT + 4 * RTTVAR
+        self.estimator.update(PEER, 0.1)
+        self.assertAlmostEqual(self.estimator.get_rto(PEER), 0.3)
+
+    def test_next_sample(self):
+        self.estimator.update(PEER, 0.1)
+        self.estimator.update(PEER, 0.1)
+        # RTTVAR = 3/4 * 0.05, SRTT не меняется
+        self.assertAlmostEqual(self.estimator.get_rto(PEER), 0.1 + 4 * 0.0375)
+
+    def test_bounds(self):
+        self.estimator.update(PEER, 0.001)
+        self.assertEqual(self.estimator.get_rto(PEER), 0.05)
+        self.estimator.update(("127.0.0.1", 10), 10.0)
+        self.assertEqual(self.estimator.get_rto(("127.0.0.1", 10)), 5.0)
+
+    def test_backoff(self):
+        self.assertEqual(
+            [self.estimator.get_backoff(PEER, attempt) for attempt in (1, 2, 3)],
+            [0.2, 0.4, 0.8],
+        )
+        self.assertEqual(self.estimator.get_backoff(PEER, 10), 5.0)
+
+    def test_backoff_jitter(self):
+        for _ in range(100):
+            rto = self.estimator.get_backoff(PEER, 2, jitter=0.1)
+            self.assertTrue(0.36 <= rto <= 0.44, rto)
+
+
+class RetransmitTimerTest(unittest.TestCase):
+    def test_pop_due(self):
+        timer = RetransmitTimer()
+        for deadline, key in ((3.0, "c"), (1.0, "a"), (2.0, "b"), (1.0, "a2")):
+            timer.push(deadline, key)
+        self.assertEqual(timer.next_deadline(), 1.0)
+        # при равных сроках сохраняется порядок добавления
+        self.assertEqual(timer.pop_due(2.0, 2), [(1.0, "a"), (1.0, "a2")])
+        self.assertEqual(timer.pop_due(2.0, 10), [(2.0, "b")])
+        self.assertEqual(timer.pop_due(2.0, 10), [])
+        self.assertEqual(len(timer), 1)
+
+    def test_compact(self):
+        timer = RetransmitTimer()
+        timer.push(1.0, "a")
+        timer.push(2.0, "b")
+        timer.compact(lambda deadline, key: key == "b")
+        self.assertEqual(timer.pop_due(10.0, 10), [(2.0, "b")])
+
+
+class KarnTest(unittest.TestCase):
+    """ RTT измеряется только по командам, подтвержденным после единственной отправки """
+
+    def setUp(self):
+        self.net_client = NetClient(("127.0.0.1", 0))
+
+    def tearDown(self):
+        self.net_client.shutdown()
+
+    def confirm(self, attempts):
+        self.net_client.send_command(PEER, {"method": "ping"}, lambda *args: None)
+        cmd = max(
+            self.net_client.pending.commands.values(),
+            key=lambda command: command.transmission_id,
+        )
+        cmd.attempts = attempts
+        cmd.sent_tm = time.time() - 0.1
+        self.net_client.process_answer_confirmation(
+            PEER, {MSG_FIELD_TRANSMISSION_ID: cmd.transmission_id}
+        )
+
+    def test_retransmitted_not_measured(self):
+        self.confirm(attempts=2)
+        self.assertNotIn(PEER, self.net_client.rto_estimator.peers)
+
+    def test_single_send_measured(self):
+        self.confirm(attempts=1)
+        srtt, _ = self.net_client.rto_estimator.peers[PEER]
+        self.assertAlmostEqual(srtt, 0.1, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+# coding: utf8
+from __future__ import print_function
+
+import time
+import unittest
+
+from dispatcher import Dispatcher
+from entities import CalculatorStatus, TaskStatus
+from net_protocol import TransmissionStatus
+from tests.fakes import FakeNetClient
+
+CLIENT = ("127.0.0.2", 40000)
+CALCULATOR = ("127.0.0.3", 41000)
+PEER_SHARD = ("127.0.0.1", 6556)
+TASK_UUID = "127.0.0.2:40000:1"
+PEER_TASK_UUID = "127.0.0.2:40001:1"
+
+
+class StealTest(unittest.TestCase):
+    """ второй шард принимает задачи своих клиентов и отдает их первому """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(
+            FakeNetClient, ("127.0.0.1", 5555), shard_index=0, shards=2
+        )
+        self.shard_link = self.dispatcher.shard_link
+        self.shard_commands = self.shard_link.net_client.commands
+
+    def add_task(self):
+        self.dispatcher.handle_message(
+            CLIENT, {"method": "add_task", "params": {"task_id": 1}}
+        )
+
+    def accept_peer_task(self):
+        self.dispatcher.accept_transferred_tasks(
+            PEER_SHARD,
+            [
+                {
+                    "task_uuid": PEER_TASK_UUID,
+                    "client": ["127.0.0.2", 40001],
+                    "params": {"task_id": 1},
+                    "created_tm": time.time(),
+                }
+            ],
+        )
+
+    def test_steal_free_slots(self):
+        # свободных слотов нет, просить задачи незачем
+        self.shard_link.steal()
+        self.assertFalse(self.shard_commands)
+        self.dispatcher.handle_message(
+            CALCULATOR,
+            {
+                "method": "heartbeat",
+                "params": {
+                    "status": CalculatorStatus.ready,
+                    "capacity": 2,
+                    "free_slots": 2,
+                    "epoch": 1,
+                    "seq": 1,
+                    "max_batch": 16,
+                },
+            },
+        )
+        self.shard_link.steal()
+        address, data, _ = self.shard_commands.popleft()
+        self.assertEqual(address, PEER_SHARD)
+        self.assertEqual(data, {"method": "steal_tasks", "params": {"count": 2}})
+        # следующий запрос только после подтверждения текущего
+        self.shard_link.steal()
+        self.assertFalse(self.shard_commands)
+
+    def test_steal_with_pending(self):
+        self.add_task()
+        self.shard_link.steal()
+        self.assertFalse(self.shard_commands)
+
+    def test_give_keeps_transferred(self):
+        self.add_task()
+        self.accept_peer_task()
+        self.shard_link.give_tasks(PEER_SHARD, 5)
+        _, data, _ = self.shard_commands.popleft()
+        self.assertEqual(data["method"], "transfer_tasks")
+        # задача другого шарда дальше не передается
+        self.assertEqual(
+            [task["task_uuid"] for task in data["params"]["tasks"]], [TASK_UUID]
+        )
+        self.assertEqual(list(self.dispatcher.pending_tasks), [PEER_TASK_UUID])
+        self.assertEqual(
+            self.dispatcher.tasks.get(TASK_UUID).status,
+            TaskStatus.transferred_to_shard,
+        )
+
+    def test_give_nothing(self):
+        self.accept_peer_task()
+        self.shard_link.give_tasks(PEER_SHARD, 5)
+        self.assertFalse(self.shard_commands)
+        self.assertFalse(self.shard_link.transfer_deadlines)
+
+    def test_accept_repeated(self):
+        # повтор transfer_tasks, подтверждение первой команды потерялось
+        self.accept_peer_task()
+        self.accept_peer_task()
+        self.assertEqual(list(self.dispatcher.pending_tasks), [PEER_TASK_UUID])
+        self.assertEqual(self.dispatcher.metrics.counters["stolen"], 1)
+        self.assertEqual(
+            self.dispatcher.tasks.get(PEER_TASK_UUID).home_shard, PEER_SHARD
+        )
+
+
+class TransferredTasksTest(unittest.TestCase):
+    """ задача клиента передана другому шарду, своих вычислителей у шарда нет """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(
+            FakeNetClient, ("127.0.0.1", 5555), shard_index=0, shards=2
+        )
+        self.shard_link = self.dispatcher.shard_link
+        self.dispatcher.handle_message(
+            CLIENT, {"method": "add_task", "params": {"task_id": 1}}
+        )
+        self.dispatcher.net_client.commands.clear()
+        self.shard_link.give_tasks(PEER_SHARD, 1)
+        address, data, callback = self.shard_link.net_client.commands.popleft()
+        self.assertEqual((address, data["method"]), (PEER_SHARD, "transfer_tasks"))
+        # подтверждение передается в цикл событий диспетчера
+        self.dispatcher.transfer_tasks_callback(
+            [TASK_UUID], TransmissionStatus.success
+        )
+        self.assertEqual(self.status(), TaskStatus.transferred_to_shard)
+
+    def status(self):
+        return self.dispatcher.tasks.get(TASK_UUID).status
+
+    def test_shard_finished(self):
+        self.dispatcher.finish_transferred_tasks(
+            [{"task_uuid": TASK_UUID, "success": True}]
+        )
+        address, data, _ = self.dispatcher.net_client.commands.popleft()
+        self.assertEqual((address, data["method"]), (CLIENT, "notify_task"))
+        self.assertIsNone(self.dispatcher.tasks.get(TASK_UUID))
+
+    def test_transfer_timeout(self):
+        self.shard_link.expire_transferred(time.time())
+        self.assertEqual(self.status(), TaskStatus.transferred_to_shard)
+        self.shard_link.expire_transferred(
+            time.time() + self.shard_link.transfer_timeout
+        )
+        self.assertEqual(self.status(), TaskStatus.error_accepted_calculator)
+        self.assertEqual(list(self.dispatcher.pending_tasks), [TASK_UUID])
+
+    def test_late_shard_finished_ignored(self):
+        self.shard_link.expire_transferred(
+            time.time() + self.shard_link.transfer_timeout
+        )
+        self.dispatcher.finish_transferred_tasks(
+            [{"task_uuid": TASK_UUID, "success": True}]
+        )
+        self.assertEqual(self.status(), TaskStatus.error_accepted_calculator)
+        self.assertFalse(self.dispatcher.net_client.commands)
+
+    def test_transfer_timeout_after_placement_timeout(self):
+        self.dispatcher.tasks.get(TASK_UUID).created_tm -= 1000
+        self.shard_link.expire_transferred(
+            time.time() + self.shard_link.transfer_timeout
+        )
+        self.assertIsNone(self.dispatcher.tasks.get(TASK_UUID))
+        self.assertEqual(self.dispatcher.metrics.counters["expired"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,21 @@
 # coding: utf8
 from __future__ import print_function
 
+import atexit
 import json
+import logging
+import os
 from argparse import ArgumentParser
-from threading import Event, Thread
+from Queue import Empty, Full, Queue
+from threading import Thread
 
 try:
-    from typing import Any, Callable
+    from typing import Dict, List, Optional
 except ImportError:
     pass
 
+LOG_FORMAT = "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
+
 
 def argparse_worker():
     # type: () -> tuple
@@ -27,13 +33,99 @@ def read_config(filename):
         return json.load(config_file)
 
 
-def call_repeatedly(interval, func, *args):
-    # type: (float, Callable, *Any) -> Event
-    stopped = Event()
+class QueueHandler(logging.Handler):
+    """ обработчик логов, передающий записи в очередь потока QueueListener.
+        Сообщение форматируется в вызывающем потоке, запись в файл или на консоль
+        выполняется в потоке QueueListener. При переполнении очереди запись отбрасывается.
+        В дочернем процессе (после fork) записи передаются обработчикам напрямую """
+
+    def __init__(self, queue, handlers):
+        # type: (Queue, List[logging.Handler]) -> None
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.handlers = handlers
+        self.pid = os.getpid()
+        self.dropped = 0
+
+    def prepare(self, record):
+        # type: (logging.LogRecord) -> logging.LogRecord
+        """ аргументы и traceback могут измениться до обработки записи в другом потоке,
+            поэтому в очередь передается уже отформатированное сообщение """
+        record.message = self.format(record)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        # type: (logging.LogRecord) -> None
+        if os.getpid() != self.pid:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+        # noinspection PyBroadException
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Full:
+            self.dropped += 1
+        except:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """ поток, передающий записи из очереди обработчикам """
+
+    def __init__(self, queue, handlers):
+        # type: (Queue, List[logging.Handler]) -> None
+        self.queue = queue
+        self.handlers = handlers
+        self.thread = None  # type: Optional[Thread]
+
+    def start(self):
+        # type: () -> None
+        self.thread = Thread(target=self.__run, name="log-listener")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """ обработать оставшиеся записи и остановить поток """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def __run(self):
+        # type: () -> None
+        while True:
+            try:
+                record = self.queue.get(timeout=1.0)
+            except Empty:
+                continue
+            if record is None:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
 
-    def loop():
-        while not stopped.wait(interval):
-            func(*args)
 
-    Thread(target=loop).start()
-    return stopped
+def setup_logging(level="INFO", filename=None, queue_size=0, loggers=None):
+    # type: (str, Optional[str], int, Optional[Dict[str, str]]) -> None
+    """ настроить корневой логгер.
+        queue_size > 0 - запись логов в отдельном потоке через очередь такого размера,
+        loggers - уровни отдельных логгеров, например {"net_protocol": "WARNING"} """
+    handler = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if queue_size:
+        listener = QueueListener(Queue(queue_size), [handler])
+        listener.start()
+        atexit.register(listener.stop)
+        handler = QueueHandler(listener.queue, listener.handlers)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, logger_level in (loggers or {}).iteritems():
+        logging.getLogger(name).setLevel(logger_level.upper())